@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr, constr
 from typing import Optional
 import re
@@ -9,11 +10,13 @@ from PIL import Image
 import io
 import base64
 import logging
-from app.db.database import SessionLocal
+from app.db.database import get_db
 from app.models.models import User
+from app.auth.cpu_pool import cpu_pool
+from app.logs.logs import LOG_LEVEL
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 # Password hashing
@@ -32,13 +35,6 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def validate_password(password: str) -> bool:
     pattern = r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)[a-zA-Z\d]{8,}$"
     return bool(re.match(pattern, password))
@@ -55,7 +51,7 @@ def resize_avatar(avatar_data: str, max_size=(100, 100)) -> bytes:
     img.save(output, format='PNG')
     return output.getvalue()
 
-async def register(user: UserRegister, db: Session = Depends(get_db)):
+async def register(user: UserRegister, db: AsyncSession = Depends(get_db)):
     try:
         if not user.email.endswith("@gmail.com"):
             raise HTTPException(status_code=400, detail="Only Gmail addresses are allowed")
@@ -64,19 +60,21 @@ async def register(user: UserRegister, db: Session = Depends(get_db)):
                 status_code=400,
                 detail="Password must be at least 8 characters long and contain at least one uppercase letter, one lowercase letter, and one number"
             )
-        existing_user = db.query(User).filter(User.email == user.email).first()
+        existing_user = (await db.scalars(select(User).where(User.email == user.email))).first()
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         avatar_data = None
         if user.avatar:
             try:
-                avatar_data = resize_avatar(user.avatar, max_size=(100, 100))
+                avatar_data = await cpu_pool.run(resize_avatar, user.avatar, max_size=(100, 100))
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.error(f"Error decoding avatar: {str(e)}")
                 raise HTTPException(status_code=400, detail="Invalid avatar data")
 
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = await cpu_pool.run(pwd_context.hash, user.password)
         db_user = User(
             first_name=user.first_name,
             last_name=user.last_name,
@@ -85,25 +83,29 @@ async def register(user: UserRegister, db: Session = Depends(get_db)):
             avatar=avatar_data
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         logger.debug(f"User registered: {user.email}")
         return {"message": "User registered successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error registering user: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error registering user: {str(e)}")
 
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.email == form_data.username).first()
+        user = (await db.scalars(select(User).where(User.email == form_data.username))).first()
         if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        if not pwd_context.verify(form_data.password, user.hashed_password):
+        if not await cpu_pool.run(pwd_context.verify, form_data.password, user.hashed_password):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         logger.debug(f"User logged in: {user.email}")
         return {"message": "Login successful", "user": {"email": user.email, "first_name": user.first_name, "last_name": user.last_name}}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error logging in user: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error logging in: {str(e)}")
\ No newline at end of file
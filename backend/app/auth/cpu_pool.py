@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from functools import partial
+import asyncio
+import os
+import threading
+import time
+import logging
+from app.logs.logs import LOG_LEVEL
+from app.metrics.metrics import CPU_POOL_QUEUED
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Password hashing and avatar processing run here, apart from the default threadpool used by chat and file I/O
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+CPU_MAX_QUEUE = int(os.getenv("CPU_MAX_QUEUE", "64"))
+CPU_RETRY_AFTER = int(os.getenv("CPU_RETRY_AFTER", "1"))
+
+class BoundedCPUPool:
+    """
+    A fixed-size thread pool for CPU-heavy request work (bcrypt and Pillow both release the GIL).
+    At most max_queue tasks may wait for a worker; beyond that callers get a 503 straight away
+    instead of piling up behind a sign-in storm.
+    """
+
+    def __init__(self, max_workers: int = CPU_WORKERS, max_queue: int = CPU_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cpu")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queued = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                logger.warning(f"CPU pool saturated ({self.queued} queued), rejecting {getattr(fn, '__name__', fn)}")
+                raise HTTPException(status_code=503, detail="Server is busy, please retry",
+                                    headers={"Retry-After": str(CPU_RETRY_AFTER)})
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            CPU_POOL_QUEUED.inc()
+        future = self._executor.submit(partial(self._call, time.perf_counter(), fn, *args, **kwargs))
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # A task cancelled while still queued never reaches _call
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+                CPU_POOL_QUEUED.dec()
+
+    def _call(self, submitted: float, fn, *args, **kwargs):
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            CPU_POOL_QUEUED.dec()
+            self.running += 1
+            self.wait_seconds += started - submitted
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_seconds += time.perf_counter() - started
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "mean_wait_ms": self.wait_seconds / self.completed * 1000 if self.completed else 0.0,
+                "mean_run_ms": self.run_seconds / self.completed * 1000 if self.completed else 0.0,
+            }
+
+cpu_pool = BoundedCPUPool()
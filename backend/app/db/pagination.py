@@ -0,0 +1,32 @@
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional, Sequence
+import os
+
+# Listing endpoints return at most MAX_PAGE_SIZE rows; the next cursor is sent in the X-Next-Cursor header
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """
+    Turn a comma-separated ?fields= value into a list of allowed field names, defaulting to all of them.
+    """
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return requested
+
+def page_response(items: List[dict], cursors: List[int], limit: int) -> ORJSONResponse:
+    """
+    Build a page from up to limit + 1 rows. cursors holds each row's id; when the extra row is
+    present, the id of the last returned row is the cursor for the next page.
+    """
+    headers = {}
+    if len(items) > limit:
+        items = items[:limit]
+        headers[NEXT_CURSOR_HEADER] = str(cursors[limit - 1])
+    return ORJSONResponse(content=items, headers=headers)
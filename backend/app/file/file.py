@@ -1,123 +1,349 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import hashlib
 import os
+import re
+import tempfile
+import uuid
+import zipfile
+import zlib
 import logging
-from app.db.database import SessionLocal
+from app.db.database import AsyncSessionLocal
+from app.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page_response, parse_fields
 from app.models.models import Document
-from app.rag.rag import process_document
+from app.rag.rag_jobs import submit_ingest_job, get_job, list_jobs, request_remove_document, request_reset_vector_store
+from app.rag.rag_session import active_documents
+from app.logs.logs import LOG_LEVEL
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
+# Uploads are streamed to disk in chunks; the size limit is enforced while streaming
+UPLOAD_DIR = "uploads"
+# Files are stored as <random hex>-<original name>
+UPLOAD_PREFIX = re.compile(r"^[0-9a-f]{32}-")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(200 * 1024 * 1024)))
+
+# Bulk uploads: documents accepted per request, counting the .txt/.pdf members of zip archives, and
+# the bytes they may take on disk in total once extracted
+MAX_BULK_FILES = int(os.getenv("MAX_BULK_FILES", "500"))
+MAX_BULK_SIZE = int(os.getenv("MAX_BULK_SIZE", str(1024 * 1024 * 1024)))
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+# Fields selectable on GET /files
+FILE_FIELDS = ("id", "filename", "filepath", "is_active")
+
+def is_supported(filename: str) -> bool:
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+def upload_path(filename: str) -> str:
+    """
+    A new path in UPLOAD_DIR for an uploaded file. The random prefix keeps uploads with the same
+    name from overwriting files that existing documents still point to.
+    """
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}-{os.path.basename(filename)}")
+
+def upload_filename(file_path: str) -> str:
+    """
+    The original name of an uploaded file, without the prefix upload_path added.
+    """
+    return UPLOAD_PREFIX.sub("", os.path.basename(file_path), count=1)
+
+def _check_size(size: int, budget: Optional[int]):
+    if size > MAX_UPLOAD_SIZE:
+        raise ValueError(f"exceeds the maximum upload size of {MAX_UPLOAD_SIZE} bytes")
+    if budget is not None and size > budget:
+        raise ValueError(f"exceeds the total bulk upload size of {MAX_BULK_SIZE} bytes")
+
+async def save_upload(file: UploadFile, file_path: str, budget: Optional[int] = None) -> Tuple[int, str]:
+    """
+    Stream an upload to a temp file in UPLOAD_DIR in fixed-size chunks, hashing as it goes, then
+    atomically rename it to file_path. budget caps the size below MAX_UPLOAD_SIZE for bulk uploads.
+    Returns (size in bytes, sha256 hex digest).
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=UPLOAD_DIR)
+    sha256 = hashlib.sha256()
+    size = 0
     try:
-        yield db
-    finally:
-        db.close()
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                try:
+                    _check_size(size, budget)
+                except ValueError as e:
+                    raise HTTPException(status_code=413, detail=f"File {e}")
+                sha256.update(chunk)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, sha256.hexdigest()
 
 async def upload_file(file: UploadFile = File(...)):
-    db: Session = SessionLocal()
+    db: AsyncSession = AsyncSessionLocal()
     try:
         if not file.filename:
             logger.error("No file provided")
             raise HTTPException(status_code=400, detail="No file provided")
+        # Rejected before anything is written, so unsupported files leave no row or file behind
+        if not is_supported(file.filename):
+            raise HTTPException(status_code=400, detail="Only .txt and .pdf files are supported")
         
-        content = await file.read()
-        file_path = f"uploads/{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
-        
+        file_path = upload_path(file.filename)
         logger.debug(f"Saving file to {file_path}")
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        if not os.path.exists(file_path):
-            logger.error(f"File not saved at {file_path}")
-            raise HTTPException(status_code=500, detail="Failed to save file")
+        size, sha256 = await save_upload(file, file_path)
+        logger.debug(f"Saved {size} bytes to {file_path}, sha256={sha256}")
         
         db_document = Document(filename=file.filename, filepath=file_path, is_active=False)
         db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
+        await db.commit()
+        await db.refresh(db_document)
         logger.debug(f"Created document: id={db_document.id}, filename={db_document.filename}")
+        active_documents.register(db_document.id, db_document.filename)
         
-        try:
-            process_document(file_path, file.filename, db, db_document.id)
-            logger.debug(f"Successfully processed document: {file.filename}")
-        except Exception as e:
-            logger.error(f"Failed to process document {file.filename}: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to process document: {str(e)}")
+        # Parsing and embedding run on the ingest pool; the document becomes queryable once the job is done
+        job = submit_ingest_job(file_path, file.filename, db_document.id)
         
-        return {"message": "File uploaded and processed successfully"}
+        return {"message": "File uploaded, processing started", "job_id": job["job_id"], "file_id": db_document.id, "size": size, "sha256": sha256}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading file {file.filename}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
     finally:
-        db.close()
+        await db.close()
 
-async def get_all_files():
-    db: Session = SessionLocal()
+def _remove_saved(entries: List[dict]):
+    for entry in entries:
+        if os.path.exists(entry["file_path"]):
+            os.remove(entry["file_path"])
+
+def extract_zip(zip_path: str, limit: int, budget: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Extract the .txt/.pdf members of a zip archive into UPLOAD_DIR under unique names, at most limit
+    of them and budget bytes in total. Sizes are enforced while copying instead of trusting the
+    archive header. Returns (saved files, skipped members with the reason). On an OSError (e.g. a
+    full disk) the members saved so far are removed before it is raised.
+    """
+    saved, skipped = [], []
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith("."):
+                continue
+            if not is_supported(name):
+                skipped.append({"filename": info.filename, "reason": "unsupported file type"})
+                continue
+            if len(saved) >= limit:
+                skipped.append({"filename": info.filename, "reason": f"more than {MAX_BULK_FILES} files in upload"})
+                continue
+            file_path = upload_path(name)
+            fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=UPLOAD_DIR)
+            sha256 = hashlib.sha256()
+            size = 0
+            try:
+                with os.fdopen(fd, "wb") as f, archive.open(info) as member:
+                    while True:
+                        chunk = member.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        _check_size(size, budget)
+                        sha256.update(chunk)
+                        f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, file_path)
+            except (ValueError, zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError) as e:
+                # Oversized, corrupt, encrypted or unsupported-compression members are skipped
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                skipped.append({"filename": info.filename, "reason": str(e)})
+                continue
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                _remove_saved(saved)
+                raise
+            saved.append({"filename": name, "file_path": file_path, "size": size, "sha256": sha256.hexdigest()})
+            budget -= size
+    return saved, skipped
+
+async def upload_files(files: List[UploadFile] = File(...)):
+    """
+    Upload several .txt/.pdf files, or zip archives of them, in one request. Each document gets its
+    own row and ingest job; unsupported or oversized files, and files past MAX_BULK_SIZE bytes in
+    total, are reported under "skipped" instead of failing the whole upload.
+    """
+    saved, skipped = [], []
+    for file in files:
+        name = os.path.basename(file.filename or "")
+        budget = MAX_BULK_SIZE - sum(entry["size"] for entry in saved)
+        try:
+            if name.lower().endswith(".zip"):
+                # The archive itself is removed after extraction; only its members count towards the total
+                zip_path = os.path.join(UPLOAD_DIR, f".bulk-{uuid.uuid4().hex}.zip")
+                await save_upload(file, zip_path)
+                try:
+                    members, rejected = await run_in_threadpool(extract_zip, zip_path, MAX_BULK_FILES - len(saved), budget)
+                finally:
+                    os.remove(zip_path)
+                saved.extend(members)
+                skipped.extend(rejected)
+            elif not is_supported(name):
+                skipped.append({"filename": file.filename, "reason": "unsupported file type"})
+            elif len(saved) >= MAX_BULK_FILES:
+                skipped.append({"filename": file.filename, "reason": f"more than {MAX_BULK_FILES} files in upload"})
+            else:
+                file_path = upload_path(name)
+                size, sha256 = await save_upload(file, file_path, budget)
+                saved.append({"filename": name, "file_path": file_path, "size": size, "sha256": sha256})
+        except HTTPException as e:
+            skipped.append({"filename": file.filename, "reason": e.detail})
+        except zipfile.BadZipFile as e:
+            skipped.append({"filename": file.filename, "reason": str(e)})
+        except OSError as e:
+            # Out of disk space or similar: files this request already saved would have no document
+            _remove_saved(saved)
+            logger.error(f"Error saving bulk upload: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error uploading files: {str(e)}")
+    
+    if not saved:
+        raise HTTPException(status_code=400, detail={"message": "No .txt or .pdf files in upload", "skipped": skipped})
+    
+    db: AsyncSession = AsyncSessionLocal()
     try:
-        files = db.query(Document).all()
-        return [{"id": file.id, "filename": file.filename, "filepath": file.filepath, "is_active": file.is_active} for file in files]
+        documents = [Document(filename=entry["filename"], filepath=entry["file_path"], is_active=False) for entry in saved]
+        db.add_all(documents)
+        # One commit for the whole upload; flushing assigns the ids
+        await db.flush()
+        file_ids = [document.id for document in documents]
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        _remove_saved(saved)
+        logger.error(f"Error registering bulk upload: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error uploading files: {str(e)}")
     finally:
-        db.close()
+        await db.close()
+    
+    results = []
+    for entry, file_id in zip(saved, file_ids):
+        active_documents.register(file_id, entry["filename"])
+        job = submit_ingest_job(entry["file_path"], entry["filename"], file_id)
+        results.append({"filename": entry["filename"], "file_id": file_id, "job_id": job["job_id"], "size": entry["size"], "sha256": entry["sha256"]})
+    logger.debug("Bulk upload queued %d documents, skipped %d", len(results), len(skipped))
+    return {"message": f"{len(results)} files uploaded, processing started", "files": results, "skipped": skipped}
+
+async def get_upload_jobs():
+    return list_jobs()
 
-async def get_file(id: int):
-    db: Session = SessionLocal()
+async def get_upload_job(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def get_all_files(session_id: Optional[str] = None, cursor: Optional[int] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None):
+    """
+    List documents ordered by id, limit at a time. Pass the X-Next-Cursor response header back as
+    ?cursor= for the next page, and ?fields=id,filename to project columns.
+    """
+    selected = parse_fields(fields, FILE_FIELDS)
+    db: AsyncSession = AsyncSessionLocal()
     try:
-        file = db.query(Document).filter(Document.id == id).first()
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
-        return {"id": file.id, "filename": file.filename, "filepath": file.filepath, "is_active": file.is_active}
+        # is_active comes from the shared selection, so it is never read from the table
+        columns = [Document.id] + [getattr(Document, field) for field in selected if field not in ("id", "is_active")]
+        query = select(*columns).order_by(Document.id).limit(limit + 1)
+        if cursor is not None:
+            query = query.where(Document.id > cursor)
+        rows = (await db.execute(query)).all()
+        active_id = await run_in_threadpool(active_documents.get, session_id)
+        files = []
+        for row in rows:
+            file = {field: getattr(row, field) for field in selected if field != "is_active"}
+            if "is_active" in selected:
+                file["is_active"] = row.id == active_id
+            files.append(file)
+        return page_response(files, [row.id for row in rows], limit)
     finally:
-        db.close()
+        await db.close()
 
-async def set_active_file(id: int):
-    db: Session = SessionLocal()
+async def get_file(id: int, session_id: Optional[str] = None):
+    db: AsyncSession = AsyncSessionLocal()
     try:
-        db.query(Document).update({"is_active": False})
-        file = db.query(Document).filter(Document.id == id).first()
+        file = await db.get(Document, id)
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
-        file.is_active = True
-        db.commit()
-        db.refresh(file)
-        return {'message': f"File {file.filename} set as active"}
+        active_id = await run_in_threadpool(active_documents.get, session_id)
+        return {"id": file.id, "filename": file.filename, "filepath": file.filepath, "is_active": file.id == active_id}
     finally:
-        db.close()
+        await db.close()
+
+async def set_active_file(id: int, session_id: Optional[str] = None):
+    """
+    Select the active document for one chat session, or the default for all sessions when no
+    session_id is given. The default is written to the database in the background.
+    """
+    if not await active_documents.resolve_id(id):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        await run_in_threadpool(active_documents.select, id, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {'message': f"File {active_documents.filenames.get(id, id)} set as active"}
 
 async def delete_all_files():
-    db: Session = SessionLocal()
+    db: AsyncSession = AsyncSessionLocal()
     try:
-        db.query(Document).delete()
-        db.commit()
+        await db.execute(delete(Document))
+        await db.commit()
+        await run_in_threadpool(active_documents.clear)
+        await run_in_threadpool(request_reset_vector_store)
         
-        upload_dir = "uploads"
+        upload_dir = UPLOAD_DIR
         if os.path.exists(upload_dir):
             for file in os.listdir(upload_dir):
+                # Temp files (.upload-*, .bulk-*) belong to uploads still in progress
+                if file.startswith("."):
+                    continue
                 file_path = os.path.join(upload_dir, file)
                 if os.path.isfile(file_path):
                     os.remove(file_path)
         
         return {"message": "All files deleted successfully"}
     finally:
-        db.close()
+        await db.close()
 
 async def delete_file(id: int):
-    db: Session = SessionLocal()
+    db: AsyncSession = AsyncSessionLocal()
     try:
-        file = db.query(Document).filter(Document.id == id).first()
+        file = await db.get(Document, id)
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
         
-        db.delete(file)
-        db.commit()
+        await db.delete(file)
+        await db.commit()
+        await run_in_threadpool(active_documents.forget, id)
+        await run_in_threadpool(request_remove_document, id)
         
         if os.path.exists(file.filepath):
             os.remove(file.filepath)
         
         return {"message": f"File {file.filename} deleted successfully"}
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
\ No newline at end of file
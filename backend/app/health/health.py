@@ -0,0 +1,70 @@
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import text
+from typing import Dict
+import asyncio
+import os
+import time
+import logging
+from app.db.database import engine
+from app.rag import rag
+from app.rag.rag_model import WARMUP_ENABLED
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+DB_CHECK_TIMEOUT = float(os.getenv("DB_CHECK_TIMEOUT", "2"))
+
+# Seconds spent in each startup stage, filled in by app.main as stages complete
+startup_timings: Dict[str, float] = {}
+database_ready = False
+
+def record_startup_timing(stage: str, seconds: float):
+    startup_timings[stage] = round(seconds, 4)
+    logger.debug(f"Startup stage {stage} took {seconds:.2f}s")
+
+def get_startup_report() -> dict:
+    timings = dict(startup_timings)
+    timings["index_load"] = round(rag.index_load_seconds, 4)
+    if rag.embeddings.load_seconds is not None:
+        timings["model_load"] = round(rag.embeddings.load_seconds, 4)
+    if rag.embeddings.warmup_seconds is not None:
+        timings["model_warmup"] = round(rag.embeddings.warmup_seconds, 4)
+    return timings
+
+async def check_database() -> bool:
+    try:
+        async with engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), DB_CHECK_TIMEOUT)
+        return True
+    except Exception as e:
+        logger.warning(f"Database check failed: {str(e)}")
+        return False
+
+async def healthz():
+    """
+    Liveness: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+async def readyz():
+    """
+    Readiness: the embedding model is loaded, the index snapshot is restored and the database is
+    reachable with tables created. Returns 503 until all three hold. Without RAG_WARMUP nothing loads
+    the model before the first request does, so the model check is skipped.
+    """
+    started = time.perf_counter()
+    checks = {
+        "model": rag.embeddings.loaded or not WARMUP_ENABLED,
+        "index": rag.index_load_error is None,
+        "database": database_ready and await check_database(),
+    }
+    ready = all(checks.values())
+    return ORJSONResponse(status_code=200 if ready else 503, content={
+        "ready": ready,
+        "checks": checks,
+        "model": rag.embeddings.get_stats(),
+        "startup_timings": get_startup_report(),
+        "check_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
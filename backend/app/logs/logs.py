@@ -0,0 +1,27 @@
+import os
+import random
+import logging
+
+# Root log level for every module (DEBUG, INFO, WARNING, ...). LOG_LEVELS overrides single loggers,
+# e.g. LOG_LEVELS="app.rag.rag=DEBUG,sqlalchemy.engine=WARNING".
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Share of per-query / per-chunk debug records that are emitted when DEBUG is enabled
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+def configure_logging():
+    """
+    Apply the per-logger overrides from LOG_LEVELS. The root level is set by LOG_LEVEL at import.
+    """
+    for entry in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        name, _, level = entry.partition("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+def log_sampled(target: logging.Logger, level: int = logging.DEBUG) -> bool:
+    """
+    Guard for hot-path log records: True only when level is enabled for target and the record falls
+    into the LOG_SAMPLE_RATE sample, so disabled or dropped records cost no formatting.
+    """
+    if not target.isEnabledFor(level):
+        return False
+    return LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
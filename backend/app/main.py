@@ -1,13 +1,43 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.database import engine
 from app.models.models import Base
 from app.auth.auth import register, login
-from app.user.user import get_all_users, get_user_by_email, update_user
-from app.file.file import upload_file, get_all_files, get_file, set_active_file, delete_all_files, delete_file
+from app.user.user import get_all_users, get_user_by_email, get_user_avatar, update_user
+from app.file.file import upload_file, upload_files, get_upload_jobs, get_upload_job, get_all_files, get_file, set_active_file, delete_all_files, delete_file
 from app.rag.rag_chat import websocket_endpoint
+from app.rag.rag_stats import get_rag_stats, get_metrics
+from app.rag.rag_session import active_documents
+from app.db.pagination import NEXT_CURSOR_HEADER
+from app.health import health
+from app.rag.rag import embeddings
+from app.rag.rag_model import WARMUP_ENABLED
+from app.rag.rag_jobs import start_index_sync
+from app.logs.logs import LOG_LEVEL, configure_logging
+from app.metrics.metrics import mark_process_dead
+import asyncio
+import os
+import logging
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+configure_logging()
+
+# Seconds between attempts to initialise the database while it is unreachable
+DB_INIT_RETRY = float(os.getenv("DB_INIT_RETRY", "5"))
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Compress JSON responses above GZIP_MIN_SIZE bytes
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
 
 # CORS configuration
 origins = ["http://localhost:5173", "http://localhost:80"]
@@ -17,10 +47,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+health.record_startup_timing("import", time.perf_counter() - _import_started)
+
+async def init_database():
+    """
+    Create tables and load the active-document state, retrying until the database is reachable.
+    /readyz reports not ready until this has succeeded.
+    """
+    while True:
+        try:
+            started = time.perf_counter()
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            health.record_startup_timing("create_tables", time.perf_counter() - started)
+            started = time.perf_counter()
+            # Load document names and seed the shared active-document selection once up front
+            await run_in_threadpool(active_documents.load)
+            health.record_startup_timing("load_active_documents", time.perf_counter() - started)
+            health.database_ready = True
+            return
+        except Exception as e:
+            logger.error(f"Database initialisation failed, retrying in {DB_INIT_RETRY}s: {str(e)}")
+            await asyncio.sleep(DB_INIT_RETRY)
+
+@app.on_event("startup")
+async def startup():
+    # Neither step blocks startup: the app serves /healthz immediately and /readyz once both are done
+    app.state.init_database = asyncio.create_task(init_database())
+    # Decide the index role; the writer drains the spool, readers follow published snapshots
+    start_index_sync()
+    if WARMUP_ENABLED:
+        app.state.warm_up = asyncio.get_running_loop().run_in_executor(None, embeddings.warm_up)
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Live gauges (connections, queues) of a stopped worker must not count towards the aggregate
+    mark_process_dead()
+
+# Health endpoints
+app.get("/healthz")(health.healthz)
+app.get("/readyz")(health.readyz)
 
 # Authentication endpoints
 app.post("/register")(register)
@@ -29,15 +98,25 @@ app.post("/login")(login)
 # User endpoints
 app.get("/users")(get_all_users)
 app.get("/user/{email}")(get_user_by_email)
+app.get("/user/{email}/avatar")(get_user_avatar)
 app.put("/user/{email}")(update_user)
 
 # File endpoints
-app.post("/upload")(upload_file)
+app.post("/upload", status_code=202)(upload_file)
+app.post("/upload/bulk", status_code=202)(upload_files)
+app.get("/upload/jobs")(get_upload_jobs)
+app.get("/upload/jobs/{job_id}")(get_upload_job)
 app.get("/files")(get_all_files)
 app.get("/file/{id}")(get_file)
 app.post("/file/{id}/set-active")(set_active_file)
 app.delete("/files")(delete_all_files)
 app.delete("/file/{id}")(delete_file)
 
+# RAG stats endpoint
+app.get("/rag/stats")(get_rag_stats)
+
+# Prometheus metrics endpoint
+app.get("/metrics")(get_metrics)
+
 # WebSocket endpoint
 app.websocket("/ws/chat")(websocket_endpoint)
\ No newline at end of file
@@ -0,0 +1,121 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List
+import os
+import time
+import logging
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# With several worker processes every process writes its samples to files in this directory and
+# /metrics aggregates all of them, so any worker can answer a scrape. It must be emptied before the
+# workers start (the Docker image does this); leave it unset for a single process.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, from sub-millisecond index lookups to multi-minute PDF ingests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Run at scrape time to refresh gauges whose values are cheaper to read on demand than to track on
+# every change. Only the process answering the scrape runs them, so they may only set gauges whose
+# multiprocess mode keeps the most recent value.
+_collectors: List[Callable[[], None]] = []
+
+class StageTimings:
+    """
+    Wall time per stage of one operation, observed into a histogram when the operation completes.
+    Lets stages that interleave through generators (extract -> clean -> split) be timed separately.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def time(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - started
+
+    def iterate(self, stage: str, iterator: Iterable) -> Iterator:
+        """
+        Yield from iterator, charging the time spent producing each item to stage.
+        """
+        iterator = iter(iterator)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds[stage] += time.perf_counter() - started
+                return
+            self.seconds[stage] += time.perf_counter() - started
+            yield item
+
+    def observe(self, histogram: Histogram):
+        for stage, seconds in self.seconds.items():
+            histogram.labels(stage=stage).observe(seconds)
+
+# Query path: retrieval stages, generation and end-to-end latency
+QUERY_STAGE_SECONDS = Histogram("rag_query_stage_seconds", "Time spent in each stage of answering a query", ["stage"], buckets=LATENCY_BUCKETS)
+QUERY_FIRST_TOKEN_SECONDS = Histogram("rag_query_first_token_seconds", "Time from receiving a chat message to its first streamed token", buckets=LATENCY_BUCKETS)
+QUERIES_TOTAL = Counter("rag_queries_total", "Queries answered, by retrieval cache result", ["cache"])
+
+# Ingest path
+INGEST_STAGE_SECONDS = Histogram("rag_ingest_stage_seconds", "Time spent in each stage of ingesting a document", ["stage"], buckets=LATENCY_BUCKETS)
+INGEST_DOCUMENTS_TOTAL = Counter("rag_ingest_documents_total", "Documents ingested, by outcome", ["status"])
+INGEST_CHUNKS_TOTAL = Counter("rag_ingest_chunks_total", "Chunks embedded and indexed")
+
+# WebSocket chat, summed over the live worker processes
+WS_CONNECTIONS = Gauge("rag_ws_connections", "Open chat WebSocket connections", multiprocess_mode="livesum")
+WS_INFLIGHT_QUERIES = Gauge("rag_ws_inflight_queries", "Chat messages being answered", multiprocess_mode="livesum")
+
+# Database
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "Database statement execution time", ["engine", "operation"], buckets=LATENCY_BUCKETS)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections currently checked out", ["engine"], multiprocess_mode="livesum")
+
+# Worker pool queues, summed over the live worker processes
+QUERY_SCHEDULER_QUEUED = Gauge("rag_query_scheduler_queued", "Queries waiting for a query worker", multiprocess_mode="livesum")
+CPU_POOL_QUEUED = Gauge("cpu_pool_queued", "Password hashing and avatar resize tasks waiting for a CPU worker", multiprocess_mode="livesum")
+
+# Index state, refreshed at scrape time. Every process serves the same published snapshot, so the
+# value of the process answering the scrape stands for all of them.
+INDEX_VECTORS = Gauge("rag_index_vectors", "Vectors in the FAISS index, by state", ["state"], multiprocess_mode="livemostrecent")
+INDEX_FILES = Gauge("rag_index_files", "Documents with queryable chunks", multiprocess_mode="livemostrecent")
+# Per process: readers lag the writer until they switch to its latest snapshot
+INDEX_VERSION = Gauge("rag_index_version", "In-memory index version of each process", multiprocess_mode="liveall")
+
+def add_collector(collector: Callable[[], None]):
+    _collectors.append(collector)
+
+def render_metrics() -> bytes:
+    """
+    The Prometheus text exposition format, aggregated over every worker process in multiprocess mode.
+    """
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+def mark_process_dead():
+    """
+    Drop this process's live gauges from the aggregate when it exits.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
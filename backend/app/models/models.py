@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Boolean,LargeBinary
+from sqlalchemy.orm import deferred
 from app.db.database import Base
 
 class Document(Base):
@@ -16,4 +17,5 @@ class User(Base):
     last_name = Column(String(50))
     email = Column(String(255), unique=True, index=True)
     hashed_password = Column(String(255))
-    avatar = Column(LargeBinary, nullable=True)  # For binary image data
+    # Binary image data; deferred so listing users never loads it
+    avatar = deferred(Column(LargeBinary, nullable=True))
@@ -1,21 +1,150 @@
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from sqlalchemy.orm import Session
 import os
 import pypdf
 import re
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from bisect import bisect_right
+import multiprocessing
+import numpy as np
+import threading
+import time
 import logging
+from app.rag.rag_embed_cache import EmbeddingCache, CachedEmbeddings, EMBED_CACHE_DIR, EMBED_CACHE_ENABLED
+from app.rag.rag_cache import normalize_query, query_embedding_cache, retrieval_cache
+from app.rag.rag_store import (
+    load_snapshot, read_manifest, save_snapshot, ensure_writable, create_store, add_vectors, remove_vectors,
+    dead_vector_count, compact_index, promote_index, search_file, search_file_sparse, get_scored_documents,
+)
+from app.rag.rag_bm25 import is_exact_term_query, tokenize
+from app.rag.rag_generator import generator
+from app.rag.rag_model import EMBEDDING_MODEL, LazyEmbeddings
+from app.rag.rag_chunker import Chunk, create_chunker
+from app.rag.rag_pdf import extract_pages
+from app.rag.rag_cluster import is_writer
+from app.rag.rag_lock import ReadWriteLock
+from app.rag.rag_index import INDEX_TYPE, VECTOR_PRECISION, index_type_of, is_target_index, precision_of, promotion_threshold
+from app.logs.logs import LOG_LEVEL, log_sampled
+from app.metrics.metrics import (
+    INDEX_VERSION, INGEST_CHUNKS_TOTAL, INGEST_DOCUMENTS_TOTAL, INGEST_STAGE_SECONDS, QUERIES_TOTAL, QUERY_STAGE_SECONDS,
+    StageTimings,
+)
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-vector_store = None
+# Initialize embeddings; the model itself is loaded on first use or by the startup warm-up
+embeddings = LazyEmbeddings(EMBEDDING_MODEL)
+
+# Chunk embeddings are cached on disk by content hash, so re-uploaded documents only embed changed chunks.
+# Only the index writer opens the cache, on its first ingest (see open_embedding_cache)
+embedding_cache = None
+document_embeddings = embeddings
+_embedding_cache_lock = threading.Lock()
+
+# Chunking is configured in rag_chunker; the chunker is created with the model on first ingest
+_chunker = None
+_chunker_lock = threading.Lock()
+
+# Ingest batching
+TXT_BLOCK_SIZE = 64 * 1024
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+
+# Retrieval: chunks returned per query, candidates taken from each retriever before fusion,
+# the reciprocal-rank fusion constant and the largest L2 distance a dense-only hit may have
+RETRIEVAL_K = 3
+FUSION_CANDIDATES = int(os.getenv("RAG_FUSION_CANDIDATES", "10"))
+RRF_K = 60
+DENSE_MAX_DISTANCE = float(os.getenv("RAG_DENSE_MAX_DISTANCE", "1.2"))
+
+# PDF text extraction is CPU-bound pure Python, so page ranges are spread over a process pool
+PDF_WORKERS = int(os.getenv("RAG_PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("RAG_PDF_PAGES_PER_TASK", "16"))
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+# write_lock serializes ingest writers (including snapshotting); index_lock guards the
+# in-memory index: searches share its read side, changes take its write side
+write_lock = threading.Lock()
+index_lock = ReadWriteLock()
+
+# Generations of the store (bumped by resets) and of each file (bumped by removals), changed under
+# write_lock. An ingest records both when it starts and publishes nothing if either has moved on.
+store_generation = 0
+file_generations: Dict[int, int] = {}
+
+class IngestCancelled(Exception):
+    """
+    The document was removed, or the store reset, while it was being ingested.
+    """
+
+def ingest_generation(file_id: int) -> Tuple[int, int]:
+    return store_generation, file_generations.get(file_id, 0)
+
+# Deleted vectors are compacted out of the index in the background once they make up
+# COMPACT_DEAD_RATIO of it (and number at least COMPACT_MIN_DEAD)
+COMPACT_DEAD_RATIO = float(os.getenv("RAG_COMPACT_DEAD_RATIO", "0.2"))
+COMPACT_MIN_DEAD = int(os.getenv("RAG_COMPACT_MIN_DEAD", "1000"))
+_maintenance_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-maintenance")
+_compaction_pending = False
+_promotion_pending = False
+
+# Restore the last persisted snapshot so documents survive restarts. file_vector_ids holds the
+# sorted FAISS ids of each published file's chunks, used to scope searches to the active file;
+# it is persisted with every snapshot, so chunks of unfinished ingests never become queryable.
+index_load_error = None
+_index_load_started = time.perf_counter()
+try:
+    vector_store, file_vector_ids = load_snapshot()
+except Exception as e:
+    logger.error(f"Failed to load vector store snapshot: {str(e)}", exc_info=True)
+    index_load_error = str(e)
+    vector_store, file_vector_ids = None, {}
+index_load_seconds = time.perf_counter() - _index_load_started
+
+# Bumped whenever vectors are added or a file is removed; part of the retrieval cache key
+index_version = 0
+version_lock = threading.Lock()
+
+def bump_index_version():
+    """
+    Invalidate cached retrieval results after the index contents change.
+    """
+    global index_version
+    with version_lock:
+        index_version += 1
+        retrieval_cache.clear()
+        INDEX_VERSION.set(index_version)
+
+def reload_snapshot() -> bool:
+    """
+    Swap in the latest published snapshot if it is newer than the one being served. Used by reader
+    processes; the new snapshot is memory-mapped, so its pages are shared with the other workers.
+    Queries already running keep the store they started with.
+    """
+    global vector_store, file_vector_ids
+    manifest = read_manifest()
+    current = getattr(vector_store, "snapshot_version", 0) if vector_store is not None else 0
+    if manifest is None or manifest["version"] <= current:
+        return False
+    store, ids_by_file = load_snapshot()
+    with index_lock.write():
+        vector_store, file_vector_ids = store, ids_by_file
+        bump_index_version()
+    logger.debug(f"Switched to snapshot version {manifest['version']}")
+    return True
+
+def hide_document(file_id: int):
+    """
+    Stop serving a file's chunks in this process right away. Readers call this when they hand a
+    deletion to the writer, before the snapshot without the file is published.
+    """
+    with index_lock.write():
+        if file_vector_ids.pop(file_id, None) is not None:
+            bump_index_version()
 
 def clean_text(text: str) -> str:
     """
@@ -25,119 +154,565 @@ def clean_text(text: str) -> str:
     text = re.sub(r'[^\x20-\x7E]', '', text)
     return text.strip()
 
-def process_document(file_path: str, filename: str, db: Session, file_id: int = None):
+def _no_progress(**fields):
+    pass
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Forking a process that runs threads (and may have torch loaded) can deadlock the
+            # child, so workers are spawned fresh and import only rag_pdf
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+def _iter_pdf_pages(file_path: str, progress: Callable[..., None]) -> Iterator[Tuple[int, str]]:
     """
-    Process a document (.txt or .pdf) and add it to the FAISS vector store.
+    Yield (page number, text) for a PDF in page order. Page ranges are fanned out to a process pool;
+    at most two ranges per worker are in flight so extracted text does not pile up ahead of embedding.
+    """
+    with open(file_path, "rb") as f:
+        pdf_reader = pypdf.PdfReader(f)
+        page_count = len(pdf_reader.pages)
+        progress(pages_total=page_count)
+        
+        if PDF_WORKERS <= 1 or page_count <= PDF_PAGES_PER_TASK:
+            # Small documents and single-process setups extract in place, one page at a time
+            for page_number in range(1, page_count + 1):
+                yield page_number, pdf_reader.pages[page_number - 1].extract_text() or ""
+                progress(pages_extracted=page_number)
+            return
+    
+    pool = _get_pdf_pool()
+    ranges = deque((start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK))
+    in_flight = deque()
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < PDF_WORKERS * 2:
+                start, end = ranges.popleft()
+                in_flight.append((start, pool.submit(extract_pages, file_path, start, end)))
+            start, future = in_flight.popleft()
+            texts = future.result()
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+            progress(pages_extracted=start + len(texts))
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+def _iter_pages(file_path: str, filename: str, progress: Callable[..., None]) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Yield (page number, raw text) one page at a time. .txt files are read in blocks of whole lines
+    and have no page numbers.
+    """
+    if filename.lower().endswith('.pdf'):
+        yield from _iter_pdf_pages(file_path, progress)
+    elif filename.lower().endswith('.txt'):
+        progress(pages_total=1)
+        with open(file_path, "r", encoding="utf-8") as f:
+            while True:
+                lines = f.readlines(TXT_BLOCK_SIZE)
+                if not lines:
+                    break
+                yield None, "".join(lines)
+        progress(pages_extracted=1)
+    else:
+        logger.error(f"Unsupported file type: {filename}")
+        raise ValueError(f"Only .txt and .pdf files are supported")
+
+def get_chunker():
+    """
+    The chunker for the current embeddings. Token chunking needs the model's tokenizer, so this
+    loads the model on first use.
+    """
+    global _chunker
+    if _chunker is None:
+        with _chunker_lock:
+            if _chunker is None:
+                _chunker = create_chunker(embeddings)
+    return _chunker
+
+def _iter_chunks(pages: Iterable[Tuple[Optional[int], str]], timings: StageTimings = None) -> Iterator[Tuple[Chunk, Optional[int]]]:
+    """
+    Clean and split pages incrementally, yielding (chunk, page number the chunk starts on). Text is
+    buffered only until it spans a few chunks; the last chunk of every split is carried over so chunk
+    overlap is kept across page boundaries. Cleaning and splitting time is added to timings.
+    """
+    timings = timings or StageTimings()
+    chunker = get_chunker()
+    buffer = ""
+    # (offset in buffer, page number) for every page that starts inside the buffer
+    page_starts: List[Tuple[int, Optional[int]]] = []
+    
+    def page_at(offset: int) -> Optional[int]:
+        position = bisect_right([start for start, _ in page_starts], offset) - 1
+        return page_starts[max(position, 0)][1] if page_starts else None
+    
+    for page_number, page_text in pages:
+        with timings.time("clean"):
+            cleaned = clean_text(page_text)
+        if not cleaned:
+            continue
+        if buffer:
+            buffer += " "
+        page_starts.append((len(buffer), page_number))
+        buffer += cleaned
+        if len(buffer) < chunker.window_chars:
+            continue
+        with timings.time("split"):
+            chunks = chunker.split(buffer)
+        for chunk in chunks[:-1]:
+            yield chunk, page_at(chunk.start)
+        if not chunks:
+            buffer, page_starts = "", []
+            continue
+        carry_from = chunks[-1].start
+        page_starts = [(0, page_at(carry_from))] + [(start - carry_from, page) for start, page in page_starts if start > carry_from]
+        buffer = buffer[carry_from:]
+    if buffer:
+        with timings.time("split"):
+            chunks = chunker.split(buffer)
+        for chunk in chunks:
+            yield chunk, page_at(chunk.start)
+
+def _iter_batches(chunks: Iterable, batch_size: int) -> Iterator[list]:
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _append_to_index(texts: List[str], vectors: List[List[float]], metadatas: List[dict],
+                     file_id: int = None, generation: Tuple[int, int] = None) -> List[int]:
+    """
+    Append embedded chunks to the vector store and return the FAISS ids they were assigned.
+    With a generation, raises IngestCancelled instead if file_id was removed or the store reset since.
     """
     global vector_store
-    text = ""
+    with write_lock, index_lock.write():
+        if generation is not None and ingest_generation(file_id) != generation:
+            raise IngestCancelled(f"File {file_id} was removed while it was being ingested")
+        if vector_store is None:
+            vector_store = create_store(len(vectors[0]))
+            logger.debug("Created new FAISS vector store")
+        ensure_writable(vector_store)
+        return add_vectors(vector_store, texts, vectors, metadatas)
+
+def _discard_vectors(vector_ids: List[int], generation: Tuple[int, int] = None):
+    """
+    Drop vectors that were indexed but never published (e.g. after a failed ingest). A snapshot
+    published by a concurrent ingest may already hold them, so a new one is written without them.
+    Nothing is dropped when the store was reset after generation: the ids belonged to the old one.
+    """
+    with write_lock:
+        with index_lock.write():
+            if vector_store is None or (generation is not None and generation[0] != store_generation):
+                return
+            remove_vectors(vector_store, vector_ids)
+        save_snapshot(vector_store, file_vector_ids, embedding_model=embeddings.model_name)
+    _maybe_schedule_compaction()
+
+def remove_document(file_id: int):
+    """
+    Remove a file's chunks from the vector store and persist the change. Ingests of the file that
+    are still running publish nothing.
+    """
+    with write_lock:
+        file_generations[file_id] = file_generations.get(file_id, 0) + 1
+        with index_lock.write():
+            vector_ids = file_vector_ids.pop(file_id, None)
+            if vector_store is None or vector_ids is None or not len(vector_ids):
+                return
+            remove_vectors(vector_store, vector_ids.tolist())
+            bump_index_version()
+        save_snapshot(vector_store, file_vector_ids, embedding_model=embeddings.model_name)
+    logger.debug(f"Removed {len(vector_ids)} vectors of file_id {file_id}")
+    _maybe_schedule_compaction()
+
+def reset_vector_store():
+    """
+    Drop every document from the vector store and persist an empty snapshot. Ingests that are still
+    running publish nothing.
+    """
+    global vector_store, store_generation
+    with write_lock:
+        store_generation += 1
+        with index_lock.write():
+            if vector_store is None:
+                return
+            vector_store = create_store(vector_store.index.d)
+            file_vector_ids.clear()
+            bump_index_version()
+        save_snapshot(vector_store, file_vector_ids, embedding_model=embeddings.model_name)
+    logger.debug("Reset vector store")
+
+def compact_vector_store():
+    """
+    Physically remove dead vectors from the index, their postings from BM25 and their text from
+    the chunk store, and persist the compacted snapshot. Writers are blocked while the compacted
+    copies are built, but searches keep using the current ones until the swap.
+    """
+    global _compaction_pending
+    try:
+        with write_lock:
+            if vector_store is None:
+                return
+            vector_store.bm25.compact()
+            chunks = vector_store.chunks.compacted()
+            new_index, removed = compact_index(vector_store)
+            with index_lock.write():
+                vector_store.chunks.apply_compaction(chunks)
+                if new_index is not None:
+                    vector_store.index = new_index
+                    vector_store.mmapped = False
+            if removed:
+                save_snapshot(vector_store, file_vector_ids, embedding_model=embeddings.model_name)
+        logger.debug(f"Compacted {removed} dead vectors out of the index")
+    except Exception as e:
+        logger.error(f"Index compaction failed: {str(e)}", exc_info=True)
+    finally:
+        _compaction_pending = False
+
+def _maybe_schedule_compaction():
+    global _compaction_pending
+    if vector_store is None or _compaction_pending:
+        return
+    dead = dead_vector_count(vector_store)
+    if dead >= COMPACT_MIN_DEAD and dead >= COMPACT_DEAD_RATIO * vector_store.index.ntotal:
+        _compaction_pending = True
+        _maintenance_executor.submit(compact_vector_store)
+
+def promote_vector_store():
+    """
+    Switch the store from its current index to the configured RAG_INDEX_TYPE and
+    RAG_VECTOR_PRECISION. Writers are blocked
+    while the new index is trained, but searches keep using the old one until the swap.
+    """
+    global _promotion_pending
+    try:
+        with write_lock:
+            if vector_store is None:
+                return
+            started = time.perf_counter()
+            new_index, raw_vectors = promote_index(vector_store, INDEX_TYPE)
+            with index_lock.write():
+                vector_store.index = new_index
+                vector_store.raw_vectors = raw_vectors
+                vector_store.mmapped = False
+                bump_index_version()
+            save_snapshot(vector_store, file_vector_ids, embedding_model=embeddings.model_name)
+        logger.debug(f"Promoted index to {INDEX_TYPE}/{VECTOR_PRECISION} with {new_index.ntotal} vectors in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Index promotion to {INDEX_TYPE}/{VECTOR_PRECISION} failed: {str(e)}", exc_info=True)
+    finally:
+        _promotion_pending = False
+
+def _maybe_schedule_promotion():
+    global _promotion_pending
+    if vector_store is None or _promotion_pending or is_target_index(vector_store.index):
+        return
+    if vector_store.live_count >= promotion_threshold(vector_store.index):
+        _promotion_pending = True
+        _maintenance_executor.submit(promote_vector_store)
+
+def get_index_stats() -> dict:
+    if vector_store is None:
+        return {"vectors": 0, "live_vectors": 0, "dead_vectors": 0, "files": 0}
+    return {
+        "index_type": index_type_of(vector_store.index),
+        "precision": precision_of(vector_store.index),
+        "target_index_type": INDEX_TYPE,
+        "target_precision": VECTOR_PRECISION,
+        "promotion_pending": _promotion_pending,
+        "vectors": vector_store.index.ntotal,
+        "live_vectors": vector_store.live_count,
+        "dead_vectors": dead_vector_count(vector_store),
+        "files": len(file_vector_ids),
+        "compaction_pending": _compaction_pending,
+        "bm25": vector_store.bm25.get_stats(),
+        "chunks": vector_store.chunks.get_stats(),
+    }
+
+def open_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Open the on-disk embedding cache in the index writer. Loading truncates rows left behind by a
+    crashed append, which is only safe while this process holds the writer lock; readers never ingest
+    and never open the cache.
+    """
+    global embedding_cache, document_embeddings
+    with _embedding_cache_lock:
+        if embedding_cache is None and EMBED_CACHE_ENABLED and is_writer():
+            embedding_cache = EmbeddingCache(EMBED_CACHE_DIR, embeddings.model_name)
+            document_embeddings = CachedEmbeddings(embeddings, embedding_cache)
+    return embedding_cache
+
+def _embed_chunks(texts: List[str], token_ids: List[Optional[List[int]]]) -> List[List[float]]:
+    """
+    Embed chunk texts, reusing the chunker's token ids when it produced them and the embeddings accept them.
+    """
+    if embedding_cache is None:
+        open_embedding_cache()
+    if all(ids is not None for ids in token_ids) and hasattr(document_embeddings, "embed_chunks"):
+        return document_embeddings.embed_chunks(texts, token_ids)
+    return document_embeddings.embed_documents(texts)
+
+def process_document(file_path: str, filename: str, db: Session, file_id: int = None, progress: Callable[..., None] = None) -> StageTimings:
+    """
+    Process a document (.txt or .pdf) and add it to the FAISS vector store.
+    Pages are streamed through clean -> chunk -> embed -> index in fixed-size batches, so memory
+    stays bounded by the batch size rather than the document size. The document becomes queryable
+    only after its last batch is indexed.
+    The optional progress callback receives keyword updates (status, pages_extracted, chunks_embedded, ...).
+    Per-stage times (extract, clean, split, embed, index, publish, total) go to rag_ingest_stage_seconds
+    and are returned.
+    """
+    progress = progress or _no_progress
+    metadata = {"filename": filename, "file_path": file_path, "file_id": file_id}
+    vector_ids = []
+    with write_lock:
+        generation = ingest_generation(file_id)
+    timings = StageTimings()
+    started = time.perf_counter()
     
-    logger.debug(f"Processing document: {filename}, file_id: {file_id}")
+    logger.debug("Processing document: %s, file_id: %s", filename, file_id)
     
     try:
-        # Check file extension
-        if filename.lower().endswith('.pdf'):
-            with open(file_path, "rb") as f:
-                pdf_reader = pypdf.PdfReader(f)
-                for page in pdf_reader.pages:
-                    extracted_text = page.extract_text() or ""
-                    text += clean_text(extracted_text) + " "
-        elif filename.lower().endswith('.txt'):
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = clean_text(f.read())
-        else:
-            logger.error(f"Unsupported file type: {filename}")
-            raise ValueError(f"Only .txt and .pdf files are supported")
-        
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=150,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        texts = text_splitter.split_text(text)
-        logger.debug(f"Split text into {len(texts)} chunks")
+        progress(status="extracting")
+        pages = timings.iterate("extract", _iter_pages(file_path, filename, progress))
+        chunks = _iter_chunks(pages, timings)
+        for batch in _iter_batches(chunks, EMBED_BATCH_SIZE):
+            texts = [chunk.text for chunk, _ in batch]
+            metadatas = [dict(metadata, page=page) if page is not None else dict(metadata) for _, page in batch]
+            with timings.time("embed"):
+                vectors = _embed_chunks(texts, [chunk.token_ids for chunk, _ in batch])
+            with timings.time("index"):
+                vector_ids.extend(_append_to_index(texts, vectors, metadatas, file_id, generation))
+            progress(chunks_embedded=len(vector_ids))
+        logger.debug("Indexed %d chunks from %s", len(vector_ids), filename)
         
-        # Create metadata with file ID
-        metadatas = [{"filename": filename, "file_path": file_path, "file_id": file_id} for _ in texts]
+        progress(status="indexing", chunks_total=len(vector_ids))
+        if not vector_ids:
+            logger.debug("No text extracted from %s, nothing to index", filename)
+            progress(indexed=True)
+            INGEST_DOCUMENTS_TOTAL.labels(status="empty").inc()
+            return timings
         
-        # Create or update vector store
-        if vector_store is None:
-            vector_store = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
-            logger.debug("Created new FAISS vector store")
-        else:
-            vector_store.add_texts(texts, metadatas=metadatas)
-            logger.debug("Added texts to existing FAISS vector store")
+        with timings.time("publish"), write_lock:
+            if ingest_generation(file_id) != generation:
+                raise IngestCancelled(f"File {file_id} was removed while it was being ingested")
+            # Publishing the ids makes the document queryable. A requeued ingest (the writer died
+            # after publishing) replaces the chunks published before instead of adding a second copy.
+            with index_lock.write():
+                previous = file_vector_ids.get(file_id)
+                file_vector_ids[file_id] = np.asarray(vector_ids, dtype=np.int64)
+                if previous is not None:
+                    remove_vectors(vector_store, previous.tolist())
+                bump_index_version()
+            
+            # Persist a new snapshot so the document survives a restart
+            save_snapshot(vector_store, file_vector_ids, embedding_model=embeddings.model_name)
+        progress(indexed=True)
+        if previous is not None:
+            _maybe_schedule_compaction()
+        _maybe_schedule_promotion()
+        timings.seconds["total"] = time.perf_counter() - started
+        timings.observe(INGEST_STAGE_SECONDS)
+        INGEST_DOCUMENTS_TOTAL.labels(status="done").inc()
+        INGEST_CHUNKS_TOTAL.inc(len(vector_ids))
+        return timings
+    except IngestCancelled:
+        logger.info(f"Dropped {len(vector_ids)} chunks of {filename}: the file was removed while it was being ingested")
+        INGEST_DOCUMENTS_TOTAL.labels(status="cancelled").inc()
+        if vector_ids:
+            _discard_vectors(vector_ids, generation)
+        raise
     except Exception as e:
         logger.error(f"Error processing document {filename}: {str(e)}")
+        INGEST_DOCUMENTS_TOTAL.labels(status="failed").inc()
+        if vector_ids:
+            _discard_vectors(vector_ids, generation)
         raise
 
+def fuse_results(dense: List, sparse: List, k: int) -> List:
+    """
+    Reciprocal-rank fusion of dense (vector id, distance) and BM25 (vector id, score) hits into
+    (vector id, fused score). Dense hits farther than DENSE_MAX_DISTANCE only count when BM25 also
+    matched them.
+    """
+    fused = {}
+    for rank, (vector_id, distance) in enumerate(dense):
+        if distance <= DENSE_MAX_DISTANCE:
+            fused[vector_id] = 1 / (RRF_K + rank + 1)
+    for rank, (vector_id, score) in enumerate(sparse):
+        fused[vector_id] = fused.get(vector_id, 0.0) + 1 / (RRF_K + rank + 1)
+    ranked = sorted(fused.items(), key=lambda entry: entry[1], reverse=True)
+    return ranked[:k]
+
 def filter_context(query: str, docs: List, active_file_id: int = None) -> str:
     """
-    Filters retrieved documents to include only relevant chunks, optionally from the active file.
+    Builds the context from retrieved chunks, optionally restricted to the active file.
+    Relevance is decided upstream by the fused dense + BM25 ranking.
     """
-    query_keywords = set(query.lower().split())
     filtered_chunks = []
+    # Chunk contents are only formatted for a sample of queries, and only at DEBUG
+    verbose = log_sampled(logger)
     
-    logger.debug(f"Filtering context for query: {query}, active_file_id: {active_file_id}")
+    if verbose:
+        logger.debug("Filtering context for query: %s, active_file_id: %s", query, active_file_id)
     for doc, score in docs:
-        content = doc.page_content
         metadata = doc.metadata
-        logger.debug(f"Doc: {content[:50]}..., Score: {score}, Metadata: {metadata}")
+        if verbose:
+            logger.debug("Doc: %.50s..., Score: %s, Metadata: %s", doc.page_content, score, metadata)
         if active_file_id and metadata.get('file_id') != active_file_id:
-            logger.debug(f"Skipping doc, file_id {metadata.get('file_id')} does not match active_file_id {active_file_id}")
+            if verbose:
+                logger.debug("Skipping doc, file_id %s does not match active_file_id %s", metadata.get('file_id'), active_file_id)
             continue
-        if score > 0.3:
-            content_lower = content.lower()
-            if any(keyword in content_lower for keyword in query_keywords):
-                filtered_chunks.append(content)
-                logger.debug(f"Added chunk: {content[:50]}...")
+        filtered_chunks.append(f"From {metadata['filename']}:\n{doc.page_content}")
     
     if not filtered_chunks:
         logger.debug("No relevant chunks found after filtering")
         return ""
     
-    context = "\n\n".join([f"From {doc.metadata['filename']}:\n{chunk}" 
-                          for doc, chunk in zip([d[0] for d in docs], filtered_chunks)])
-    logger.debug(f"Filtered context: {context[:100]}...")
+    context = "\n\n".join(filtered_chunks)
+    if verbose:
+        logger.debug("Filtered context: %.100s...", context)
     return context
 
-def query_rag(query: str, active_file_id: int = None) -> str:
+def get_query_embedding(query: str) -> List[float]:
     """
-    Query the RAG system and return a response based on the active document.
+    Embed a query, reusing the cached vector for repeated questions.
     """
-    global vector_store
-    logger.debug(f"Received query: {query}, active_file_id: {active_file_id}")
+    key = normalize_query(query)
+    query_embedding = query_embedding_cache.get(key)
+    if query_embedding is None:
+        query_embedding = embeddings.embed_query(query)
+        query_embedding_cache.put(key, query_embedding)
+    return query_embedding
+
+def needs_query_embedding(query: str, active_file_id: int = None) -> bool:
+    """
+    True when query_rag would have to embed the query, i.e. it reaches the search and the
+    result is not already cached. Lets async callers embed through the batcher beforehand.
+    """
+    store, ids_by_file = vector_store, file_vector_ids
+    vector_ids = ids_by_file.get(active_file_id)
+    if store is None or vector_ids is None or not len(vector_ids) or is_exact_term_query(query):
+        return False
+    return not retrieval_cache.contains((normalize_query(query), active_file_id, index_version))
+
+def retrieve_context(query: str, active_file_id: int = None, query_embedding: List[float] = None,
+                     timings: StageTimings = None) -> Tuple[str, Optional[str]]:
+    """
+    Retrieve the context for a query from the active document.
+    Returns (context, None), or ("", message) when there is nothing to answer from.
+    Pass query_embedding when the query was already embedded (e.g. by the query batcher).
+    Stage times (sparse_search, embed, dense_search, fuse, filter) are added to timings when given, and
+    otherwise go to rag_query_stage_seconds.
+    """
+    if timings is None:
+        timings = StageTimings()
+        try:
+            return _retrieve_context(query, active_file_id, query_embedding, timings)
+        finally:
+            timings.observe(QUERY_STAGE_SECONDS)
+    return _retrieve_context(query, active_file_id, query_embedding, timings)
+
+def _retrieve_context(query: str, active_file_id: int, query_embedding: Optional[List[float]], timings: StageTimings) -> Tuple[str, Optional[str]]:
+    if log_sampled(logger):
+        logger.debug("Received query: %s, active_file_id: %s", query, active_file_id)
     
-    if vector_store is None:
+    # A reader may swap in a newer snapshot at any time; this query keeps using the one it started with
+    store, ids_by_file = vector_store, file_vector_ids
+    if store is None or not ids_by_file:
         logger.debug("No vector store available")
-        return "No documents have been uploaded or processed. Please upload a .txt or .pdf file."
+        return "", "No documents have been uploaded or processed. Please upload a .txt or .pdf file."
     
     if active_file_id is None:
         logger.debug("No active file selected")
-        return "No active file selected. Please select a file to query."
+        return "", "No active file selected. Please select a file to query."
     
-    # Perform similarity search with scores
-    docs_and_scores = vector_store.similarity_search_with_score(query, k=3)
-    logger.debug(f"Retrieved {len(docs_and_scores)} documents from similarity search")
+    vector_ids = ids_by_file.get(active_file_id)
+    if vector_ids is None or not len(vector_ids):
+        logger.debug("Active file %s has no indexed chunks", active_file_id)
+        return "", f"No relevant information found in the active document for query: {query}"
+    
+    # Hybrid BM25 + dense search, restricted to the active file's chunks
+    cache_key = (normalize_query(query), active_file_id, index_version)
+    docs_and_scores = retrieval_cache.get(cache_key)
+    if docs_and_scores is None:
+        QUERIES_TOTAL.labels(cache="miss").inc()
+        with timings.time("sparse_search"):
+            tokens = tokenize(query)
+            with index_lock.read():
+                sparse = search_file_sparse(store, tokens, vector_ids, k=FUSION_CANDIDATES)
+        if sparse and is_exact_term_query(query):
+            # Identifiers and error codes are answered from the sparse index alone, without embedding
+            hits = sparse[:RETRIEVAL_K]
+        else:
+            if query_embedding is None:
+                with timings.time("embed"):
+                    query_embedding = get_query_embedding(query)
+            with timings.time("dense_search"), index_lock.read():
+                dense = search_file(store, query_embedding, vector_ids, k=FUSION_CANDIDATES)
+            with timings.time("fuse"):
+                hits = fuse_results(dense, sparse, RETRIEVAL_K)
+        with index_lock.read():
+            docs_and_scores = get_scored_documents(store, hits)
+        retrieval_cache.put(cache_key, docs_and_scores)
+        logger.debug("Retrieved %d documents from hybrid search over %d chunks", len(docs_and_scores), len(vector_ids))
+    else:
+        QUERIES_TOTAL.labels(cache="hit").inc()
+        logger.debug("Retrieved documents from retrieval cache")
     
     # Filter context for active file
-    filtered_context = filter_context(query, docs_and_scores, active_file_id)
+    with timings.time("filter"):
+        filtered_context = filter_context(query, docs_and_scores, active_file_id)
     
     if not filtered_context.strip():
         logger.debug("No relevant information found in the active document")
-        return f"No relevant information found in the active document for query: {query}"
+        return "", f"No relevant information found in the active document for query: {query}"
     
-    # Simplified prompt for precise answers
-    prompt = f"""
-    Context: {filtered_context}
+    return filtered_context, None
+
+def stream_answer(query: str, active_file_id: int = None, query_embedding: List[float] = None,
+                  timings: StageTimings = None) -> Iterator[str]:
     """
-    
-    # Placeholder response; replace with LLM integration for production
-    response = f"Based on the retrieved context:\n{filtered_context[:200]} "
-    logger.debug("Generated placeholder response")
-    return response
+    Retrieve context for the query and stream the answer from the configured generator backend.
+    Records the retrieval stages plus retrieve, generate and total; generate includes time the
+    consumer spends between tokens. Stage times are added to timings when given, and otherwise go
+    to rag_query_stage_seconds once the answer is complete.
+    """
+    observe = timings is None
+    timings = StageTimings() if timings is None else timings
+    started = time.perf_counter()
+    try:
+        with timings.time("retrieve"):
+            context, message = _retrieve_context(query, active_file_id, query_embedding, timings)
+        if message is not None:
+            yield message
+            return
+        generating = time.perf_counter()
+        try:
+            yield from generator.stream(query, context)
+        finally:
+            finished = time.perf_counter()
+            timings.seconds["generate"] += finished - generating
+            timings.seconds["total"] += finished - started
+    finally:
+        if observe:
+            timings.observe(QUERY_STAGE_SECONDS)
+
+def query_rag(query: str, active_file_id: int = None, query_embedding: List[float] = None,
+              timings: StageTimings = None) -> str:
+    """
+    Query the RAG system and return a response based on the active document.
+    Pass query_embedding when the query was already embedded (e.g. by the query batcher), and
+    timings to collect the stage times instead of observing them into rag_query_stage_seconds.
+    """
+    return "".join(stream_answer(query, active_file_id, query_embedding, timings))
 
 # Example Usage
 if __name__ == "__main__":
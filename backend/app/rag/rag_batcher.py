@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import asyncio
+import os
+import logging
+from app.rag.rag import embeddings
+from app.rag.rag_cache import LRUCache, normalize_query, query_embedding_cache
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# How long to wait for more queries after the first one arrives, and the largest batch per forward pass
+BATCH_WAIT_MS = float(os.getenv("RAG_QUERY_BATCH_WAIT_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("RAG_QUERY_BATCH_MAX_SIZE", "32"))
+
+class QueryEmbeddingBatcher:
+    """
+    Collects query texts from all WebSocket sessions and embeds them together in one forward pass,
+    handing each vector back to the coroutine that asked for it.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], max_wait_ms: float = BATCH_WAIT_MS,
+                 max_batch_size: int = BATCH_MAX_SIZE, cache: Optional[LRUCache] = None):
+        self.embed_fn = embed_fn
+        self.cache = cache
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # One batch runs at a time; queries arriving meanwhile form the next batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-embed")
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self.batch_sizes: Dict[int, int] = {}
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Embed a single query, sharing the forward pass with any other queries waiting at the same time.
+        """
+        if self.cache is not None:
+            vector = self.cache.get(normalize_query(text))
+            if vector is not None:
+                return vector
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        vector = await future
+        if self.cache is not None:
+            self.cache.put(normalize_query(text), vector)
+        return vector
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Drop queries whose callers gave up while waiting
+        return [(text, future) for text, future in batch if not future.cancelled()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.embed_fn, texts)
+            except Exception as e:
+                logger.error(f"Query embedding batch of {len(texts)} failed: {str(e)}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+            self._record(len(batch))
+
+    def _record(self, size: int):
+        self.batches += 1
+        self.queries += size
+        self.largest_batch = max(self.largest_batch, size)
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    def get_stats(self) -> dict:
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "pending": self._queue.qsize() if self._queue else 0,
+        }
+
+query_batcher = QueryEmbeddingBatcher(embeddings.embed_documents, cache=query_embedding_cache)
@@ -0,0 +1,312 @@
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+import math
+import os
+import re
+import threading
+from app.rag.rag_chunks import load_array, save_array
+
+# Tokens keep inner '-', '_' and '.' so identifiers like "ERR-1042" or "v2.3.1" stay whole
+TOKEN_RE = re.compile(r"[a-z0-9](?:[a-z0-9_.\-]*[a-z0-9])?")
+EXACT_TERM_RE = re.compile(r"^(?=.*\d)[a-z0-9_.\-]+$|^[a-z0-9]+[_.\-][a-z0-9_.\-]+$")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+def is_exact_term_query(query: str) -> bool:
+    """
+    True for single-token queries that look like identifiers or codes (contain a digit or an inner
+    separator), which the sparse index answers better than the embedding model.
+    """
+    tokens = query.strip().strip('"\'').lower().split()
+    return len(tokens) == 1 and bool(EXACT_TERM_RE.match(tokens[0]))
+
+# BM25 arrays of a snapshot directory
+TERMS_FILE = "bm25_terms.npy"
+TERM_ENDS_FILE = "bm25_term_ends.npy"
+POSTING_OFFSETS_FILE = "bm25_offsets.npy"
+POSTING_IDS_FILE = "bm25_ids.npy"
+POSTING_TFS_FILE = "bm25_tfs.npy"
+DOC_LENGTHS_FILE = "bm25_lengths.npy"
+LIVE_FILE = "bm25_live.npy"
+
+class Postings(NamedTuple):
+    """
+    Posting lists in CSR form. Terms are sorted and stored utf-8 encoded back to back, term i
+    ending at term_ends[i]; its postings are ids/tfs[offsets[i]:offsets[i + 1]], ids ascending.
+    """
+    terms: np.ndarray
+    term_ends: np.ndarray
+    offsets: np.ndarray
+    ids: np.ndarray
+    tfs: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "Postings":
+        return cls(np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                   np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+    def term(self, index: int) -> bytes:
+        start = int(self.term_ends[index - 1]) if index else 0
+        return self.terms[start:int(self.term_ends[index])].tobytes()
+
+    def position(self, term: bytes) -> int:
+        """
+        Index of term, or of the first term after it when it is missing.
+        """
+        low, high = 0, len(self.term_ends)
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, term: bytes) -> Optional[int]:
+        index = self.position(term)
+        return index if index < len(self.term_ends) and self.term(index) == term else None
+
+def _merge(base: Postings, tail: Dict[str, Tuple[array, array]], live: np.ndarray = None) -> Postings:
+    """
+    Fold tail postings (chunks added since base was built, so with higher ids) into base. With live,
+    postings of removed ids are dropped, and so are terms left without postings.
+    """
+    term_count = len(base.term_ends)
+    tail_terms = sorted((term.encode("utf-8"), term) for term in tail)
+    positions = [base.position(encoded) for encoded, _ in tail_terms]
+    known = [position < term_count and base.term(position) == encoded for (encoded, _), position in zip(tail_terms, positions)]
+    new_terms = [encoded for (encoded, _), found in zip(tail_terms, known) if not found]
+    new_positions = np.asarray([position for position, found in zip(positions, known) if not found], dtype=np.int64)
+    # Merged index of every base term and of every new term
+    base_index = np.arange(term_count, dtype=np.int64) + np.searchsorted(new_positions, np.arange(term_count), side="right")
+    new_index = new_positions + np.arange(len(new_terms), dtype=np.int64)
+    merged_count = term_count + len(new_terms)
+
+    base_lengths = np.diff(base.term_ends, prepend=0)
+    lengths = np.zeros(merged_count, dtype=np.int64)
+    lengths[base_index] = base_lengths
+    lengths[new_index] = [len(term) for term in new_terms]
+    pieces = []
+    previous = 0
+    for term, position in zip(new_terms, new_positions.tolist()):
+        cut = int(base.term_ends[position - 1]) if position else 0
+        pieces.extend([base.terms[previous:cut], np.frombuffer(term, dtype=np.uint8)])
+        previous = cut
+    pieces.append(base.terms[previous:])
+    terms = np.concatenate(pieces) if len(pieces) > 1 else np.asarray(pieces[0])
+
+    new_lookup = dict(zip(new_terms, new_index.tolist()))
+    tail_index = [int(base_index[position]) if found else new_lookup[encoded]
+                  for (encoded, _), position, found in zip(tail_terms, positions, known)]
+    tail_ids = [np.frombuffer(tail[term][0], dtype=np.int64) for _, term in tail_terms]
+    tail_tfs = [np.frombuffer(tail[term][1], dtype=np.float32) for _, term in tail_terms]
+    term_of = np.concatenate([np.repeat(base_index, np.diff(base.offsets))]
+                             + [np.full(len(ids), index, dtype=np.int64) for index, ids in zip(tail_index, tail_ids)])
+    ids = np.concatenate([base.ids] + tail_ids)
+    tfs = np.concatenate([base.tfs] + tail_tfs)
+    if live is not None:
+        keep = live[ids]
+        term_of, ids, tfs = term_of[keep], ids[keep], tfs[keep]
+    # Base postings come first and are grouped by term already, so the stable sort is close to linear;
+    # within a term, base ids precede the higher tail ids
+    order = np.argsort(term_of, kind="stable")
+    counts = np.bincount(term_of, minlength=merged_count)
+    if live is not None:
+        kept = counts > 0
+        terms = terms[np.repeat(kept, lengths)]
+        lengths, counts = lengths[kept], counts[kept]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return Postings(terms, np.cumsum(lengths), offsets, ids[order], tfs[order])
+
+def _intersect(sorted_ids: np.ndarray, allowed_ids: np.ndarray) -> np.ndarray:
+    """
+    Positions in sorted_ids of the ids that are also in allowed_ids (both sorted and unique).
+    Binary-searches the shorter array in the longer one, so a file's chunks are matched against a
+    term's postings in O(min * log max) instead of scanning the whole posting list.
+    """
+    if len(allowed_ids) <= len(sorted_ids):
+        positions = np.searchsorted(sorted_ids, allowed_ids)
+        found = positions < len(sorted_ids)
+        found[found] = sorted_ids[positions[found]] == allowed_ids[found]
+        return positions[found]
+    positions = np.searchsorted(allowed_ids, sorted_ids)
+    found = positions < len(allowed_ids)
+    found[found] = allowed_ids[positions[found]] == sorted_ids[found]
+    return np.flatnonzero(found)
+
+class BM25Index:
+    """
+    Incremental inverted index with BM25 scoring. Posting lists are arrays of ascending vector ids
+    (ids are allocated in increasing order) that are scored as numpy views, so a query costs a few
+    vector operations per query term. Postings up to the last snapshot are CSR arrays memory-mapped
+    from it; chunks added since are kept in per-term arrays until the next snapshot folds them in.
+    Vector ids are the FAISS ids of the chunks; removed ids are masked out until compact() rewrites
+    the postings. As in Lucene, removed chunks still count towards document frequencies until then.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.base = Postings.empty()
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = np.zeros(1024, dtype=np.float32)
+        self.live = np.zeros(1024, dtype=bool)
+        self.doc_count = 0
+        self.total_length = 0
+        self.dead_count = 0
+        # Distinct terms of base and tail, kept up to date so stats need not scan the postings
+        self.term_count = 0
+        # Guards swapping base and postings against searches taking them
+        self._lock = threading.Lock()
+
+    def _grow(self, max_id: int):
+        if max_id < len(self.doc_lengths):
+            return
+        size = max(max_id + 1, len(self.doc_lengths) * 2)
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.zeros(size - len(self.doc_lengths), dtype=np.float32)])
+        self.live = np.concatenate([self.live, np.zeros(size - len(self.live), dtype=bool)])
+
+    def add_many(self, vector_ids: Iterable[int], texts: Iterable[str]):
+        for vector_id, text in zip(vector_ids, texts):
+            tokens = tokenize(text)
+            self._grow(vector_id)
+            self.doc_lengths[vector_id] = len(tokens)
+            self.live[vector_id] = True
+            self.doc_count += 1
+            self.total_length += len(tokens)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = (array("q"), array("f"))
+                    if self.base.find(token.encode("utf-8")) is None:
+                        self.term_count += 1
+                ids, tfs = posting
+                ids.append(vector_id)
+                tfs.append(count)
+
+    def remove_many(self, vector_ids: Iterable[int]):
+        for vector_id in vector_ids:
+            if vector_id < len(self.live) and self.live[vector_id]:
+                self.live[vector_id] = False
+                self.doc_count -= 1
+                self.total_length -= int(self.doc_lengths[vector_id])
+                self.dead_count += 1
+
+    def compact(self):
+        """
+        Drop removed ids from every posting list. The result is held in memory until the next snapshot.
+        """
+        with self._lock:
+            base, tail = self.base, self.postings
+        merged = _merge(base, tail, self.live)
+        with self._lock:
+            self.base, self.postings = merged, {}
+        self.term_count = len(merged.term_ends)
+        self.dead_count = 0
+
+    def _posting(self, base: Postings, tail: Dict[str, Tuple[array, array]], token: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        parts = []
+        index = base.find(token.encode("utf-8"))
+        if index is not None:
+            start, end = int(base.offsets[index]), int(base.offsets[index + 1])
+            parts.append((base.ids[start:end], base.tfs[start:end]))
+        posting = tail.get(token)
+        if posting is not None:
+            parts.append((np.frombuffer(posting[0], dtype=np.int64), np.frombuffer(posting[1], dtype=np.float32)))
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([ids for ids, _ in parts]), np.concatenate([tfs for _, tfs in parts])
+
+    def search(self, tokens: Iterable[str], k: int, allowed_ids: np.ndarray = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (vector id, BM25 score) pairs for the tokenize()d query, restricted to allowed_ids
+        (sorted) when given. With allowed_ids the cost depends on their number, not on the size of
+        the corpus.
+        """
+        if not self.doc_count:
+            return []
+        with self._lock:
+            base, tail = self.base, self.postings
+        average_length = self.total_length / self.doc_count
+        document_count = self.doc_count + self.dead_count
+        all_ids = []
+        all_scores = []
+        for token in set(tokens):
+            posting = self._posting(base, tail, token)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            document_frequency = len(ids)
+            if allowed_ids is not None:
+                positions = _intersect(ids, allowed_ids)
+                ids, tfs = ids[positions], tfs[positions]
+            live = self.live[ids]
+            ids, tfs = ids[live], tfs[live]
+            if not len(ids):
+                continue
+            idf = math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            lengths = self.doc_lengths[ids]
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths / average_length)))
+        if not all_ids:
+            return []
+        unique_ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(unique_ids[i]), float(scores[i])) for i in top]
+
+    def write(self, directory: str, rows: int) -> dict:
+        """
+        Save the postings, with the chunks added since the last snapshot folded in, and the per-id
+        arrays for ids below rows. Returns the scalar state for the manifest. Runs under the index
+        write lock, so nothing is added or removed meanwhile.
+        """
+        postings = _merge(self.base, self.postings) if self.postings else self.base
+        for name, values in zip((TERMS_FILE, TERM_ENDS_FILE, POSTING_OFFSETS_FILE, POSTING_IDS_FILE, POSTING_TFS_FILE), postings):
+            save_array(os.path.join(directory, name), values)
+        lengths = self.doc_lengths[:rows]
+        live = self.live[:rows]
+        if len(lengths) < rows:
+            # No chunk was added since the last ids were allocated
+            lengths = np.concatenate([lengths, np.zeros(rows - len(lengths), dtype=np.float32)])
+            live = np.concatenate([live, np.zeros(rows - len(live), dtype=bool)])
+        save_array(os.path.join(directory, DOC_LENGTHS_FILE), lengths)
+        save_array(os.path.join(directory, LIVE_FILE), live)
+        return {"k1": self.k1, "b": self.b, "doc_count": self.doc_count, "total_length": self.total_length, "dead_count": self.dead_count}
+
+    def rebase(self, directory: str):
+        """
+        Serve the postings from the snapshot write() just produced. Per-id arrays stay in memory.
+        """
+        base = Postings(*(load_array(os.path.join(directory, name))
+                          for name in (TERMS_FILE, TERM_ENDS_FILE, POSTING_OFFSETS_FILE, POSTING_IDS_FILE, POSTING_TFS_FILE)))
+        with self._lock:
+            self.base, self.postings = base, {}
+        self.term_count = len(base.term_ends)
+
+    @classmethod
+    def load(cls, directory: str, state: dict) -> "BM25Index":
+        bm25 = cls(state["k1"], state["b"])
+        bm25.rebase(directory)
+        bm25.doc_lengths = load_array(os.path.join(directory, DOC_LENGTHS_FILE), writable=True)
+        bm25.live = load_array(os.path.join(directory, LIVE_FILE), writable=True)
+        bm25.doc_count = state["doc_count"]
+        bm25.total_length = state["total_length"]
+        bm25.dead_count = state["dead_count"]
+        return bm25
+
+    def get_stats(self) -> dict:
+        return {
+            "documents": self.doc_count,
+            "terms": self.term_count,
+            "dead_documents": self.dead_count,
+        }
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import os
+import threading
+import time
+
+# Cache sizing; sizes are entry counts, TTLs are seconds
+EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL = float(os.getenv("RAG_EMBED_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RAG_RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RAG_RETRIEVAL_CACHE_TTL", "600"))
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key for a query: lowercased with whitespace collapsed.
+    """
+    return " ".join(query.lower().split())
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache with a per-entry TTL and hit/miss/eviction counters.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key: Hashable) -> bool:
+        """
+        Check for a live entry without touching recency or the hit/miss counters.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] >= time.monotonic()
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+# Query text -> embedding
+query_embedding_cache = LRUCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL)
+# (query text, active file id, index version) -> retrieved (doc, score) pairs
+retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
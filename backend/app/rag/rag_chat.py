@@ -1,37 +1,141 @@
-from fastapi import WebSocket, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import WebSocket
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
 import logging
-from app.db.database import SessionLocal
-from app.models.models import Document
-from app.rag.rag import query_rag
+import threading
+import time
+import uuid
+from app.rag.rag import stream_answer, needs_query_embedding
+from app.rag.rag_batcher import query_batcher
+from app.rag.rag_scheduler import QueryRejected, QueryTicket, query_scheduler
+from app.rag.rag_session import active_documents
+from app.logs.logs import LOG_LEVEL
+from app.metrics.metrics import QUERY_FIRST_TOKEN_SECONDS, WS_CONNECTIONS, WS_INFLIGHT_QUERIES
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+_STREAM_END = object()
+
+async def stream_response(websocket: WebSocket, ticket: QueryTicket, text: str, active_file_id: int = None, query_embedding=None):
+    """
+    Stream the answer as token frames followed by a final frame carrying the full text and timing stats.
+    Token frames have no "sender" so clients that only render complete messages can ignore them.
+    Retrieval and generation run on the query scheduler under the reserved ticket; cancelling this
+    coroutine cancels the query.
+    """
+    message_id = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    started = time.perf_counter()
+
+    def produce(cancelled: threading.Event):
+        pieces = stream_answer(text, active_file_id, query_embedding)
+        try:
+            for piece in pieces:
+                if cancelled.is_set():
+                    logger.debug("Message %s cancelled", message_id)
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, piece)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            # Closing the generator releases the backend's connection when we stop early
+            pieces.close()
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    if not query_scheduler.start(ticket, produce):
+        return
+    try:
+        parts = []
+        first_token_at = None
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                QUERY_FIRST_TOKEN_SECONDS.observe(first_token_at - started)
+            parts.append(item)
+            await websocket.send_json({"type": "token", "id": message_id, "delta": item})
+    finally:
+        if not ticket.future.done():
+            query_scheduler.cancel(ticket)
+    finished = time.perf_counter()
+    stats = {
+        "ttft_ms": round(((first_token_at or finished) - started) * 1000, 2),
+        "total_ms": round((finished - started) * 1000, 2),
+        "tokens": len(parts),
+    }
+    logger.debug("Streamed message %s: %s", message_id, stats)
+    await websocket.send_json({"type": "final", "id": message_id, "text": "".join(parts), "sender": "bot", "stats": stats})
+
+async def handle_query(websocket: WebSocket, connection_id: str, text: str):
+    WS_INFLIGHT_QUERIES.inc()
+    ticket = None
+    try:
+        # The in-flight slot is taken before embedding, so waiting for the batcher counts against the limit
+        ticket = query_scheduler.reserve(connection_id)
+        # Selections live in shared files, so they are read off the event loop
+        active_file_id = await run_in_threadpool(active_documents.get, connection_id)
+        # Embed through the shared batcher so concurrent sessions share a forward pass;
+        # skipped when the retrieval result is already cached
+        query_embedding = None
+        if needs_query_embedding(text, active_file_id):
+            query_embedding = await query_batcher.embed(text)
+        await stream_response(websocket, ticket, text, active_file_id, query_embedding)
+    except asyncio.CancelledError:
+        raise
+    except QueryRejected as e:
+        await websocket.send_json({"text": str(e), "sender": "bot"})
+    except Exception as e:
+        logger.error(f"Error processing WebSocket message: {e}", exc_info=True)
+        await websocket.send_json({"text": f"Error: {str(e)}", "sender": "bot"})
+    finally:
+        # Releases the slot if the query never reached the scheduler
+        if ticket is not None and not ticket.future.done():
+            query_scheduler.cancel(ticket)
+        WS_INFLIGHT_QUERIES.dec()
+
+async def select_file(websocket: WebSocket, connection_id: str, text: str):
+    filename = text[len("Selected file:"):].strip()
+    file_id = await active_documents.resolve_filename(filename)
+    if file_id is None:
+        await websocket.send_json({"text": f"File {filename} not found", "sender": "bot"})
+        return
+    await run_in_threadpool(active_documents.select, file_id, connection_id)
+    await websocket.send_json({"text": "File selected successfully", "sender": "bot"})
+
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    connection_id = uuid.uuid4().hex
+    current: Optional[asyncio.Task] = None
+    WS_CONNECTIONS.inc()
     try:
+        # The session id lets REST calls select a document for this connection only
+        await websocket.send_json({"type": "session", "session_id": connection_id})
         while True:
             data =await websocket.receive_json()
             if data["sender"] == "user":
-                db: Session = SessionLocal()
-                try:
-                    if data["text"].startswith("Selected file:"):
-                        await websocket.send_json({"text": "File selected successfully", "sender": "bot"})
-                        continue
-                    active_file = db.query(Document).filter(Document.is_active == True).first()
-                    active_file_id = active_file.id if active_file else None
-                    response = query_rag(data["text"], active_file_id)
-                    await websocket.send_json({"text": response, "sender": "bot"})
-                except Exception as e:
-                    logger.error(f"Error processing WebSocket message: {e}", exc_info=True)
-                    await websocket.send_json({"text": f"Error: {str(e)}", "sender": "bot"})
-                finally:
-                    db.close()
+                # A new message supersedes whatever this connection was still waiting on
+                if current is not None and not current.done():
+                    current.cancel()
+                if data["text"].startswith("Selected file:"):
+                    await select_file(websocket, connection_id, data["text"])
+                    continue
+                current = asyncio.create_task(handle_query(websocket, connection_id, data["text"]))
     except Exception as e:
         logger.error(f"WebSocket error: {e}", exc_info=True)
     finally:
+        WS_CONNECTIONS.dec()
+        if current is not None and not current.done():
+            current.cancel()
+        query_scheduler.cancel_connection(connection_id)
+        await run_in_threadpool(active_documents.end_session, connection_id)
         if websocket.client_state == 1:  # WebSocketState.CONNECTED
             logger.debug("Closing WebSocket connection")
-            await websocket.close(code=1000, reason="Normal closure")
\ No newline at end of file
+            await websocket.close(code=1000, reason="Normal closure")
@@ -0,0 +1,178 @@
+from bisect import bisect_left, bisect_right
+from typing import List, NamedTuple, Optional
+import os
+import re
+import logging
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# "tokens" measures chunks in the embedding model's word pieces and fills them up to its sequence
+# limit; "chars" keeps the fixed-size character splitter. Models without a fast tokenizer fall back to chars.
+CHUNKER = os.getenv("RAG_CHUNKER", "tokens").lower()
+# Token budget per chunk including special tokens; 0 uses the model's max_seq_length
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "0"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "32"))
+# Pack whole sentences into token chunks; sentences longer than a chunk are split between words
+SENTENCE_PACKING = os.getenv("RAG_SENTENCE_PACKING", "true").lower() in ("1", "true", "yes")
+
+# Character chunker
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 150
+
+# Text is split once the buffer spans this many chunks; the last chunk is carried into the next split
+SPLIT_WINDOW_CHUNKS = 8
+# Rough characters per word piece, used only to size the split window of the token chunker
+CHARS_PER_TOKEN = 4
+
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+
+class Chunk(NamedTuple):
+    text: str
+    # Offset of the chunk in the text it was split from
+    start: int
+    # Word-piece ids without special tokens, when the chunker tokenized the text
+    token_ids: Optional[List[int]] = None
+
+def _locate_chunks(buffer: str, chunks: List[str]) -> List[int]:
+    """
+    Find the start offset of each split chunk in the buffer it was split from.
+    """
+    offsets = []
+    search_from = 0
+    for chunk in chunks:
+        index = buffer.find(chunk, search_from)
+        if index == -1:
+            index = offsets[-1] if offsets else 0
+        offsets.append(index)
+        search_from = max(index + 1, index + len(chunk) - CHUNK_OVERLAP)
+    return offsets
+
+class CharacterChunker:
+    """
+    Fixed-size character chunks from RecursiveCharacterTextSplitter.
+    """
+
+    name = "chars"
+    window_chars = CHUNK_SIZE * SPLIT_WINDOW_CHUNKS
+
+    def __init__(self):
+        # Only the character chunker needs langchain
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_function=len,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+
+    def split(self, text: str) -> List[Chunk]:
+        chunks = self.text_splitter.split_text(text)
+        return [Chunk(chunk, offset) for chunk, offset in zip(chunks, _locate_chunks(text, chunks))]
+
+    def get_stats(self) -> dict:
+        return {"chunker": self.name, "chunk_chars": CHUNK_SIZE, "overlap_chars": CHUNK_OVERLAP}
+
+class TokenChunker:
+    """
+    Chunks measured in the embedding model's own word pieces. Every chunk fills the model's input up
+    to max_tokens (special tokens included), so nothing is truncated at embedding time, and the ids
+    are kept with the chunk so the embedder does not tokenize the text a second time.
+    Chunks only start and end on word boundaries (sentence boundaries with sentence packing), so the
+    ids equal those a fresh tokenization of the chunk text would produce.
+    """
+
+    name = "tokens"
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 sentence_packing: bool = SENTENCE_PACKING):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.budget = max_tokens - tokenizer.num_special_tokens_to_add(pair=False)
+        if self.budget <= 0:
+            raise ValueError(f"Chunk size of {max_tokens} tokens leaves no room for text")
+        self.overlap_tokens = min(overlap_tokens, self.budget // 2)
+        self.sentence_packing = sentence_packing
+        self.window_chars = self.budget * CHARS_PER_TOKEN * SPLIT_WINDOW_CHUNKS
+
+    def _sentence_starts(self, text: str, offsets: List[tuple], word_starts: List[int]) -> List[int]:
+        """
+        Token indices at which a sentence begins, a subset of word_starts.
+        """
+        boundaries = [match.end() for match in SENTENCE_END.finditer(text)]
+        token_starts = [offsets[index][0] for index in word_starts]
+        starts = [0]
+        for boundary in boundaries:
+            position = bisect_left(token_starts, boundary)
+            if position < len(word_starts) and word_starts[position] > starts[-1]:
+                starts.append(word_starts[position])
+        return starts
+
+    @staticmethod
+    def _last_cut(cuts: List[int], low: int, high: int) -> Optional[int]:
+        # Largest cut in (low, high]
+        position = bisect_right(cuts, high) - 1
+        return cuts[position] if position >= 0 and cuts[position] > low else None
+
+    @staticmethod
+    def _first_cut(cuts: List[int], low: int, high: int) -> Optional[int]:
+        # Smallest cut in [low, high)
+        position = bisect_left(cuts, low)
+        return cuts[position] if position < len(cuts) and cuts[position] < high else None
+
+    def split(self, text: str) -> List[Chunk]:
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        ids = encoding["input_ids"]
+        offsets = encoding["offset_mapping"]
+        if not ids:
+            return []
+        word_ids = encoding.word_ids()
+        word_starts = [index for index in range(len(ids)) if index == 0 or word_ids[index] != word_ids[index - 1]]
+        cuts = self._sentence_starts(text, offsets, word_starts) if self.sentence_packing else word_starts
+        cut_set = set(cuts)
+
+        chunks = []
+        start, total = 0, len(ids)
+        while start < total:
+            limit = start + self.budget
+            if limit >= total:
+                end = total
+            else:
+                # Prefer a sentence (or word) boundary; a single word longer than the budget is cut hard
+                end = self._last_cut(cuts, start, limit) or self._last_cut(word_starts, start, limit) or limit
+            chunks.append(Chunk(text[offsets[start][0]:offsets[end - 1][1]], offsets[start][0], ids[start:end]))
+            if end >= total:
+                break
+            # The next chunk repeats up to overlap_tokens from the end of this one: whole sentences
+            # when this chunk ended on a sentence boundary and a sentence fits, whole words otherwise
+            low = max(end - self.overlap_tokens, start + 1)
+            sentence_start = self._first_cut(cuts, low, end) if end in cut_set else None
+            start = sentence_start or self._first_cut(word_starts, low, end) or end
+        return chunks
+
+    def get_stats(self) -> dict:
+        return {
+            "chunker": self.name,
+            "max_tokens": self.max_tokens,
+            "overlap_tokens": self.overlap_tokens,
+            "sentence_packing": self.sentence_packing,
+        }
+
+def create_chunker(embeddings):
+    """
+    The configured chunker for an embeddings object. Token chunking needs the model's fast tokenizer
+    (exposed by LazyEmbeddings), so other embeddings and slow tokenizers get the character chunker.
+    """
+    if CHUNKER == "tokens":
+        tokenizer = embeddings.get_tokenizer() if hasattr(embeddings, "get_tokenizer") else None
+        if tokenizer is not None:
+            max_tokens = CHUNK_TOKENS or embeddings.max_seq_length
+            chunker = TokenChunker(tokenizer, min(max_tokens, embeddings.max_seq_length))
+            logger.info(f"Chunking by tokens: {chunker.get_stats()}")
+            return chunker
+        logger.warning("Embedding model has no fast tokenizer, chunking by characters")
+    elif CHUNKER != "chars":
+        raise ValueError(f"Unknown RAG_CHUNKER: {CHUNKER}")
+    return CharacterChunker()
@@ -0,0 +1,292 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import json
+import os
+import shutil
+import threading
+
+# Chunk columns of a snapshot directory
+CHUNK_TEXT_FILE = "chunk_text.u8"
+CHUNK_ENDS_FILE = "chunk_ends.i64"
+CHUNK_FILE_IDS_FILE = "chunk_files.i64"
+CHUNK_PAGES_FILE = "chunk_pages.i32"
+CHUNK_LIVE_FILE = "chunk_live.npy"
+FILE_NAMES_FILE = "file_names.json"
+
+def save_array(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+def load_array(path: str, writable: bool = False) -> np.ndarray:
+    """
+    Memory-map a saved array. Writable maps are copy-on-write: pages are shared with the other
+    processes mapping the file until this process changes them, and the file itself never changes.
+    """
+    return np.load(path, mmap_mode="c" if writable else "r")
+
+class ColumnFile:
+    """
+    Append-only array of fixed-width rows, stored with each snapshot. Rows up to self.rows come from
+    the memory-mapped file of the snapshot the owner was loaded from (or last saved to); rows
+    appended since are held in memory until the next snapshot writes them. Rows never change once
+    written, so a new snapshot hard-links the previous snapshot's file and appends its new rows,
+    and snapshots that readers still serve only ever map their own row count.
+    """
+
+    def __init__(self, dtype, width: int = 1, path: Optional[str] = None, rows: int = 0):
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.row_bytes = self.dtype.itemsize * width
+        self.path = path
+        self.rows = rows
+        self._mapped = self._map(path, rows)
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+
+    def _shape(self, rows: int) -> tuple:
+        return (rows, self.width) if self.width > 1 else (rows,)
+
+    def _map(self, path: Optional[str], rows: int) -> Optional[np.memmap]:
+        return np.memmap(path, dtype=self.dtype, mode="r", shape=self._shape(rows)) if rows else None
+
+    @property
+    def total_rows(self) -> int:
+        return self.rows + self._pending_rows
+
+    def append(self, first_row: int, values: np.ndarray):
+        """
+        Add rows starting at first_row, which must be the current end of the column.
+        """
+        array = np.ascontiguousarray(values, dtype=self.dtype).reshape(self._shape(-1))
+        with self._lock:
+            if first_row != self.total_rows:
+                raise ValueError(f"Column holds {self.total_rows} rows, cannot append at {first_row}")
+            self._pending.append(array)
+            self._pending_rows += len(array)
+
+    def replace(self, values: np.ndarray):
+        """
+        Replace every row (compaction). The next write() writes the whole column instead of linking.
+        """
+        array = np.ascontiguousarray(values, dtype=self.dtype).reshape(self._shape(-1))
+        with self._lock:
+            self._mapped = None
+            self.path = None
+            self.rows = 0
+            self._pending = [array]
+            self._pending_rows = len(array)
+
+    def _pending_array(self) -> np.ndarray:
+        if len(self._pending) > 1:
+            self._pending = [np.concatenate(self._pending)]
+        return self._pending[0] if self._pending else np.empty(self._shape(0), dtype=self.dtype)
+
+    def get(self, ids: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Rows at the given positions, or None if any of them is past the end.
+        """
+        with self._lock:
+            if not len(ids) or ids.max() >= self.total_rows:
+                return None
+            values = np.empty(self._shape(len(ids)), dtype=self.dtype)
+            in_file = ids < self.rows
+            if in_file.any():
+                values[in_file] = self._mapped[ids[in_file]]
+            if not in_file.all():
+                values[~in_file] = self._pending_array()[ids[~in_file] - self.rows]
+            return values
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """
+        Rows start to end as one array; a view of the mapped file when they all lie in it.
+        """
+        with self._lock:
+            if end <= start:
+                return np.empty(self._shape(0), dtype=self.dtype)
+            if end <= self.rows:
+                return self._mapped[start:end]
+            pending = self._pending_array()[max(0, start - self.rows):end - self.rows]
+            if start >= self.rows:
+                return pending
+            return np.concatenate([self._mapped[start:self.rows], pending])
+
+    def write(self, path: str):
+        """
+        Write every row to path, a file in a new snapshot directory, and fsync it. Runs under the
+        index write lock, so no rows are appended meanwhile; searches keep reading.
+        """
+        with self._lock:
+            base_path, rows, pending = self.path, self.rows, self._pending_array()
+        if rows:
+            try:
+                os.link(base_path, path)
+            except OSError:
+                # Filesystems without hard links get a full copy
+                shutil.copyfile(base_path, path)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            # Drops rows a crashed writer appended past the previous snapshot
+            os.ftruncate(fd, rows * self.row_bytes)
+            if len(pending):
+                os.pwrite(fd, pending.tobytes(), rows * self.row_bytes)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def rebase(self, path: str):
+        """
+        Serve every row from path, the file write() just produced, and drop the in-memory rows.
+        """
+        with self._lock:
+            rows = self.total_rows
+            self._mapped = self._map(path, rows)
+            self.path = path
+            self.rows = rows
+            self._pending = []
+            self._pending_rows = 0
+
+class ChunkStore:
+    """
+    Chunk texts and metadata addressed by vector id, kept in flat columns that snapshots
+    memory-map instead of unpickling: the utf-8 text of every chunk back to back, the end offset of
+    each chunk in it, and each chunk's file id and page (-1 for none). filename and file_path are
+    kept once per file. Ids are allocated in order, so row i belongs to vector id i; removed chunks
+    are masked out of live until a compaction drops their text.
+    """
+
+    def __init__(self, text: ColumnFile = None, ends: ColumnFile = None, file_ids: ColumnFile = None,
+                 pages: ColumnFile = None, live: np.ndarray = None, files: Dict[int, Tuple[str, str]] = None,
+                 live_count: int = None):
+        self.text = text or ColumnFile(np.uint8)
+        self.ends = ends or ColumnFile(np.int64)
+        self.file_ids = file_ids or ColumnFile(np.int64)
+        self.pages = pages or ColumnFile(np.int32)
+        self.live = live if live is not None else np.zeros(1024, dtype=bool)
+        self.live_count = live_count if live_count is not None else int(np.count_nonzero(self.live))
+        self.files: Dict[int, Tuple[str, str]] = files or {}
+
+    @property
+    def rows(self) -> int:
+        return self.ends.total_rows
+
+    def _grow(self, rows: int):
+        if rows <= len(self.live):
+            return
+        size = max(rows, len(self.live) * 2)
+        self.live = np.concatenate([self.live, np.zeros(size - len(self.live), dtype=bool)])
+
+    def add(self, first_id: int, texts: List[str], metadatas: List[dict]):
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+        start = self.text.total_rows
+        self.text.append(start, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        self.ends.append(first_id, start + np.cumsum(lengths))
+        file_ids = [metadata.get("file_id") for metadata in metadatas]
+        self.file_ids.append(first_id, np.asarray([-1 if file_id is None else file_id for file_id in file_ids], dtype=np.int64))
+        self.pages.append(first_id, np.asarray([metadata.get("page", -1) for metadata in metadatas], dtype=np.int32))
+        for file_id, metadata in zip(file_ids, metadatas):
+            if file_id is not None:
+                self.files[file_id] = (metadata.get("filename"), metadata.get("file_path"))
+        self._grow(first_id + len(texts))
+        self.live[first_id:first_id + len(texts)] = True
+        self.live_count += len(texts)
+
+    def remove(self, vector_ids: Iterable[int]) -> List[int]:
+        """
+        Mask chunks out and return the ids that were live.
+        """
+        removed = []
+        for vector_id in vector_ids:
+            if 0 <= vector_id < self.rows and self.live[vector_id]:
+                self.live[vector_id] = False
+                removed.append(vector_id)
+        self.live_count -= len(removed)
+        return removed
+
+    def live_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.live[:self.rows])
+
+    def get(self, vector_id: int) -> Optional[Tuple[str, dict]]:
+        """
+        (text, metadata) of a live chunk, or None.
+        """
+        if not 0 <= vector_id < self.rows or not self.live[vector_id]:
+            return None
+        bounds = self.ends.read(max(0, vector_id - 1), vector_id + 1)
+        start, end = (int(bounds[0]), int(bounds[1])) if vector_id else (0, int(bounds[0]))
+        text = self.text.read(start, end).tobytes().decode("utf-8")
+        file_id = int(self.file_ids.read(vector_id, vector_id + 1)[0])
+        page = int(self.pages.read(vector_id, vector_id + 1)[0])
+        filename, file_path = self.files.get(file_id, (None, None))
+        metadata = {"filename": filename, "file_path": file_path, "file_id": file_id if file_id >= 0 else None}
+        if page >= 0:
+            metadata["page"] = page
+        return text, metadata
+
+    def compacted(self) -> Tuple[np.ndarray, np.ndarray, Dict[int, Tuple[str, str]]]:
+        """
+        The text and ends columns without the text of removed chunks, and the files some live chunk
+        belongs to. Only reads the store, so searches can run meanwhile; apply_compaction swaps them in.
+        """
+        rows = self.rows
+        ends = self.ends.read(0, rows)
+        lengths = np.diff(ends, prepend=0)
+        keep = self.live[:rows]
+        text = self.text.read(0, self.text.total_rows)
+        kept_text = text[np.repeat(keep, lengths)]
+        lengths = np.where(keep, lengths, 0)
+        live_files = set(np.unique(self.file_ids.read(0, rows)[keep]).tolist())
+        files = {file_id: names for file_id, names in self.files.items() if file_id in live_files}
+        return kept_text, np.cumsum(lengths), files
+
+    def apply_compaction(self, compacted: Tuple[np.ndarray, np.ndarray, Dict[int, Tuple[str, str]]]) -> int:
+        """
+        Swap in the columns compacted() built; no chunk may be added or removed in between. Returns
+        the number of bytes freed. The next snapshot rewrites the text columns in full.
+        """
+        text, ends, files = compacted
+        freed = self.text.total_rows - len(text)
+        self.text.replace(text)
+        self.ends.replace(ends)
+        self.files = files
+        return freed
+
+    def write(self, directory: str):
+        self.text.write(os.path.join(directory, CHUNK_TEXT_FILE))
+        self.ends.write(os.path.join(directory, CHUNK_ENDS_FILE))
+        self.file_ids.write(os.path.join(directory, CHUNK_FILE_IDS_FILE))
+        self.pages.write(os.path.join(directory, CHUNK_PAGES_FILE))
+        save_array(os.path.join(directory, CHUNK_LIVE_FILE), self.live[:self.rows])
+        with open(os.path.join(directory, FILE_NAMES_FILE), "w", encoding="utf-8") as f:
+            json.dump({str(file_id): list(names) for file_id, names in self.files.items()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rebase(self, directory: str):
+        """
+        Serve the columns from the snapshot write() just produced. live stays in memory.
+        """
+        self.text.rebase(os.path.join(directory, CHUNK_TEXT_FILE))
+        self.ends.rebase(os.path.join(directory, CHUNK_ENDS_FILE))
+        self.file_ids.rebase(os.path.join(directory, CHUNK_FILE_IDS_FILE))
+        self.pages.rebase(os.path.join(directory, CHUNK_PAGES_FILE))
+
+    def get_stats(self) -> dict:
+        return {"chunks": self.rows, "live_chunks": self.live_count, "text_bytes": self.text.total_rows, "files": len(self.files)}
+
+    @classmethod
+    def load(cls, directory: str, rows: int, text_bytes: int, live_count: int = None) -> "ChunkStore":
+        with open(os.path.join(directory, FILE_NAMES_FILE), "r", encoding="utf-8") as f:
+            files = {int(file_id): tuple(names) for file_id, names in json.load(f).items()}
+        return cls(
+            text=ColumnFile(np.uint8, path=os.path.join(directory, CHUNK_TEXT_FILE), rows=text_bytes),
+            ends=ColumnFile(np.int64, path=os.path.join(directory, CHUNK_ENDS_FILE), rows=rows),
+            file_ids=ColumnFile(np.int64, path=os.path.join(directory, CHUNK_FILE_IDS_FILE), rows=rows),
+            pages=ColumnFile(np.int32, path=os.path.join(directory, CHUNK_PAGES_FILE), rows=rows),
+            live=load_array(os.path.join(directory, CHUNK_LIVE_FILE), writable=True),
+            files=files,
+            live_count=live_count,
+        )
@@ -0,0 +1,192 @@
+from typing import List, Optional, Tuple
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import logging
+from app.rag.rag_store import INDEX_DIR
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Several processes (uvicorn workers, or replicas sharing INDEX_DIR) serve one index. Exactly one of
+# them is the writer, elected by an exclusive lock on INDEX_DIR/writer.lock; the others are readers
+# that memory-map the latest snapshot and hand uploads and deletions to the writer through SPOOL_DIR.
+# RAG_ROLE=auto takes the lock if it is free; writer/reader pin the role.
+RAG_ROLE = os.getenv("RAG_ROLE", "auto").lower()
+SNAPSHOT_POLL_SECONDS = float(os.getenv("RAG_SNAPSHOT_POLL_SECONDS", "1"))
+SPOOL_DIR = os.getenv("RAG_SPOOL_DIR", os.path.join(INDEX_DIR, "spool"))
+WRITER_LOCK_FILE = "writer.lock"
+
+def write_json_atomic(path: str, data: dict):
+    """
+    Replace a JSON file atomically so concurrent readers never see a partial write.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+class WriterLock:
+    """
+    Exclusive, non-blocking flock on a file in the index directory. The kernel releases it when the
+    holding process exits, so a reader can take over after the writer dies.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR):
+        self.path = os.path.join(index_dir, WRITER_LOCK_FILE)
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+writer_lock = WriterLock()
+_role: Optional[str] = None
+_role_lock = threading.Lock()
+
+def is_writer() -> bool:
+    """
+    Whether this process owns the index. Decided on first call; in auto mode a reader becomes the
+    writer later only through try_promote().
+    """
+    global _role
+    if _role is None:
+        with _role_lock:
+            if _role is None:
+                if RAG_ROLE == "reader":
+                    _role = "reader"
+                elif writer_lock.try_acquire():
+                    _role = "writer"
+                elif RAG_ROLE == "writer":
+                    raise RuntimeError(f"RAG_ROLE=writer but another process holds {writer_lock.path}")
+                else:
+                    _role = "reader"
+                logger.info(f"Index role: {_role} (pid {os.getpid()})")
+    return _role == "writer"
+
+def try_promote() -> bool:
+    """
+    Take over as writer if the previous writer has gone away. Returns True on promotion.
+    """
+    global _role
+    if RAG_ROLE == "reader" or is_writer():
+        return False
+    with _role_lock:
+        if not writer_lock.try_acquire():
+            return False
+        _role = "writer"
+    logger.info(f"Promoted to index writer (pid {os.getpid()})")
+    return True
+
+def get_role() -> str:
+    return "writer" if is_writer() else "reader"
+
+class JobSpool:
+    """
+    Directory-backed queue of index operations for the writer, plus job status files that every
+    process can read. pending/ holds submitted operations, claimed/ the ones the writer has taken
+    (moved back to pending/ if it restarts before finishing), status/ one JSON record per job.
+    """
+
+    def __init__(self, directory: str = SPOOL_DIR):
+        self.directory = directory
+        self.pending_dir = os.path.join(directory, "pending")
+        self.claimed_dir = os.path.join(directory, "claimed")
+        self.status_dir = os.path.join(directory, "status")
+        for path in (self.pending_dir, self.claimed_dir, self.status_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def submit(self, operation: str, job: dict, **payload):
+        """
+        Queue an operation ("ingest", "remove" or "reset") for the writer.
+        """
+        self.write_status(job)
+        name = f"{job['created_at']}-{job['job_id']}.json".replace(":", "")
+        write_json_atomic(os.path.join(self.pending_dir, name), {"operation": operation, "job": job, **payload})
+
+    def claim(self) -> List[Tuple[str, dict]]:
+        """
+        Take every pending operation in submission order. Only the writer calls this.
+        """
+        claimed = []
+        for name in sorted(os.listdir(self.pending_dir)):
+            if name.startswith(".tmp-"):
+                continue
+            path = os.path.join(self.claimed_dir, name)
+            try:
+                os.rename(os.path.join(self.pending_dir, name), path)
+            except FileNotFoundError:
+                continue
+            entry = read_json(path)
+            if entry is not None:
+                claimed.append((path, entry))
+        return claimed
+
+    def done(self, claimed_path: str):
+        if os.path.exists(claimed_path):
+            os.remove(claimed_path)
+
+    def recover(self):
+        """
+        Requeue operations claimed by a writer that exited before finishing them.
+        """
+        for name in os.listdir(self.claimed_dir):
+            os.rename(os.path.join(self.claimed_dir, name), os.path.join(self.pending_dir, name))
+            logger.debug(f"Requeued unfinished spooled operation {name}")
+
+    def write_status(self, job: dict):
+        write_json_atomic(os.path.join(self.status_dir, f"{job['job_id']}.json"), job)
+
+    def read_status(self, job_id: str) -> Optional[dict]:
+        if not job_id.isalnum():
+            return None
+        return read_json(os.path.join(self.status_dir, f"{job_id}.json"))
+
+    def list_statuses(self) -> List[dict]:
+        statuses = [read_json(os.path.join(self.status_dir, name)) for name in os.listdir(self.status_dir)
+                    if name.endswith(".json") and not name.startswith(".tmp-")]
+        return sorted((job for job in statuses if job), key=lambda job: job["created_at"])
+
+    def prune(self, keep: int):
+        """
+        Delete the status files of the oldest finished jobs beyond the newest keep.
+        """
+        finished = [job for job in self.list_statuses() if job["status"] in ("done", "failed", "cancelled")]
+        for job in finished[:max(0, len(finished) - keep)]:
+            path = os.path.join(self.status_dir, f"{job['job_id']}.json")
+            if os.path.exists(path):
+                os.remove(path)
+
+spool = JobSpool()
@@ -0,0 +1,176 @@
+from langchain_core.embeddings import Embeddings
+from typing import Dict, List, Optional
+import numpy as np
+import hashlib
+import json
+import os
+import re
+import threading
+import logging
+from app.rag.rag_store import INDEX_DIR
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_DIR = os.getenv("RAG_EMBED_CACHE_DIR", os.path.join(INDEX_DIR, "embedding_cache"))
+EMBED_CACHE_ENABLED = os.getenv("RAG_EMBED_CACHE", "true").lower() == "true"
+
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+DIGEST_SIZE = 32
+
+class EmbeddingCache:
+    """
+    Append-only on-disk cache of chunk embeddings for one model. vectors.f32 holds float32 rows and is
+    read through a memory map; keys.bin holds the sha256 of each row's chunk text, in row order.
+    Rows are written before their keys, so a crash can only leave unreferenced rows, which the index
+    writer truncates on its next load. A read_only cache (reindex workers) only maps complete rows and
+    never modifies the files.
+    """
+
+    def __init__(self, directory: str, model_name: str, read_only: bool = False):
+        self.model_name = model_name
+        self.read_only = read_only
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.dimension: Optional[int] = None
+        self.rows: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        meta_path = self._path(META_FILE)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.dimension = json.load(f)["dimension"]
+        if not os.path.exists(self._path(KEYS_FILE)) or not os.path.exists(self._path(VECTORS_FILE)):
+            return
+        with open(self._path(KEYS_FILE), "rb") as f:
+            keys = f.read()
+        row_bytes = self.dimension * 4
+        row_count = min(len(keys) // DIGEST_SIZE, os.path.getsize(self._path(VECTORS_FILE)) // row_bytes)
+        if not self.read_only:
+            # Drop anything past the last complete row/key pair
+            os.truncate(self._path(KEYS_FILE), row_count * DIGEST_SIZE)
+            os.truncate(self._path(VECTORS_FILE), row_count * row_bytes)
+        self.rows = {keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]: i for i in range(row_count)}
+        logger.debug(f"Loaded embedding cache for {self.model_name} with {row_count} rows")
+
+    def _digest(self, text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _mapped_vectors(self) -> np.ndarray:
+        """
+        Memory map of the vectors file, re-mapped when rows were appended since the last map.
+        """
+        if self._vectors is None or len(self._vectors) < len(self.rows):
+            self._vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r",
+                                      shape=(len(self.rows), self.dimension))
+        return self._vectors
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        digests = [self._digest(text) for text in texts]
+        with self._lock:
+            rows = [self.rows.get(digest) for digest in digests]
+            found = [row for row in rows if row is not None]
+            self.hits += len(found)
+            self.misses += len(rows) - len(found)
+            if not found:
+                return [None] * len(texts)
+            vectors = self._mapped_vectors()
+            return [vectors[row].tolist() if row is not None else None for row in rows]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        if not texts:
+            return
+        if self.read_only:
+            raise RuntimeError(f"Embedding cache for {self.model_name} is read-only")
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dimension is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.dimension = array.shape[1]
+                with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dimension": self.dimension}, f)
+            new_digests = []
+            new_rows = []
+            for text, vector in zip(texts, array):
+                digest = self._digest(text)
+                if digest not in self.rows and digest not in new_digests:
+                    new_digests.append(digest)
+                    new_rows.append(vector)
+            if not new_rows:
+                return
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(np.stack(new_rows).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._path(KEYS_FILE), "ab") as f:
+                f.write(b"".join(new_digests))
+                f.flush()
+                os.fsync(f.fileno())
+            for digest in new_digests:
+                self.rows[digest] = len(self.rows)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_name": self.model_name,
+                "rows": len(self.rows),
+                "dimension": self.dimension,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only runs the model on chunks missing from the EmbeddingCache.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, None)
+
+    def embed_chunks(self, texts: List[str], token_ids: List[List[int]]) -> List[List[float]]:
+        """
+        Like embed_documents, but chunks missing from the cache are embedded from the chunker's
+        token ids instead of being tokenized again.
+        """
+        return self._embed(texts, token_ids)
+
+    def _embed(self, texts: List[str], token_ids: Optional[List[List[int]]]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct missing text once
+            first_index = {}
+            for i in missing:
+                first_index.setdefault(texts[i], i)
+            missing_texts = list(first_index)
+            if token_ids is not None and hasattr(self.embeddings, "embed_chunks"):
+                missing_vectors = self.embeddings.embed_chunks(missing_texts, [token_ids[first_index[text]] for text in missing_texts])
+            else:
+                missing_vectors = self.embeddings.embed_documents(missing_texts)
+            embedded = dict(zip(missing_texts, missing_vectors))
+            self.cache.put_many(missing_texts, missing_vectors)
+            for i in missing:
+                vectors[i] = embedded[texts[i]]
+        logger.debug("Embedded %d of %d chunks, %d from cache", len(missing), len(texts), len(texts) - len(missing))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,92 @@
+from typing import Iterator
+import json
+import os
+import re
+import requests
+import logging
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Answer generator backend: "extractive" (deterministic, no model) or "http" (local model server)
+GENERATOR_BACKEND = os.getenv("RAG_GENERATOR", "extractive").lower()
+GENERATOR_URL = os.getenv("RAG_GENERATOR_URL", "http://localhost:11434/api/generate")
+GENERATOR_MODEL = os.getenv("RAG_GENERATOR_MODEL", "llama3.2")
+GENERATOR_TIMEOUT = float(os.getenv("RAG_GENERATOR_TIMEOUT", "120"))
+EXTRACTIVE_MAX_CHARS = 200
+
+def build_prompt(query: str, context: str) -> str:
+    return f"""Answer the question using only the context below. If the answer is not in the context, say so.
+
+Context:
+{context}
+
+Question: {query}
+Answer:"""
+
+class AnswerGenerator:
+    """
+    Interface for answer generation backends. stream() yields the answer in pieces as they are
+    produced; closing the iterator early must release any resources held by the backend.
+    """
+
+    name = "base"
+
+    def stream(self, query: str, context: str) -> Iterator[str]:
+        raise NotImplementedError
+
+class ExtractiveGenerator(AnswerGenerator):
+    """
+    Deterministic stand-in that streams the start of the retrieved context word by word. Used for
+    tests and deployments without a model server.
+    """
+
+    name = "extractive"
+
+    def stream(self, query: str, context: str) -> Iterator[str]:
+        response = f"Based on the retrieved context:\n{context[:EXTRACTIVE_MAX_CHARS]} "
+        yield from re.findall(r"\S+\s*|\s+", response)
+
+class HTTPGenerator(AnswerGenerator):
+    """
+    Streams tokens from a local model server speaking the Ollama /api/generate protocol
+    (one JSON object per line with a "response" piece and a "done" flag).
+    """
+
+    name = "http"
+
+    def __init__(self, url: str = GENERATOR_URL, model: str = GENERATOR_MODEL, timeout: float = GENERATOR_TIMEOUT):
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def stream(self, query: str, context: str) -> Iterator[str]:
+        payload = {"model": self.model, "prompt": build_prompt(query, context), "stream": True}
+        with self.session.post(self.url, json=payload, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Generator error: {data['error']}")
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+
+GENERATORS = {
+    ExtractiveGenerator.name: ExtractiveGenerator,
+    HTTPGenerator.name: HTTPGenerator,
+}
+
+def create_generator(backend: str = GENERATOR_BACKEND) -> AnswerGenerator:
+    if backend not in GENERATORS:
+        raise ValueError(f"Unknown generator backend: {backend}")
+    logger.debug(f"Using {backend} answer generator")
+    return GENERATORS[backend]()
+
+generator = create_generator()
@@ -0,0 +1,280 @@
+from typing import Dict, List, Optional
+import numpy as np
+import faiss
+import math
+import os
+import time
+import logging
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Index type to switch to once the store holds PROMOTE_AT live vectors: flat, ivf_flat, hnsw or ivf_pq
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat").lower()
+PROMOTE_AT = int(os.getenv("RAG_INDEX_PROMOTE_AT", "50000"))
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))  # 0 picks 4 * sqrt(n)
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+PQ_M = int(os.getenv("RAG_PQ_M", "48"))
+PQ_NBITS = int(os.getenv("RAG_PQ_NBITS", "8"))
+
+# Vector storage precision for flat, ivf_flat and hnsw indexes: float32, float16 or int8 (scalar
+# quantized). int8 needs training data, so the store stays float32 until it holds QUANTIZE_AT vectors.
+VECTOR_PRECISION = os.getenv("RAG_VECTOR_PRECISION", "float32").lower()
+QUANTIZE_AT = int(os.getenv("RAG_QUANTIZE_AT", "1000"))
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+PRECISIONS = ("float32", "float16", "int8")
+
+def _qtype(precision: str) -> Optional[int]:
+    if precision == "float32":
+        return None
+    if precision == "float16":
+        return faiss.ScalarQuantizer.QT_fp16
+    if precision == "int8":
+        return faiss.ScalarQuantizer.QT_8bit
+    raise ValueError(f"Unknown vector precision: {precision}")
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """
+    The index doing the actual search, with any IndexIDMap wrapper removed.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def index_type_of(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def precision_of(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if not isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float32"
+    return "float16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+
+def is_target_index(index: faiss.Index) -> bool:
+    """
+    True when the index already has the configured type and precision.
+    """
+    if index_type_of(index) != INDEX_TYPE:
+        return False
+    return INDEX_TYPE == "ivf_pq" or precision_of(index) == VECTOR_PRECISION
+
+def promotion_threshold(index: faiss.Index) -> int:
+    """
+    Live vector count at which the store should switch to the configured index.
+    """
+    return PROMOTE_AT if index_type_of(index) != INDEX_TYPE else QUANTIZE_AT
+
+def is_exact(index: faiss.Index) -> bool:
+    """
+    True for brute-force indexes (flat, including scalar-quantized flat).
+    """
+    return isinstance(base_index(index), (faiss.IndexFlat, faiss.IndexScalarQuantizer))
+
+def is_ivf(index: faiss.Index) -> bool:
+    return isinstance(base_index(index), faiss.IndexIVF)
+
+def _nlist_for(count: int) -> int:
+    if IVF_NLIST:
+        return IVF_NLIST
+    return int(min(65536, max(16, 4 * math.sqrt(count))))
+
+def build_index(index_type: str, dimension: int, training_vectors: Optional[np.ndarray] = None,
+                metric: int = faiss.METRIC_L2, precision: str = VECTOR_PRECISION) -> faiss.Index:
+    """
+    Create an empty index of the given type and storage precision that accepts add_with_ids.
+    IVF indexes take ids natively (with a hashtable direct map so vectors can be reconstructed and
+    removed by id); flat and HNSW indexes are wrapped in IndexIDMap2. IVF and int8 indexes are
+    trained on training_vectors.
+    """
+    qtype = _qtype(precision) if index_type != "ivf_pq" else None
+    needs_training = index_type in ("ivf_flat", "ivf_pq") or precision == "int8"
+    if needs_training and (training_vectors is None or len(training_vectors) == 0):
+        raise ValueError(f"{index_type}/{precision} index needs training vectors")
+    if training_vectors is not None:
+        training_vectors = np.ascontiguousarray(training_vectors, dtype=np.float32)
+
+    if index_type == "flat":
+        if qtype is None:
+            return faiss.IndexIDMap2(faiss.IndexFlat(dimension, metric))
+        index = faiss.IndexScalarQuantizer(dimension, qtype, metric)
+        if not index.is_trained:
+            index.train(training_vectors)
+        return faiss.IndexIDMap2(index)
+    if index_type == "hnsw":
+        if qtype is None:
+            hnsw = faiss.IndexHNSWFlat(dimension, HNSW_M, metric)
+        else:
+            hnsw = faiss.IndexHNSWSQ(dimension, qtype, HNSW_M, metric)
+            if not hnsw.is_trained:
+                hnsw.train(training_vectors)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+        return faiss.IndexIDMap2(hnsw)
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        raise ValueError(f"Unknown index type: {index_type}")
+    nlist = min(_nlist_for(len(training_vectors)), len(training_vectors))
+    quantizer = faiss.IndexFlat(dimension, metric)
+    if index_type == "ivf_flat" and qtype is None:
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+    elif index_type == "ivf_flat":
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, qtype, metric)
+    else:
+        if dimension % PQ_M:
+            raise ValueError(f"RAG_PQ_M={PQ_M} must divide the vector dimension {dimension}")
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, PQ_M, PQ_NBITS, metric)
+    index.own_fields = True
+    quantizer.this.disown()
+    index.train(training_vectors)
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    index.nprobe = IVF_NPROBE
+    return index
+
+def configure_search(index: faiss.Index):
+    """
+    Apply the configured nprobe / efSearch to a loaded index.
+    """
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = IVF_NPROBE
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+
+def search_params(index: faiss.Index, selector: Optional[faiss.IDSelector] = None) -> faiss.SearchParameters:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def index_ids(index: faiss.Index) -> np.ndarray:
+    """
+    All ids stored in the index, live or dead.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        invlists = base.invlists
+        parts = [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(base.nlist) if invlists.list_size(list_no)
+        ]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+def supports_remove(index: faiss.Index) -> bool:
+    return not isinstance(base_index(index), faiss.IndexHNSW)
+
+def rebuild_index(index: faiss.Index, index_type: str, keep_ids: np.ndarray, precision: str = VECTOR_PRECISION) -> faiss.Index:
+    """
+    Build a fresh index of index_type/precision holding only keep_ids, reconstructed from the given index.
+    """
+    vectors = index.reconstruct_batch(keep_ids) if len(keep_ids) else np.empty((0, index.d), dtype=np.float32)
+    new_index = build_index(index_type, index.d, vectors, index.metric_type, precision)
+    if len(keep_ids):
+        new_index.add_with_ids(vectors, keep_ids)
+    return new_index
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10, index_types: List[str] = INDEX_TYPES,
+                  precisions: List[str] = PRECISIONS, rescore_factor: int = 4) -> Dict[str, dict]:
+    """
+    Compare each index type and storage precision against exact float32 flat search on the same
+    vectors: recall@k, mean query latency, build time, serialized size and memory saved. For
+    reduced-precision indexes recall is also reported after re-scoring the top rescore_factor * k
+    candidates against exact float32 copies, as searches do with RAG_RESCORE.
+    """
+    from app.rag.rag_store import RawVectorFile
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    raw_vectors = RawVectorFile(vectors.shape[1])
+    raw_vectors.append(0, vectors)
+
+    specs = [(index_type, precision) for index_type in index_types if index_type != "ivf_pq" for precision in precisions]
+    specs += [("ivf_pq", "pq")] if "ivf_pq" in index_types else []
+    report = {}
+    for index_type, precision in specs:
+        name = f"{index_type}/{precision}"
+        started = time.perf_counter()
+        index = build_index(index_type, vectors.shape[1], vectors, precision=precision)
+        index.add_with_ids(vectors, ids)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for query in queries:
+            index.search(query.reshape(1, -1), k)
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        _, found = index.search(queries, k)
+
+        hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+        rescored_recall = None
+        if precision != "float32":
+            _, candidates = index.search(queries, k * rescore_factor)
+            rescored_hits = 0
+            for query, row, row_truth in zip(queries, candidates, truth):
+                row = row[row != -1]
+                exact_vectors = raw_vectors.get(row)
+                if exact_vectors is None:
+                    continue
+                best = row[np.argsort(((exact_vectors - query) ** 2).sum(axis=1))[:k]]
+                rescored_hits += len(set(best) & set(row_truth))
+            rescored_recall = rescored_hits / (len(queries) * k)
+        index_bytes = int(faiss.serialize_index(index).nbytes)
+        report[name] = {
+            "recall_at_k": hits / (len(queries) * k),
+            "recall_at_k_rescored": rescored_recall,
+            "mean_latency_ms": latency_ms,
+            "build_seconds": build_seconds,
+            "index_bytes": index_bytes,
+            "bytes_per_vector": index_bytes / len(vectors),
+            "memory_saved": 1 - index_bytes / max(1, vectors.nbytes),
+        }
+        logger.debug(f"{name}: {report[name]}")
+    return report
+
+# Example Usage
+if __name__ == "__main__":
+    import argparse
+    import json
+    from app.rag.rag_store import RESCORE_FACTOR, load_snapshot
+
+    parser = argparse.ArgumentParser(description="Recall, latency and memory of each index type and precision against exact flat search")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead of the persisted index")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = None if args.synthetic else load_snapshot(mmap=False)[0]
+    if store is not None and store.live_count:
+        live_ids = store.live_ids()
+        corpus = store.index.reconstruct_batch(live_ids)
+    else:
+        corpus = rng.standard_normal((args.synthetic or 20000, 384)).astype(np.float32)
+        corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    # Queries are perturbed corpus vectors, which resembles questions asked about indexed text
+    sample = corpus[rng.integers(0, len(corpus), args.queries)]
+    queries = sample + 0.1 * rng.standard_normal(sample.shape).astype(np.float32)
+    report = recall_report(corpus, queries, args.k, rescore_factor=RESCORE_FACTOR)
+    print(json.dumps({"vectors": len(corpus), "k": args.k, "rescore_factor": RESCORE_FACTOR, "report": report}, indent=2))
@@ -0,0 +1,224 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import os
+import threading
+import time
+import uuid
+import logging
+from app.rag import rag
+from app.rag.rag import IngestCancelled, process_document, remove_document, reset_vector_store, hide_document, reload_snapshot
+from app.rag.rag_cluster import SNAPSHOT_POLL_SECONDS, get_role, is_writer, spool, try_promote
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Ingest worker pool; parsing and embedding run here instead of on the event loop
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", "2"))
+JOB_HISTORY = int(os.getenv("RAG_JOB_HISTORY", "200"))
+# Progress is mirrored to the shared status file at most this often; status changes are written at once
+STATUS_WRITE_INTERVAL = float(os.getenv("RAG_STATUS_WRITE_INTERVAL", "0.5"))
+
+executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+jobs: Dict[str, dict] = {}
+jobs_lock = threading.Lock()
+_status_written: Dict[str, float] = {}
+# Ingests that have not finished yet: job id -> (future, claimed spool path)
+_pending: Dict[str, Tuple[Future, Optional[str]]] = {}
+_sync_thread: Optional[threading.Thread] = None
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _update_job(job_id: str, **fields):
+    with jobs_lock:
+        job = jobs[job_id]
+        job.update(fields)
+        now = time.monotonic()
+        if "status" not in fields and now - _status_written.get(job_id, 0.0) < STATUS_WRITE_INTERVAL:
+            return
+        _status_written[job_id] = now
+        snapshot = dict(job)
+    # Other workers answer job queries from the status files
+    spool.write_status(snapshot)
+
+def _prune_jobs():
+    """
+    Drop the oldest finished jobs once the history exceeds JOB_HISTORY entries.
+    """
+    finished = [job_id for job_id, job in jobs.items() if job["status"] in ("done", "failed", "cancelled")]
+    for job_id in finished[:max(0, len(jobs) - JOB_HISTORY)]:
+        del jobs[job_id]
+        _status_written.pop(job_id, None)
+
+def _run_job(job_id: str, file_path: str, filename: str, file_id: int, claimed_path: Optional[str] = None):
+    _update_job(job_id, status="running", started_at=_now())
+    try:
+        process_document(file_path, filename, None, file_id, progress=lambda **fields: _update_job(job_id, **fields))
+        _update_job(job_id, status="done", finished_at=_now())
+        logger.debug(f"Ingest job {job_id} finished for {filename}")
+    except IngestCancelled as e:
+        _update_job(job_id, status="cancelled", error=str(e), finished_at=_now())
+    except Exception as e:
+        logger.error(f"Ingest job {job_id} failed for {filename}: {str(e)}", exc_info=True)
+        _update_job(job_id, status="failed", error=str(e), finished_at=_now())
+    finally:
+        with jobs_lock:
+            _pending.pop(job_id, None)
+        # A spooled job stays claimed until it finishes, so a writer crash requeues it
+        if claimed_path is not None:
+            spool.done(claimed_path)
+        spool.prune(JOB_HISTORY)
+
+def _new_job(operation: str, **fields) -> dict:
+    return {
+        "job_id": uuid.uuid4().hex,
+        "operation": operation,
+        "file_id": None,
+        "filename": None,
+        "status": "queued",
+        "pages_total": None,
+        "pages_extracted": 0,
+        "chunks_total": None,
+        "chunks_embedded": 0,
+        "indexed": False,
+        "error": None,
+        "created_at": _now(),
+        "started_at": None,
+        "finished_at": None,
+        **fields,
+    }
+
+def _start_ingest(job: dict, file_path: str, claimed_path: Optional[str] = None):
+    with jobs_lock:
+        jobs[job["job_id"]] = job
+        _prune_jobs()
+    spool.write_status(dict(job))
+    with jobs_lock:
+        # _run_job waits for jobs_lock before it starts, so the entry is in place before it is popped
+        future = executor.submit(_run_job, job["job_id"], file_path, job["filename"], job["file_id"], claimed_path)
+        _pending[job["job_id"]] = (future, claimed_path)
+
+def _cancel_queued_ingests(file_id: Optional[int] = None):
+    """
+    Cancel ingests of file_id (of every file if None) that have not started yet. Ingests already
+    running are dropped by process_document when they try to publish.
+    """
+    cancelled = []
+    with jobs_lock:
+        for job_id, (future, claimed_path) in list(_pending.items()):
+            if file_id is not None and jobs[job_id]["file_id"] != file_id:
+                continue
+            if future.cancel():
+                del _pending[job_id]
+                cancelled.append((job_id, claimed_path))
+    for job_id, claimed_path in cancelled:
+        _update_job(job_id, status="cancelled", error="The file was removed before it was ingested", finished_at=_now())
+        if claimed_path is not None:
+            spool.done(claimed_path)
+    if cancelled:
+        logger.debug(f"Cancelled {len(cancelled)} queued ingest jobs")
+
+def submit_ingest_job(file_path: str, filename: str, file_id: int) -> dict:
+    """
+    Queue a document for background ingestion and return its job record. Readers hand the job to
+    the writer process through the spool.
+    """
+    job = _new_job("ingest", file_id=file_id, filename=filename)
+    if is_writer():
+        _start_ingest(job, file_path)
+    else:
+        spool.submit("ingest", job, file_path=file_path)
+    logger.debug(f"Queued ingest job {job['job_id']} for {filename} ({get_role()})")
+    return dict(job)
+
+def request_remove_document(file_id: int):
+    """
+    Remove a file from the index: directly on the writer, via the spool from a reader (which stops
+    serving the file's chunks immediately).
+    """
+    if is_writer():
+        _cancel_queued_ingests(file_id)
+        remove_document(file_id)
+        return
+    hide_document(file_id)
+    spool.submit("remove", _new_job("remove", file_id=file_id))
+
+def request_reset_vector_store():
+    if is_writer():
+        _cancel_queued_ingests()
+        reset_vector_store()
+        return
+    with rag.index_lock.write():
+        rag.file_vector_ids = {}
+        rag.bump_index_version()
+    spool.submit("reset", _new_job("reset"))
+
+def _run_spooled(claimed_path: str, entry: dict):
+    """
+    Execute an operation handed over by a reader. Ingests go to the ingest pool; removals and resets
+    run here, in submission order.
+    """
+    operation, job = entry["operation"], entry["job"]
+    if operation == "ingest":
+        _start_ingest(job, entry["file_path"], claimed_path)
+        return
+    try:
+        job.update(status="running", started_at=_now())
+        if operation == "remove":
+            _cancel_queued_ingests(job["file_id"])
+            remove_document(job["file_id"])
+        elif operation == "reset":
+            _cancel_queued_ingests()
+            reset_vector_store()
+        else:
+            raise ValueError(f"Unknown spooled operation: {operation}")
+        job.update(status="done", finished_at=_now())
+    except Exception as e:
+        logger.error(f"Spooled {operation} job {job['job_id']} failed: {str(e)}", exc_info=True)
+        job.update(status="failed", error=str(e), finished_at=_now())
+    finally:
+        spool.write_status(job)
+        spool.done(claimed_path)
+
+def _sync_loop():
+    """
+    Background loop of every process. The writer drains the spool; readers follow new snapshots and
+    take over the writer role if the writer goes away.
+    """
+    if is_writer():
+        spool.recover()
+    while True:
+        try:
+            if not is_writer() and try_promote():
+                reload_snapshot()
+                spool.recover()
+            if is_writer():
+                for claimed_path, entry in spool.claim():
+                    _run_spooled(claimed_path, entry)
+            else:
+                reload_snapshot()
+        except Exception as e:
+            logger.error(f"Index sync failed: {str(e)}", exc_info=True)
+        time.sleep(SNAPSHOT_POLL_SECONDS)
+
+def start_index_sync():
+    global _sync_thread
+    if _sync_thread is None:
+        _sync_thread = threading.Thread(target=_sync_loop, name="index-sync", daemon=True)
+        _sync_thread.start()
+
+def get_job(job_id: str) -> Optional[dict]:
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job:
+            return dict(job)
+    return spool.read_status(job_id)
+
+def list_jobs() -> List[dict]:
+    merged = {job["job_id"]: job for job in spool.list_statuses()}
+    with jobs_lock:
+        merged.update((job_id, dict(job)) for job_id, job in jobs.items())
+    return sorted(merged.values(), key=lambda job: job["created_at"])
@@ -0,0 +1,131 @@
+from langchain_core.embeddings import Embeddings
+from typing import List, Optional
+import os
+import threading
+import time
+import logging
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Load the model in the background at startup and run a dummy batch through it
+WARMUP_ENABLED = os.getenv("RAG_WARMUP", "true").lower() in ("1", "true", "yes")
+WARMUP_BATCH_SIZE = int(os.getenv("RAG_WARMUP_BATCH_SIZE", "8"))
+# A failed warm-up is retried after this many seconds, doubling up to RAG_WARMUP_RETRY_MAX
+WARMUP_RETRY_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_SECONDS", "5"))
+WARMUP_RETRY_MAX = float(os.getenv("RAG_WARMUP_RETRY_MAX", "300"))
+# Forward-pass batch size when embedding pre-tokenized chunks (sentence-transformers' encode default)
+TOKEN_BATCH_SIZE = int(os.getenv("RAG_TOKEN_BATCH_SIZE", "32"))
+
+class LazyEmbeddings(Embeddings):
+    """
+    HuggingFace sentence-transformer embeddings that import torch and load the model on first use,
+    so importing the app (and workers that never embed) stays cheap.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def warm(self) -> bool:
+        return self.warmup_seconds is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    try:
+                        from langchain_huggingface import HuggingFaceEmbeddings
+                        self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.load_seconds = time.perf_counter() - started
+                    self.error = None
+                    logger.debug(f"Loaded embedding model {self.model_name} in {self.load_seconds:.2f}s")
+        return self._model
+
+    def warm_up(self):
+        """
+        Load the model and run one dummy batch so the first real query does not pay for lazy initialisation.
+        Retries with exponential backoff until it succeeds, since readiness waits for the model.
+        """
+        delay = WARMUP_RETRY_SECONDS
+        while True:
+            try:
+                model = self.load()
+                started = time.perf_counter()
+                model.embed_documents(["warm-up"] * WARMUP_BATCH_SIZE)
+                self.warmup_seconds = time.perf_counter() - started
+                logger.debug(f"Embedding model warm-up batch took {self.warmup_seconds:.2f}s")
+                return
+            except Exception as e:
+                logger.error(f"Embedding model warm-up failed, retrying in {delay:.0f}s: {str(e)}", exc_info=True)
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.load().embed_query(text)
+
+    @property
+    def max_seq_length(self) -> int:
+        """
+        Word pieces (special tokens included) the model reads; longer inputs are truncated.
+        """
+        return self.load().client.max_seq_length
+
+    def get_tokenizer(self):
+        """
+        The model's tokenizer if it is a fast one (chunking needs its offset mapping), else None.
+        """
+        tokenizer = getattr(self.load().client, "tokenizer", None)
+        return tokenizer if getattr(tokenizer, "is_fast", False) else None
+
+    def embed_chunks(self, texts: List[str], token_ids: List[List[int]]) -> List[List[float]]:
+        """
+        Embed chunks from the word-piece ids the chunker already produced (without special tokens),
+        skipping the tokenizer pass of embed_documents. Gives the same vectors as embedding the texts.
+        """
+        import torch
+        model = self.load().client
+        tokenizer = model.tokenizer
+        limit = self.max_seq_length - tokenizer.num_special_tokens_to_add(pair=False)
+        # Similar lengths are batched together to keep padding small, as encode() does
+        order = sorted(range(len(token_ids)), key=lambda index: len(token_ids[index]), reverse=True)
+        vectors: List[Optional[List[float]]] = [None] * len(token_ids)
+        for start in range(0, len(order), TOKEN_BATCH_SIZE):
+            batch = order[start:start + TOKEN_BATCH_SIZE]
+            inputs = [tokenizer.build_inputs_with_special_tokens(token_ids[index][:limit]) for index in batch]
+            features = tokenizer.pad({"input_ids": inputs}, return_tensors="pt")
+            features = {name: tensor.to(model.device) for name, tensor in features.items()}
+            with torch.no_grad():
+                embedded = model(features)["sentence_embedding"]
+            for index, vector in zip(batch, embedded.float().cpu().tolist()):
+                vectors[index] = vector
+        return vectors
+
+    def get_stats(self) -> dict:
+        return {
+            "model_name": self.model_name,
+            "loaded": self.loaded,
+            "warm": self.warm,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
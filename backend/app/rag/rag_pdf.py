@@ -0,0 +1,13 @@
+from typing import List
+import pypdf
+
+# Page extraction for the PDF process pool. Workers are spawned rather than forked, so they import
+# only this module instead of the app (and its index, embedding cache and thread pools).
+
+def extract_pages(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Extract the text of pages [start, end) of a PDF. Runs in a worker process.
+    """
+    with open(file_path, "rb") as f:
+        pdf_reader = pypdf.PdfReader(f)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
@@ -0,0 +1,298 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import os
+import sys
+import time
+import logging
+from app.db.database import SessionLocal
+from app.file.file import UPLOAD_DIR, upload_filename
+from app.models.models import Document
+from app.rag import rag
+from app.rag.rag_embed_cache import EMBED_CACHE_DIR, EMBED_CACHE_ENABLED, EmbeddingCache
+from app.rag.rag_cluster import is_writer, read_json, write_json_atomic
+from app.rag.rag_store import INDEX_DIR, remove_vectors
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Rebuild the index offline from the documents table or the uploads directory:
+#
+#     python -m app.rag.rag_reindex --source db --rebuild --workers 4
+#
+# Documents are extracted, chunked and embedded in a process pool; this process appends the vectors
+# to the index and publishes a snapshot plus a checkpoint every --checkpoint-every documents, so an
+# interrupted run continues after the last checkpoint when started again with the same arguments.
+CHECKPOINT_FILE = os.getenv("RAG_REINDEX_CHECKPOINT", os.path.join(INDEX_DIR, "reindex-checkpoint.json"))
+REINDEX_WORKERS = int(os.getenv("RAG_REINDEX_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+REINDEX_BATCH_SIZE = int(os.getenv("RAG_REINDEX_BATCH_SIZE", "512"))
+CHECKPOINT_EVERY = int(os.getenv("RAG_REINDEX_CHECKPOINT_EVERY", "50"))
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _init_worker(threads: int):
+    # Each worker runs its own model; splitting the cores between them avoids oversubscription,
+    # and PDFs are extracted in-process instead of through a nested pool. Workers only read the
+    # embedding cache; the parent holds the writer lock and appends their new vectors to it
+    rag.PDF_WORKERS = 1
+    rag.embedding_cache = EmbeddingCache(EMBED_CACHE_DIR, rag.embeddings.model_name, read_only=True) if EMBED_CACHE_ENABLED else None
+    rag.document_embeddings = rag.embeddings
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def embed_document(file_path: str, filename: str, batch_size: int) -> dict:
+    """
+    Extract, chunk and embed one document. Runs in a worker process. The on-disk embedding cache is
+    only read here; new vectors are reported back so the parent process appends them to it.
+    """
+    chunks = list(rag._iter_chunks(rag._iter_pages(file_path, filename, rag._no_progress)))
+    texts = [chunk.text for chunk, _ in chunks]
+    parts: List[np.ndarray] = []
+    new_rows: List[int] = []
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        batch_texts = texts[start:start + batch_size]
+        cached = rag.embedding_cache.get_many(batch_texts) if rag.embedding_cache is not None else [None] * len(batch)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            embedded = rag._embed_chunks([batch_texts[i] for i in missing], [batch[i][0].token_ids for i in missing])
+            for i, vector in zip(missing, embedded):
+                cached[i] = vector
+            new_rows.extend(start + i for i in missing)
+        parts.append(np.asarray(cached, dtype=np.float32))
+    vectors = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+    return {"texts": texts, "pages": [page for _, page in chunks], "vectors": vectors, "new_rows": new_rows}
+
+def documents_from_db() -> List[Tuple[int, str, str]]:
+    db = SessionLocal()
+    try:
+        rows = db.query(Document.id, Document.filename, Document.filepath).order_by(Document.id).all()
+    finally:
+        db.close()
+    return [(row.id, row.filename, row.filepath) for row in rows]
+
+def documents_from_uploads(upload_dir: str = UPLOAD_DIR) -> List[Tuple[int, str, str]]:
+    """
+    Every .txt/.pdf in upload_dir, matched to its documents row by path. Files without a row (e.g.
+    after the database was lost) get one, so they can be listed and selected again.
+    """
+    paths = sorted(
+        os.path.join(upload_dir, name) for name in os.listdir(upload_dir)
+        if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith(".")
+    )
+    db = SessionLocal()
+    try:
+        known = {row.filepath: row.id for row in db.query(Document.id, Document.filepath).filter(Document.filepath.in_(paths))}
+        created = [Document(filename=upload_filename(path), filepath=path, is_active=False) for path in paths if path not in known]
+        if created:
+            db.add_all(created)
+            db.flush()
+            known.update((document.filepath, document.id) for document in created)
+            db.commit()
+            logger.info(f"Created {len(created)} documents rows for files in {upload_dir}")
+    finally:
+        db.close()
+    return sorted((known[path], upload_filename(path), path) for path in paths)
+
+class Checkpoint:
+    """
+    Progress of a reindex run, written atomically right after each snapshot it covers. Documents
+    listed as done are in the published index; everything after them is redone on resume.
+    """
+
+    def __init__(self, path: str, source: str, rebuild: bool):
+        self.path = path
+        self.state = {
+            "source": source,
+            "rebuild": rebuild,
+            "started_at": _now(),
+            "updated_at": None,
+            "finished": False,
+            "done": [],
+            "failed": {},
+            "documents": 0,
+            "chunks": 0,
+            "seconds": 0.0,
+            "snapshot_version": None,
+        }
+
+    @classmethod
+    def resume(cls, path: str, source: str, rebuild: bool) -> Optional["Checkpoint"]:
+        state = read_json(path)
+        if state is None or state.get("finished"):
+            return None
+        if state.get("source") != source or state.get("rebuild") != rebuild:
+            raise SystemExit(f"{path} belongs to a run with --source {state.get('source')} "
+                             f"{'--rebuild' if state.get('rebuild') else ''}; pass --restart to discard it")
+        checkpoint = cls(path, source, rebuild)
+        checkpoint.state = state
+        return checkpoint
+
+    @property
+    def done(self) -> set:
+        return set(self.state["done"])
+
+    def save(self, **fields):
+        self.state.update(fields, updated_at=_now())
+        write_json_atomic(self.path, self.state)
+
+def publish(file_id: int, filename: str, file_path: str, result: dict) -> int:
+    """
+    Append a worker's vectors to the index and make the document queryable. Returns the chunk count.
+    """
+    texts = result["texts"]
+    if not texts:
+        return 0
+    metadata = {"filename": filename, "file_path": file_path, "file_id": file_id}
+    metadatas = [dict(metadata, page=page) if page is not None else dict(metadata) for page in result["pages"]]
+    vector_ids = rag._append_to_index(texts, result["vectors"], metadatas)
+    with rag.write_lock, rag.index_lock.write():
+        previous = rag.file_vector_ids.get(file_id)
+        rag.file_vector_ids[file_id] = np.asarray(vector_ids, dtype=np.int64)
+        if previous is not None:
+            # Re-indexed document: its old chunks become dead vectors for compaction; the next
+            # checkpoint's snapshot persists the change
+            remove_vectors(rag.vector_store, previous.tolist())
+        rag.bump_index_version()
+    if previous is not None:
+        rag._maybe_schedule_compaction()
+    if rag.embedding_cache is not None and result["new_rows"]:
+        rows = result["new_rows"]
+        rag.embedding_cache.put_many([texts[row] for row in rows], result["vectors"][rows])
+    return len(texts)
+
+def save_checkpoint(checkpoint: Checkpoint, **fields):
+    with rag.write_lock:
+        manifest = rag.save_snapshot(rag.vector_store, rag.file_vector_ids, embedding_model=rag.embeddings.model_name) if rag.vector_store is not None else None
+    checkpoint.save(snapshot_version=manifest["version"] if manifest else None, **fields)
+
+def run_inline(documents: List[Tuple[int, str, str]], batch_size: int) -> Iterator[Tuple[Tuple[int, str, str], Optional[dict], Optional[str]]]:
+    for document in documents:
+        _, filename, file_path = document
+        try:
+            yield document, embed_document(file_path, filename, batch_size), None
+        except Exception as e:
+            yield document, None, str(e)
+
+def run_pool(documents: List[Tuple[int, str, str]], workers: int, batch_size: int) -> Iterator[Tuple[Tuple[int, str, str], Optional[dict], Optional[str]]]:
+    """
+    Yield (document, result, error) as workers finish. At most two documents per worker are in
+    flight, which bounds the memory held by finished but unindexed results.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    pending = iter(documents)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        in_flight: Dict = {}
+
+        def fill():
+            while len(in_flight) < workers * 2:
+                document = next(pending, None)
+                if document is None:
+                    return
+                _, filename, file_path = document
+                in_flight[pool.submit(embed_document, file_path, filename, batch_size)] = document
+
+        fill()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                document = in_flight.pop(future)
+                error = future.exception()
+                yield document, (None if error else future.result()), (str(error) if error else None)
+            fill()
+
+def reindex(source: str, rebuild: bool, workers: int, batch_size: int, checkpoint_every: int,
+            restart: bool = False, checkpoint_path: str = CHECKPOINT_FILE) -> dict:
+    if not is_writer():
+        raise SystemExit("Another process holds the index writer lock; stop the app workers or use POST /upload/bulk")
+    rag.open_embedding_cache()
+
+    checkpoint = None if restart else Checkpoint.resume(checkpoint_path, source, rebuild)
+    if checkpoint is None:
+        checkpoint = Checkpoint(checkpoint_path, source, rebuild)
+        if rebuild:
+            rag.reset_vector_store()
+        checkpoint.save()
+    else:
+        logger.info(f"Resuming reindex with {len(checkpoint.done)} documents already done")
+
+    documents = documents_from_db() if source == "db" else documents_from_uploads()
+    done = checkpoint.done
+    # Without --rebuild only documents missing from the index are embedded
+    todo = [document for document in documents
+            if document[0] not in done and (rebuild or document[0] not in rag.file_vector_ids)]
+    missing = [document for document in todo if not os.path.exists(document[2])]
+    todo = [document for document in todo if os.path.exists(document[2])]
+    failed = dict(checkpoint.state["failed"])
+    failed.update({str(file_id): "file not found" for file_id, _, _ in missing})
+    logger.info(f"Reindexing {len(todo)} of {len(documents)} documents from {source} with {workers} workers")
+
+    started = time.perf_counter()
+    previous_seconds = checkpoint.state["seconds"]
+    documents_done, chunks_done = checkpoint.state["documents"], checkpoint.state["chunks"]
+    run_documents = run_chunks = since_checkpoint = 0
+    done_ids = list(checkpoint.state["done"])
+    results = run_pool(todo, workers, batch_size) if workers > 1 else run_inline(todo, batch_size)
+    for (file_id, filename, file_path), result, error in results:
+        if error is not None:
+            logger.error(f"Failed to reindex {filename} (id {file_id}): {error}")
+            failed[str(file_id)] = error
+            continue
+        chunks = publish(file_id, filename, file_path, result)
+        failed.pop(str(file_id), None)
+        done_ids.append(file_id)
+        run_documents += 1
+        run_chunks += chunks
+        since_checkpoint += 1
+        if since_checkpoint >= checkpoint_every:
+            elapsed = time.perf_counter() - started
+            save_checkpoint(checkpoint, done=done_ids, failed=failed, documents=documents_done + run_documents,
+                            chunks=chunks_done + run_chunks, seconds=previous_seconds + elapsed)
+            since_checkpoint = 0
+            logger.info(f"{run_documents}/{len(todo)} documents, {run_documents / elapsed:.2f} docs/s, {run_chunks / elapsed:.1f} chunks/s")
+
+    elapsed = time.perf_counter() - started
+    save_checkpoint(checkpoint, done=done_ids, failed=failed, documents=documents_done + run_documents,
+                    chunks=chunks_done + run_chunks, seconds=previous_seconds + elapsed, finished=True)
+    # Switch to the configured index type now rather than on the next upload
+    rag._maybe_schedule_promotion()
+    rag._maintenance_executor.submit(lambda: None).result()
+    return {
+        "source": source,
+        "rebuild": rebuild,
+        "documents": run_documents,
+        "chunks": run_chunks,
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "documents_per_second": round(run_documents / elapsed, 3) if elapsed else 0.0,
+        "chunks_per_second": round(run_chunks / elapsed, 1) if elapsed else 0.0,
+        "total_documents": documents_done + run_documents,
+        "snapshot_version": checkpoint.state["snapshot_version"],
+        "index": rag.get_index_stats(),
+    }
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Rebuild the vector index from the documents table or the uploads directory")
+    parser.add_argument("--source", choices=("db", "uploads"), default="db")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index first and re-embed every document (default: only documents missing from the index)")
+    parser.add_argument("--workers", type=int, default=REINDEX_WORKERS, help="embedding processes; 1 runs in this process")
+    parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE, help="chunks per embedding call")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="documents between snapshots and checkpoints")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished checkpoint and start over")
+    args = parser.parse_args()
+
+    report = reindex(args.source, args.rebuild, args.workers, args.batch_size, args.checkpoint_every, args.restart, args.checkpoint)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failed"] else 0)
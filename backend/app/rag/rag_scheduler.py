@@ -0,0 +1,191 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional
+import os
+import threading
+import logging
+from app.logs.logs import LOG_LEVEL
+from app.metrics.metrics import QUERY_SCHEDULER_QUEUED
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Query worker pool size, and how many queries one connection may have queued or running at once
+QUERY_WORKERS = int(os.getenv("RAG_QUERY_WORKERS", "4"))
+QUERY_MAX_INFLIGHT = int(os.getenv("RAG_QUERY_MAX_INFLIGHT", "2"))
+
+class QueryRejected(Exception):
+    pass
+
+class QueryTicket:
+    """
+    A scheduled query. fn receives a threading.Event that is set when the query is cancelled and
+    should be checked between steps; future resolves with fn's return value.
+    """
+
+    def __init__(self, connection_id: str, fn: Optional[Callable[[threading.Event], object]] = None):
+        self.connection_id = connection_id
+        self.fn = fn
+        self.cancelled = threading.Event()
+        self.future: Future = Future()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+class QueryScheduler:
+    """
+    Runs chat queries on a bounded thread pool. Each connection has its own queue, and free workers
+    take from the queues round-robin so a client sending many messages cannot starve the others.
+    """
+
+    def __init__(self, max_workers: int = QUERY_WORKERS, max_inflight: int = QUERY_MAX_INFLIGHT):
+        self.max_workers = max_workers
+        self.max_inflight = max_inflight
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-query")
+        self._queues: "OrderedDict[str, Deque[QueryTicket]]" = OrderedDict()
+        self._inflight: Dict[str, int] = {}
+        self._active: Dict[int, QueryTicket] = {}
+        self._reserved: Dict[int, QueryTicket] = {}
+        self._running = 0
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def submit(self, connection_id: str, fn: Callable[[threading.Event], object]) -> QueryTicket:
+        """
+        Queue fn for the given connection. Raises QueryRejected when the connection is at its in-flight limit.
+        """
+        ticket = QueryTicket(connection_id, fn)
+        with self._lock:
+            self._admit(ticket)
+            self._enqueue(ticket)
+        return ticket
+
+    def reserve(self, connection_id: str) -> QueryTicket:
+        """
+        Take one of the connection's in-flight slots for a query that has to wait for something
+        before it can run (e.g. its embedding), so the wait counts against the limit too. Raises
+        QueryRejected at the limit. Pass the ticket to start(), or cancel() it.
+        """
+        ticket = QueryTicket(connection_id)
+        with self._lock:
+            self._admit(ticket)
+            self._reserved[id(ticket)] = ticket
+        return ticket
+
+    def start(self, ticket: QueryTicket, fn: Callable[[threading.Event], object]) -> bool:
+        """
+        Queue fn on a reserved ticket. Returns False if the ticket was cancelled meanwhile.
+        """
+        ticket.fn = fn
+        with self._lock:
+            if self._reserved.pop(id(ticket), None) is None:
+                return False
+            self._enqueue(ticket)
+        return True
+
+    def _admit(self, ticket: QueryTicket):
+        # Caller holds the lock
+        connection_id = ticket.connection_id
+        if self._inflight.get(connection_id, 0) >= self.max_inflight:
+            self.rejected += 1
+            raise QueryRejected(f"Too many queries in flight (limit {self.max_inflight}), please wait")
+        self._inflight[connection_id] = self._inflight.get(connection_id, 0) + 1
+        self.submitted += 1
+
+    def _enqueue(self, ticket: QueryTicket):
+        # Caller holds the lock
+        self._queues.setdefault(ticket.connection_id, deque()).append(ticket)
+        QUERY_SCHEDULER_QUEUED.inc()
+        self._dispatch()
+
+    def cancel(self, ticket: QueryTicket):
+        """
+        Cancel a query. A reserved or queued query is dropped at once; a running one stops at its next
+        cancellation check.
+        """
+        ticket.cancel()
+        with self._lock:
+            if self._reserved.pop(id(ticket), None) is not None:
+                self._finish(ticket)
+                return
+            queue = self._queues.get(ticket.connection_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                QUERY_SCHEDULER_QUEUED.dec()
+                if not queue:
+                    del self._queues[ticket.connection_id]
+                self._finish(ticket)
+
+    def cancel_connection(self, connection_id: str):
+        """
+        Cancel everything queued or running for a connection, e.g. when the client disconnects.
+        """
+        with self._lock:
+            tickets = list(self._queues.get(connection_id, ()))
+            tickets += [ticket for ticket in self._reserved.values() if ticket.connection_id == connection_id]
+            tickets += [ticket for ticket in self._active.values() if ticket.connection_id == connection_id]
+        for ticket in tickets:
+            self.cancel(ticket)
+
+    def _dispatch(self):
+        # Caller holds the lock. Take one ticket per connection in turn while workers are free.
+        while self._running < self.max_workers and self._queues:
+            connection_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            QUERY_SCHEDULER_QUEUED.dec()
+            if queue:
+                self._queues.move_to_end(connection_id)
+            else:
+                del self._queues[connection_id]
+            if not ticket.future.set_running_or_notify_cancel():
+                self._finish(ticket)
+                continue
+            self._running += 1
+            self._active[id(ticket)] = ticket
+            self._executor.submit(self._run, ticket)
+
+    def _finish(self, ticket: QueryTicket):
+        # Caller holds the lock
+        remaining = self._inflight.get(ticket.connection_id, 0) - 1
+        if remaining > 0:
+            self._inflight[ticket.connection_id] = remaining
+        else:
+            self._inflight.pop(ticket.connection_id, None)
+        if ticket.cancelled.is_set():
+            self.cancelled += 1
+        else:
+            self.completed += 1
+
+    def _run(self, ticket: QueryTicket):
+        try:
+            ticket.future.set_result(ticket.fn(ticket.cancelled))
+        except Exception as e:
+            ticket.future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._active.pop(id(ticket), None)
+                self._finish(ticket)
+                self._dispatch()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_inflight_per_connection": self.max_inflight,
+                "running": self._running,
+                "reserved": len(self._reserved),
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "connections_waiting": len(self._queues),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
+
+query_scheduler = QueryScheduler()
@@ -0,0 +1,240 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
+import os
+import threading
+import time
+import logging
+from app.db.database import AsyncSessionLocal, SessionLocal
+from app.models.models import Document
+from app.rag.rag_cluster import SPOOL_DIR, read_json, write_json_atomic
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Mirror the default active document to documents.is_active in the background
+PERSIST_ACTIVE = os.getenv("RAG_PERSIST_ACTIVE", "true").lower() in ("1", "true", "yes")
+# Selections are shared by every worker process through small JSON files next to the job spool
+ACTIVE_DIR = os.getenv("RAG_ACTIVE_DIR", os.path.join(SPOOL_DIR, "active"))
+# Session selections left behind by workers that exited without closing their connections are
+# removed at startup once they are this old
+SESSION_TTL_SECONDS = float(os.getenv("RAG_SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+DEFAULT_FILE = "default.json"
+
+class ActiveDocuments:
+    """
+    Active-document state shared by all worker processes. Each chat session may select its own
+    document; sessions that have not chosen one fall back to the default set through the REST
+    endpoint. The default and each session's selection are JSON files in ACTIVE_DIR, so a selection
+    made through one worker is seen by the worker serving the chat connection. Lookups stat the file
+    and only re-read it after it was replaced, so they never touch the database; the default is
+    also written back to documents.is_active asynchronously when enabled.
+    """
+
+    def __init__(self, directory: str = ACTIVE_DIR, persist: bool = PERSIST_ACTIVE):
+        self.persist = persist
+        self.directory = directory
+        self.sessions_dir = os.path.join(directory, "sessions")
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        # Documents known to this process; others are looked up in the database on demand
+        self.filenames: Dict[int, str] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+        # path -> ((inode, mtime), file_id) of the last read
+        self._reads: Dict[str, Tuple[Tuple[int, int], Optional[int]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="active-persist")
+        self._pending: Optional[int] = None
+        self._scheduled = False
+
+    def _default_path(self) -> str:
+        return os.path.join(self.directory, DEFAULT_FILE)
+
+    def _session_path(self, session_id: str) -> Optional[str]:
+        # Session ids come from clients through the REST endpoints
+        if not session_id.isalnum():
+            return None
+        return os.path.join(self.sessions_dir, f"{session_id}.json")
+
+    def _read(self, path: str) -> Optional[int]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._reads.pop(path, None)
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._reads.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        data = read_json(path)
+        file_id = data.get("file_id") if data else None
+        self._reads[path] = (key, file_id)
+        return file_id
+
+    def _write(self, path: str, file_id: Optional[int]):
+        write_json_atomic(path, {"file_id": file_id})
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _session_files(self):
+        return [os.path.join(self.sessions_dir, name) for name in os.listdir(self.sessions_dir)
+                if name.endswith(".json") and not name.startswith(".tmp-")]
+
+    @property
+    def default_id(self) -> Optional[int]:
+        return self._read(self._default_path())
+
+    def load(self):
+        """
+        Read document names and the persisted default once, at startup.
+        """
+        db: Session = SessionLocal()
+        try:
+            rows = db.query(Document.id, Document.filename, Document.is_active).all()
+        finally:
+            db.close()
+        with self._lock:
+            self.filenames = {row.id: row.filename for row in rows}
+        # The first worker to start seeds the shared default from the persisted one
+        if not os.path.exists(self._default_path()):
+            active = [row.id for row in rows if row.is_active]
+            self._write(self._default_path(), active[0] if active else None)
+        expired = time.time() - SESSION_TTL_SECONDS
+        for path in self._session_files():
+            try:
+                if os.path.getmtime(path) < expired:
+                    self._remove(path)
+            except FileNotFoundError:
+                pass
+        self.loaded = True
+        logger.debug(f"Loaded {len(rows)} documents, default active document: {self.default_id}")
+
+    def register(self, file_id: int, filename: str):
+        with self._lock:
+            self.filenames[file_id] = filename
+
+    def forget(self, file_id: int):
+        with self._lock:
+            self.filenames.pop(file_id, None)
+        for path in self._session_files():
+            if self._read(path) == file_id:
+                self._remove(path)
+        if self.default_id == file_id:
+            self._write(self._default_path(), None)
+
+    def clear(self):
+        with self._lock:
+            self.filenames.clear()
+        for path in self._session_files():
+            self._remove(path)
+        self._write(self._default_path(), None)
+
+    def exists(self, file_id: int) -> bool:
+        return file_id in self.filenames
+
+    def find_by_filename(self, filename: str) -> Optional[int]:
+        """
+        Id of the most recently uploaded document with this filename.
+        """
+        with self._lock:
+            matches = [file_id for file_id, name in self.filenames.items() if name == filename]
+        return max(matches) if matches else None
+
+    async def resolve_id(self, file_id: int) -> bool:
+        """
+        Like exists(), but checks the database for documents uploaded through another worker process.
+        """
+        if self.exists(file_id):
+            return True
+        async with AsyncSessionLocal() as db:
+            document = await db.get(Document, file_id)
+        if document is None:
+            return False
+        self.register(document.id, document.filename)
+        return True
+
+    async def resolve_filename(self, filename: str) -> Optional[int]:
+        """
+        Like find_by_filename(), falling back to the database for documents uploaded through another worker process.
+        """
+        file_id = self.find_by_filename(filename)
+        if file_id is not None:
+            return file_id
+        async with AsyncSessionLocal() as db:
+            file_id = (await db.execute(
+                select(Document.id).where(Document.filename == filename).order_by(Document.id.desc()).limit(1))).scalar()
+        if file_id is not None:
+            self.register(file_id, filename)
+        return file_id
+
+    def get(self, session_id: Optional[str] = None) -> Optional[int]:
+        path = self._session_path(session_id) if session_id is not None else None
+        if path is not None:
+            active = self._read(path)
+            if active is not None:
+                return active
+        return self.default_id
+
+    def select(self, file_id: int, session_id: Optional[str] = None):
+        """
+        Make file_id active for one session, or the default for everyone when session_id is None.
+        """
+        if session_id is not None:
+            path = self._session_path(session_id)
+            if path is None:
+                raise ValueError(f"Invalid session id: {session_id}")
+            self._write(path, file_id)
+            return
+        self._write(self._default_path(), file_id)
+        if self.persist:
+            self._schedule_persist(file_id)
+
+    def end_session(self, session_id: str):
+        path = self._session_path(session_id)
+        if path is not None:
+            self._remove(path)
+            self._reads.pop(path, None)
+
+    def _schedule_persist(self, file_id: int):
+        # Only the latest selection matters, so writes queued behind a slow one are coalesced
+        with self._lock:
+            self._pending = file_id
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self._persist)
+
+    def _persist(self):
+        with self._lock:
+            file_id = self._pending
+            self._scheduled = False
+        db: Session = SessionLocal()
+        try:
+            # Only the previously active rows and the new one are touched
+            db.query(Document).filter(Document.is_active == True, Document.id != file_id).update(
+                {"is_active": False}, synchronize_session=False)
+            db.query(Document).filter(Document.id == file_id).update({"is_active": True}, synchronize_session=False)
+            db.commit()
+            logger.debug(f"Persisted active document {file_id}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to persist active document {file_id}: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "documents": len(self.filenames),
+            "default_id": self.default_id,
+            "sessions": len(self._session_files()),
+            "persist": self.persist,
+        }
+
+active_documents = ActiveDocuments()
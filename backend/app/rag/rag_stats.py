@@ -0,0 +1,47 @@
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from app.auth.cpu_pool import cpu_pool
+from app.db.database import get_pool_stats
+from app.rag import rag
+from app.rag.rag_batcher import query_batcher
+from app.rag.rag_cache import query_embedding_cache, retrieval_cache
+from app.rag.rag_scheduler import query_scheduler
+from app.rag.rag_cluster import get_role
+from app.rag.rag_store import dead_vector_count
+from app.rag.rag_session import active_documents
+from app.metrics.metrics import INDEX_FILES, INDEX_VECTORS, METRICS_CONTENT_TYPE, add_collector, render_metrics
+
+async def get_rag_stats():
+    return {
+        "query_batcher": query_batcher.get_stats(),
+        "query_scheduler": query_scheduler.get_stats(),
+        "active_documents": active_documents.get_stats(),
+        "db_pool": get_pool_stats(),
+        "cpu_pool": cpu_pool.get_stats(),
+        "query_embedding_cache": query_embedding_cache.get_stats(),
+        "retrieval_cache": retrieval_cache.get_stats(),
+        "index_version": rag.index_version,
+        "index_role": get_role(),
+        "snapshot_version": getattr(rag.vector_store, "snapshot_version", None),
+        "embedding_model": rag.embeddings.get_stats(),
+        "index": rag.get_index_stats(),
+        "chunker": rag._chunker.get_stats() if rag._chunker is not None else None,
+        "embedding_cache": rag.embedding_cache.get_stats() if rag.embedding_cache is not None else None,
+    }
+
+def collect_rag_metrics():
+    # Runs on every scrape, so only the counters are read, not the full get_index_stats()
+    store = rag.vector_store
+    INDEX_VECTORS.labels(state="live").set(store.live_count if store is not None else 0)
+    INDEX_VECTORS.labels(state="dead").set(dead_vector_count(store) if store is not None else 0)
+    INDEX_FILES.set(len(rag.file_vector_ids))
+
+add_collector(collect_rag_metrics)
+
+async def get_metrics():
+    """
+    Metrics of every worker process in Prometheus text format.
+    """
+    # Collectors read index and pool state under their locks, so rendering runs off the event loop
+    body = await run_in_threadpool(render_metrics)
+    return PlainTextResponse(body, media_type=METRICS_CONTENT_TYPE)
@@ -0,0 +1,504 @@
+from langchain_core.documents import Document
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import faiss
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import logging
+from app.rag.rag_bm25 import BM25Index
+from app.rag.rag_chunks import ChunkStore, ColumnFile, save_array
+from app.rag.rag_index import (
+    VECTOR_PRECISION, build_index, configure_search, index_ids, index_type_of, is_exact, is_ivf, precision_of,
+    rebuild_index, search_params, supports_remove,
+)
+from app.logs.logs import LOG_LEVEL
+
+# Set up logging
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# Snapshot configuration
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "index")
+KEEP_SNAPSHOTS = int(os.getenv("RAG_KEEP_SNAPSHOTS", "2"))
+MMAP_INDEX = os.getenv("RAG_MMAP_INDEX", "true").lower() == "true"
+
+# Files with at most this many chunks are scored exactly even when the index is approximate
+EXACT_SCAN_MAX = int(os.getenv("RAG_EXACT_SCAN_MAX", "20000"))
+
+# Re-score the top RESCORE_FACTOR * k candidates of reduced-precision indexes against exact float32
+# copies of the vectors, kept in a memory-mapped file in each snapshot
+RESCORE = os.getenv("RAG_RESCORE", "false").lower() == "true"
+RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", "4"))
+RAW_VECTORS_FILE = "raw_vectors.f32"
+
+MANIFEST_FILE = "manifest.json"
+SNAPSHOT_DIR = "snapshots"
+INDEX_FILE = "index.faiss"
+# Format 1 snapshots pickled the langchain docstore and the BM25 index; they are converted on load
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# Published file_id -> FAISS ids map: file ids, offsets into the id array, and the ids of every file
+FILES_FILE = "files.npy"
+FILE_OFFSETS_FILE = "file_offsets.npy"
+FILE_VECTORS_FILE = "file_vectors.npy"
+FORMAT_VERSION = 2
+
+def _fsync_dir(path: str):
+    """
+    Flush a directory entry to disk so renames inside it survive a crash.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class RawVectorFile(ColumnFile):
+    """
+    Exact float32 vectors stored by id: row i holds the vector with FAISS id i.
+    """
+
+    def __init__(self, dimension: int, path: Optional[str] = None, rows: int = 0):
+        super().__init__(np.float32, dimension, path, rows)
+        self.dimension = dimension
+
+class VectorStore:
+    """
+    A FAISS index and the chunks behind its vectors, addressed by vector id: texts and metadata
+    in a ChunkStore, the sparse index in a BM25Index and, for reduced-precision indexes with
+    rescoring, exact copies of the vectors. Everything but the in-memory tails of the last
+    snapshot is memory-mapped, so loading a snapshot costs no unpickling.
+    """
+
+    def __init__(self, index: faiss.Index, chunks: ChunkStore = None, bm25: BM25Index = None, next_id: int = 0, mmapped: bool = False):
+        self.index = index
+        self.chunks = chunks or ChunkStore()
+        self.bm25 = bm25 or BM25Index()
+        self.next_id = next_id
+        self.mmapped = mmapped
+        self.snapshot_version = 0
+        self.raw_vectors: Optional[RawVectorFile] = None
+
+    @property
+    def live_count(self) -> int:
+        return self.chunks.live_count
+
+    def live_ids(self) -> np.ndarray:
+        """
+        Sorted ids of the chunks that have not been removed.
+        """
+        return self.chunks.live_ids()
+
+def keeps_raw_vectors(index: faiss.Index) -> bool:
+    """
+    Exact copies are only kept when rescoring is on and the index stores reduced-precision vectors.
+    """
+    return RESCORE and precision_of(index) != "float32"
+
+def _attach_raw_vectors(store: VectorStore, snapshot_dir: Optional[str] = None, manifest: Optional[dict] = None):
+    store.raw_vectors = None
+    if not keeps_raw_vectors(store.index):
+        return
+    if snapshot_dir is None:
+        store.raw_vectors = RawVectorFile(store.index.d)
+        return
+    path = os.path.join(snapshot_dir, RAW_VECTORS_FILE)
+    if os.path.exists(path) and manifest.get("raw_vectors") is not None:
+        store.raw_vectors = RawVectorFile(store.index.d, path, manifest["raw_vectors"])
+    else:
+        # The float32 vectors are gone once quantized; rescoring resumes after the next promotion from float32
+        logger.warning(f"Snapshot {manifest['snapshot']} has no exact vector copies, rescoring is disabled")
+
+def _fsync_file(path: str):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+def read_manifest(index_dir: str = INDEX_DIR) -> Optional[dict]:
+    """
+    Return the manifest of the latest published snapshot, or None if there is none.
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_manifest(index_dir: str, manifest: dict):
+    """
+    Atomically replace the manifest: write a temp file, fsync it, then rename over the old one.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".manifest-", dir=index_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+        _fsync_dir(index_dir)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _prune_snapshots(index_dir: str, keep: str):
+    """
+    Remove old snapshot directories, keeping the newest KEEP_SNAPSHOTS ones and any leftover temp dirs
+    from writers that crashed mid-snapshot.
+    """
+    snapshots_dir = os.path.join(index_dir, SNAPSHOT_DIR)
+    names = sorted(name for name in os.listdir(snapshots_dir) if name.startswith("v"))
+    stale = [name for name in names[:-KEEP_SNAPSHOTS] if name != keep]
+    stale += [name for name in os.listdir(snapshots_dir) if name.startswith(".tmp-")]
+    for name in stale:
+        shutil.rmtree(os.path.join(snapshots_dir, name), ignore_errors=True)
+        logger.debug(f"Removed stale snapshot {name}")
+    # Exact vectors used to live in one file shared by every snapshot
+    legacy_raw_vectors = os.path.join(index_dir, RAW_VECTORS_FILE)
+    if os.path.exists(legacy_raw_vectors):
+        os.remove(legacy_raw_vectors)
+
+def _write_published(snapshot_dir: str, files: Dict[int, np.ndarray]):
+    """
+    Persist the published file_id -> FAISS ids map. Only these chunks are queryable after a load;
+    chunks of ingests that had not finished when the snapshot was taken are left out.
+    """
+    file_ids = sorted(file_id for file_id, vector_ids in files.items() if len(vector_ids))
+    parts = [np.asarray(files[file_id], dtype=np.int64) for file_id in file_ids]
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(part) for part in parts], dtype=np.int64)
+    save_array(os.path.join(snapshot_dir, FILES_FILE), np.asarray(file_ids, dtype=np.int64))
+    save_array(os.path.join(snapshot_dir, FILE_OFFSETS_FILE), offsets)
+    save_array(os.path.join(snapshot_dir, FILE_VECTORS_FILE), np.concatenate(parts) if parts else np.empty(0, dtype=np.int64))
+
+def _read_published(snapshot_dir: str) -> Optional[Dict[int, np.ndarray]]:
+    """
+    The published map of a snapshot, or None for snapshots written before it was persisted.
+    The id arrays are memory-mapped slices.
+    """
+    if not os.path.exists(os.path.join(snapshot_dir, FILES_FILE)):
+        return None
+    file_ids = np.load(os.path.join(snapshot_dir, FILES_FILE))
+    offsets = np.load(os.path.join(snapshot_dir, FILE_OFFSETS_FILE))
+    vector_ids = np.load(os.path.join(snapshot_dir, FILE_VECTORS_FILE), mmap_mode="r")
+    return {int(file_id): vector_ids[offsets[i]:offsets[i + 1]] for i, file_id in enumerate(file_ids)}
+
+def save_snapshot(store: VectorStore, files: Dict[int, np.ndarray], index_dir: str = INDEX_DIR, **extra) -> dict:
+    """
+    Write the vector store and the published file_id -> FAISS ids map to a new versioned snapshot
+    directory and publish it through the manifest. The snapshot is written to a temp dir, fsynced
+    and renamed into place before the manifest is switched, so a crash at any point leaves the
+    previous snapshot intact.
+    """
+    snapshots_dir = os.path.join(index_dir, SNAPSHOT_DIR)
+    os.makedirs(snapshots_dir, exist_ok=True)
+
+    previous = read_manifest(index_dir)
+    version = (previous["version"] if previous else 0) + 1
+    name = f"v{version:08d}"
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=snapshots_dir)
+    try:
+        index_path = os.path.join(tmp_dir, INDEX_FILE)
+        faiss.write_index(store.index, index_path)
+        # The chunk and raw vector columns hard-link the previous snapshot's files and append to them
+        store.chunks.write(tmp_dir)
+        bm25_state = store.bm25.write(tmp_dir, store.chunks.rows)
+        _write_published(tmp_dir, files)
+        if store.raw_vectors is not None:
+            store.raw_vectors.write(os.path.join(tmp_dir, RAW_VECTORS_FILE))
+        _fsync_file(index_path)
+        _fsync_dir(tmp_dir)
+        os.rename(tmp_dir, os.path.join(snapshots_dir, name))
+        _fsync_dir(snapshots_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "snapshot": name,
+        "vectors": store.index.ntotal,
+        "dimension": store.index.d,
+        # Ids are never reused, even when compaction removed the highest ones
+        "next_id": store.next_id,
+        "raw_vectors": store.raw_vectors.total_rows if store.raw_vectors is not None else None,
+        "chunks": store.chunks.rows,
+        "chunk_bytes": store.chunks.text.total_rows,
+        "live_chunks": store.live_count,
+        # Live chunks of ingests still running; readers drop them on load
+        "unpublished": store.live_count - sum(len(vector_ids) for vector_ids in files.values()),
+        "bm25": bm25_state,
+        "files": sum(1 for vector_ids in files.values() if len(vector_ids)),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        **extra,
+    }
+    _write_manifest(index_dir, manifest)
+    store.snapshot_version = version
+    # Serve what was just written from the snapshot's files instead of the heap
+    snapshot_dir = os.path.join(snapshots_dir, name)
+    store.chunks.rebase(snapshot_dir)
+    store.bm25.rebase(snapshot_dir)
+    if store.raw_vectors is not None:
+        store.raw_vectors.rebase(os.path.join(snapshot_dir, RAW_VECTORS_FILE))
+    _prune_snapshots(index_dir, keep=name)
+    logger.debug(f"Published snapshot {name} with {manifest['vectors']} vectors")
+    return manifest
+
+def load_snapshot(index_dir: str = INDEX_DIR, mmap: bool = MMAP_INDEX) -> Tuple[Optional[VectorStore], Dict[int, np.ndarray]]:
+    """
+    Load the latest published snapshot and its published file_id -> FAISS ids map. With mmap
+    enabled the FAISS index is memory-mapped read-only, so a large index is paged in on demand
+    instead of being read into the heap; chunk texts and BM25 postings are always memory-mapped.
+    Chunks missing from the published map belong to ingests that never finished; they are dropped
+    like removed chunks and compacted away later.
+    """
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        logger.debug(f"No snapshot manifest found in {index_dir}")
+        return None, {}
+    if manifest.get("format") not in (1, FORMAT_VERSION):
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+
+    snapshot_dir = os.path.join(index_dir, SNAPSHOT_DIR, manifest["snapshot"])
+    index_path = os.path.join(snapshot_dir, INDEX_FILE)
+    if mmap:
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        io_flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        index = faiss.read_index(index_path, io_flags)
+    else:
+        index = faiss.read_index(index_path)
+
+    store = VectorStore(index, mmapped=mmap)
+    store.snapshot_version = manifest["version"]
+    _ensure_id_map(store)
+    store.next_id = max(store.next_id, manifest.get("next_id", 0))
+    configure_search(store.index)
+    _attach_raw_vectors(store, snapshot_dir, manifest)
+    if manifest["format"] == FORMAT_VERSION:
+        store.chunks = ChunkStore.load(snapshot_dir, manifest["chunks"], manifest["chunk_bytes"], manifest["live_chunks"])
+        store.bm25 = BM25Index.load(snapshot_dir, manifest["bm25"])
+    else:
+        _load_legacy_chunks(store, snapshot_dir)
+    files = _read_published(snapshot_dir)
+    if files is None:
+        files = build_file_index(store)
+    elif manifest.get("unpublished", 1):
+        published = np.concatenate(list(files.values())) if files else np.empty(0, dtype=np.int64)
+        live_ids = store.live_ids()
+        unpublished = live_ids[~np.isin(live_ids, published)]
+        if len(unpublished):
+            remove_vectors(store, unpublished.tolist())
+            logger.info(f"Dropped {len(unpublished)} unpublished chunks from snapshot {manifest['snapshot']}")
+    logger.debug(f"Loaded snapshot {manifest['snapshot']} with {index.ntotal} vectors and {len(files)} files (mmap={mmap})")
+    return store, files
+
+def create_store(dimension: int) -> VectorStore:
+    """
+    Create an empty vector store backed by an ID-mapped flat index, so vectors keep stable ids and
+    can be removed without rebuilding the index. int8 storage needs training data, so such stores
+    start as float32 and are quantized by promotion.
+    """
+    precision = "float32" if VECTOR_PRECISION == "int8" else VECTOR_PRECISION
+    store = VectorStore(build_index("flat", dimension, precision=precision))
+    _attach_raw_vectors(store)
+    return store
+
+def _ensure_id_map(store: VectorStore):
+    """
+    Snapshots written before ids were stable hold a bare index whose positions are the ids;
+    rewrap those in an IndexIDMap2 with the same ids.
+    """
+    if isinstance(store.index, (faiss.IndexIDMap, faiss.IndexIDMap2)) or is_ivf(store.index):
+        ids = index_ids(store.index)
+        store.next_id = int(ids.max()) + 1 if len(ids) else 0
+        return
+    ntotal = store.index.ntotal
+    index = faiss.IndexIDMap2(faiss.IndexFlat(store.index.d, store.index.metric_type))
+    if ntotal:
+        index.add_with_ids(store.index.reconstruct_n(0, ntotal), np.arange(ntotal, dtype=np.int64))
+    store.index = index
+    store.mmapped = False
+    store.next_id = ntotal
+    logger.debug(f"Migrated {ntotal} vectors to an ID-mapped index")
+
+def _load_legacy_chunks(store: VectorStore, snapshot_dir: str):
+    """
+    Convert the pickled langchain docstore of a format 1 snapshot into chunk columns and rebuild the
+    BM25 index from it. The next snapshot is written in the current format.
+    """
+    with open(os.path.join(snapshot_dir, LEGACY_DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    texts, metadatas, removed = [], [], []
+    for vector_id in range(store.next_id):
+        docstore_id = index_to_docstore_id.get(vector_id)
+        doc = docstore.search(docstore_id) if docstore_id is not None else None
+        if isinstance(doc, Document):
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+        else:
+            texts.append("")
+            metadatas.append({})
+            removed.append(vector_id)
+    store.chunks.add(0, texts, metadatas)
+    store.chunks.remove(removed)
+    live_ids = store.live_ids().tolist()
+    store.bm25.add_many(live_ids, [texts[vector_id] for vector_id in live_ids])
+    logger.info(f"Converted format 1 snapshot with {len(live_ids)} chunks")
+
+def ensure_writable(store: VectorStore):
+    """
+    A memory-mapped index is read-only; copy it into the heap before the first write.
+    """
+    if getattr(store, "mmapped", False):
+        store.index = faiss.deserialize_index(faiss.serialize_index(store.index))
+        store.mmapped = False
+        logger.debug("Copied memory-mapped index into memory for writing")
+
+def add_vectors(store: VectorStore, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[int]:
+    """
+    Add embedded chunks under freshly allocated ids and return those ids. Ids are never reused,
+    even after the vectors they named were removed.
+    """
+    ids = np.arange(store.next_id, store.next_id + len(texts), dtype=np.int64)
+    array = np.asarray(vectors, dtype=np.float32)
+    if store.raw_vectors is not None:
+        store.raw_vectors.append(store.next_id, array)
+    store.index.add_with_ids(array, ids)
+    store.chunks.add(store.next_id, texts, metadatas)
+    store.bm25.add_many(ids.tolist(), texts)
+    store.next_id += len(texts)
+    return ids.tolist()
+
+def remove_vectors(store: VectorStore, vector_ids: List[int]):
+    """
+    Mask chunks out of the chunk store and the BM25 index. Their vectors stay in the FAISS index as
+    dead entries until compact_vector_store removes them in one pass.
+    """
+    store.bm25.remove_many(store.chunks.remove(vector_ids))
+
+def dead_vector_count(store: VectorStore) -> int:
+    return store.index.ntotal - store.live_count
+
+def compact_index(store: VectorStore) -> Tuple[Optional[faiss.Index], int]:
+    """
+    A copy of the store's FAISS index without its dead vectors (those of removed chunks), and the
+    number of vectors removed; (None, 0) if there are none. The caller swaps the copy in, so
+    searches keep using the current index meanwhile. Index types without remove support (HNSW) are
+    rebuilt from their live vectors.
+    """
+    all_ids = index_ids(store.index)
+    live_ids = store.live_ids()
+    dead_ids = all_ids[~np.isin(all_ids, live_ids)]
+    if not len(dead_ids):
+        return None, 0
+    if supports_remove(store.index):
+        index = faiss.deserialize_index(faiss.serialize_index(store.index))
+        index.remove_ids(faiss.IDSelectorBatch(dead_ids))
+    else:
+        index = rebuild_index(store.index, index_type_of(store.index), live_ids, precision_of(store.index))
+    return index, len(dead_ids)
+
+def promote_index(store: VectorStore, index_type: str) -> Tuple[faiss.Index, Optional[RawVectorFile]]:
+    """
+    Train and fill an index of index_type from the store's live vectors, with the exact vector
+    copies it should keep. The caller swaps both in. Leaving float32 for a reduced precision takes
+    the exact copies from the float32 index.
+    """
+    live_ids = store.live_ids()
+    new_index = rebuild_index(store.index, index_type, live_ids)
+    if not keeps_raw_vectors(new_index):
+        return new_index, None
+    raw_vectors = store.raw_vectors
+    if raw_vectors is None and precision_of(store.index) == "float32":
+        raw_vectors = RawVectorFile(store.index.d)
+        vectors = np.zeros((store.next_id, store.index.d), dtype=np.float32)
+        if len(live_ids):
+            vectors[live_ids] = store.index.reconstruct_batch(live_ids)
+        raw_vectors.append(0, vectors)
+    return new_index, raw_vectors
+
+def build_file_index(store: VectorStore) -> Dict[int, np.ndarray]:
+    """
+    Map each file_id to the sorted FAISS ids of its live chunks, rebuilt from the chunk store.
+    Only used for snapshots written before the published map was persisted.
+    """
+    live_ids = store.live_ids()
+    if not len(live_ids):
+        return {}
+    file_ids = store.chunks.file_ids.get(live_ids)
+    live_ids, file_ids = live_ids[file_ids >= 0], file_ids[file_ids >= 0]
+    order = np.argsort(file_ids, kind="stable")
+    unique_ids, starts = np.unique(file_ids[order], return_index=True)
+    return {int(file_id): ids for file_id, ids in zip(unique_ids, np.split(live_ids[order], starts[1:]))}
+
+def get_documents(store: VectorStore, vector_ids: List[int]) -> List[Optional[Document]]:
+    documents = []
+    for vector_id in vector_ids:
+        chunk = store.chunks.get(int(vector_id))
+        documents.append(Document(page_content=chunk[0], metadata=chunk[1]) if chunk is not None else None)
+    return documents
+
+def get_scored_documents(store: VectorStore, hits: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+    """
+    (document, score) for (vector id, score) hits, skipping chunks removed since the search.
+    """
+    documents = get_documents(store, [vector_id for vector_id, _ in hits])
+    return [(doc, score) for doc, (_, score) in zip(documents, hits) if doc is not None]
+
+def search_file_sparse(store: VectorStore, tokens: List[str], vector_ids: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+    """
+    BM25 search for the query's tokens, restricted to the given FAISS ids (one file's chunks).
+    Returns (vector id, score) hits.
+    """
+    return store.bm25.search(tokens, k, np.asarray(vector_ids, dtype=np.int64))
+
+def search_file(store: VectorStore, query_embedding: List[float], vector_ids: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+    """
+    Similarity search restricted to the given FAISS ids (one file's chunks), returning (vector id,
+    distance or similarity) hits. For flat indexes, and
+    for files of up to EXACT_SCAN_MAX chunks in approximate indexes, the file's vectors are scored
+    directly, so the cost scales with the file size instead of the corpus; larger files in an
+    approximate index are searched with an ID selector.
+    """
+    if not len(vector_ids):
+        return []
+    query = np.asarray([query_embedding], dtype=np.float32)
+    ids = np.asarray(vector_ids, dtype=np.int64)
+    rescore = getattr(store, "raw_vectors", None) is not None and precision_of(store.index) != "float32"
+    final_k = min(k, len(ids))
+    k = min(k * RESCORE_FACTOR if rescore else k, len(ids))
+
+    if is_exact(store.index) or len(ids) <= EXACT_SCAN_MAX:
+        vectors = store.index.reconstruct_batch(ids)
+        if store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            distances = -(vectors @ query[0])
+        else:
+            distances = ((vectors - query) ** 2).sum(axis=1)
+        top = np.argpartition(distances, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        top = top[np.argsort(distances[top])]
+        hits = ids[top]
+        scores = -distances[top] if store.index.metric_type == faiss.METRIC_INNER_PRODUCT else distances[top]
+    else:
+        params = search_params(store.index, faiss.IDSelectorBatch(ids))
+        scores, hits = store.index.search(query, k, params=params)
+        scores, hits = scores[0], hits[0]
+
+    if rescore:
+        hits, scores = hits[hits != -1], scores[hits != -1]
+        exact_vectors = store.raw_vectors.get(hits)
+        if exact_vectors is not None:
+            if store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                scores = exact_vectors @ query[0]
+                order = np.argsort(-scores)
+            else:
+                scores = ((exact_vectors - query) ** 2).sum(axis=1)
+                order = np.argsort(scores)
+            hits, scores = hits[order], scores[order]
+    hits, scores = hits[:final_k], scores[:final_k]
+
+    hits, scores = hits[hits != -1], scores[hits != -1]
+    return [(int(vector_id), float(score)) for vector_id, score in zip(hits, scores)]
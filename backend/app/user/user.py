@@ -1,17 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr, constr
 from typing import Optional
 import base64
+import hashlib
+import os
 import logging
-from app.db.database import SessionLocal
+from sqlalchemy.orm import undefer
+from app.db.database import get_db
+from app.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page_response, parse_fields
 from app.models.models import User
 from app.auth.auth import resize_avatar, validate_password, pwd_context
+from app.auth.cpu_pool import cpu_pool
+from app.logs.logs import LOG_LEVEL
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# Fields selectable on GET /users; avatar bytes are served separately by GET /user/{email}/avatar
+USER_FIELDS = ("id", "first_name", "last_name", "email", "avatar_url")
+AVATAR_MAX_AGE = int(os.getenv("AVATAR_MAX_AGE", "3600"))
+
 # Pydantic models for validation
 class UserUpdate(BaseModel):
     first_name: Optional[constr(min_length=1, max_length=50)] = None
@@ -30,31 +41,41 @@ class UserResponse(BaseModel):
     class Config:
         orm_mode = True
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-async def get_all_users(db: Session = Depends(get_db)):
+async def get_all_users(cursor: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        fields: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    List users ordered by id, limit at a time. Pass the X-Next-Cursor response header back as
+    ?cursor= for the next page, and ?fields=id,email to project columns.
+    """
+    selected = parse_fields(fields, USER_FIELDS)
     try:
         logger.debug("Attempting to query users")
-        users = db.query(User).all()
-        # Convert avatar bytes to base64 string
-        for user in users:
-            if user.avatar:
-                user.avatar = base64.b64encode(user.avatar).decode('utf-8')
+        # Only the requested columns are read; avatar_url needs just whether an avatar is set
+        columns = [User.id] + [getattr(User, field) for field in selected if field not in ("id", "avatar_url")]
+        if "avatar_url" in selected:
+            if "email" not in selected:
+                columns.append(User.email)
+            columns.append(User.avatar.isnot(None).label("has_avatar"))
+        query = select(*columns).order_by(User.id).limit(limit + 1)
+        if cursor is not None:
+            query = query.where(User.id > cursor)
+        rows = (await db.execute(query)).all()
+        users = []
+        for row in rows:
+            user = {field: getattr(row, field) for field in selected if field != "avatar_url"}
+            if "avatar_url" in selected:
+                user["avatar_url"] = f"/user/{row.email}/avatar" if row.has_avatar else None
+            users.append(user)
         logger.debug(f"Retrieved {len(users)} users")
-        return users
+        return page_response(users, [row.id for row in rows], limit)
     except Exception as e:
         logger.error(f"Error retrieving users: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error retrieving users: {str(e)}")
 
-async def get_user_by_email(email: str, db: Session = Depends(get_db)):
+async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
     try:
         logger.debug(f"Attempting to query user with email: {email}")
-        user = db.query(User).filter(User.email == email).first()
+        user = (await db.scalars(select(User).options(undefer(User.avatar)).where(User.email == email))).first()
         if not user:
             logger.warning(f"User not found: {email}")
             raise HTTPException(status_code=404, detail="User not found")
@@ -62,14 +83,29 @@ async def get_user_by_email(email: str, db: Session = Depends(get_db)):
             user.avatar = base64.b64encode(user.avatar).decode('utf-8')
         logger.debug(f"Retrieved user: {email}")
         return user
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving user {email}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error retrieving user: {str(e)}")
 
-async def update_user(email: str, user_update: UserUpdate, db: Session = Depends(get_db)):
+async def get_user_avatar(email: str, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    """
+    Serve a user's avatar as PNG bytes with an ETag, answering 304 when the client's copy is current.
+    """
+    avatar = (await db.execute(select(User.avatar).where(User.email == email))).scalar_one_or_none()
+    if not avatar:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    etag = f'"{hashlib.sha256(avatar).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={AVATAR_MAX_AGE}"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=avatar, media_type="image/png", headers=headers)
+
+async def update_user(email: str, user_update: UserUpdate, db: AsyncSession = Depends(get_db)):
     try:
         logger.debug(f"Attempting to update user with email: {email}")
-        db_user = db.query(User).filter(User.email == email).first()
+        db_user = (await db.scalars(select(User).options(undefer(User.avatar)).where(User.email == email))).first()
         if not db_user:
             logger.warning(f"User not found: {email}")
             raise HTTPException(status_code=404, detail="User not found")
@@ -82,7 +118,7 @@ async def update_user(email: str, user_update: UserUpdate, db: Session = Depends
         if user_update.email:
             if not user_update.email.endswith("@gmail.com"):
                 raise HTTPException(status_code=400, detail="Only Gmail addresses are allowed")
-            existing_user = db.query(User).filter(User.email == user_update.email).first()
+            existing_user = (await db.scalars(select(User).where(User.email == user_update.email))).first()
             if existing_user and existing_user.email != email:
                 raise HTTPException(status_code=400, detail="Email already registered")
             db_user.email = user_update.email
@@ -92,17 +128,19 @@ async def update_user(email: str, user_update: UserUpdate, db: Session = Depends
                     status_code=400,
                     detail="Password must be at least 8 characters long and contain at least one uppercase letter, one lowercase letter, and one number"
                 )
-            db_user.hashed_password = pwd_context.hash(user_update.password)
+            db_user.hashed_password = await cpu_pool.run(pwd_context.hash, user_update.password)
         if user_update.avatar:
             try:
-                avatar_data = resize_avatar(user_update.avatar, max_size=(100, 100))
+                avatar_data = await cpu_pool.run(resize_avatar, user_update.avatar, max_size=(100, 100))
                 db_user.avatar = avatar_data
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.error(f"Error decoding avatar: {str(e)}")
                 raise HTTPException(status_code=400, detail="Invalid avatar data")
 
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user, ["id", "first_name", "last_name", "email", "avatar"])
         
         # Convert avatar to base64 for response
         if db_user.avatar:
@@ -110,6 +148,8 @@ async def update_user(email: str, user_update: UserUpdate, db: Session = Depends
         
         logger.debug(f"User updated: {email}")
         return db_user
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating user {email}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error updating user: {str(e)}")
\ No newline at end of file
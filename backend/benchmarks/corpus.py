@@ -0,0 +1,137 @@
+from typing import Iterator, List, Tuple
+import os
+import random
+
+# Deterministic synthetic corpora for the RAG benchmarks. Every document is generated from the seed,
+# so two runs with the same arguments ingest byte-identical files.
+
+WORDS_PER_SENTENCE = (8, 20)
+SENTENCES_PER_PARAGRAPH = (3, 7)
+PDF_LINES_PER_PAGE = 45
+PDF_CHARS_PER_LINE = 90
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = set()
+    while len(words) < size:
+        syllables = rng.randint(1, 4)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(syllables)))
+    return sorted(words)
+
+class CorpusGenerator:
+    """
+    Produces paragraphs of Zipf-distributed pseudo-words, with one "fact" sentence per paragraph
+    carrying an identifier (e.g. "Reference KX-1042 belongs to batch ...") that queries can target.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 5000):
+        self.rng = random.Random(seed)
+        self.words = _vocabulary(self.rng, vocabulary_size)
+        self.weights = [1 / (rank + 1) for rank in range(len(self.words))]
+        self.facts: List[Tuple[str, str]] = []
+
+    def sentence(self) -> str:
+        count = self.rng.randint(*WORDS_PER_SENTENCE)
+        words = self.rng.choices(self.words, weights=self.weights, k=count)
+        return " ".join(words).capitalize() + "."
+
+    def fact(self) -> str:
+        code = f"{self.rng.choice('ABCDEFGHKMNPRSTX')}{self.rng.choice('ABCDEFGHKMNPRSTX')}-{self.rng.randint(1000, 9999)}"
+        subject = " ".join(self.rng.choices(self.words, weights=self.weights, k=3))
+        sentence = f"Reference {code} belongs to batch {subject}."
+        self.facts.append((code, sentence))
+        return sentence
+
+    def paragraph(self) -> str:
+        sentences = [self.sentence() for _ in range(self.rng.randint(*SENTENCES_PER_PARAGRAPH))]
+        sentences.insert(self.rng.randrange(len(sentences) + 1), self.fact())
+        return " ".join(sentences)
+
+    def document(self, target_chars: int) -> str:
+        paragraphs, size = [], 0
+        while size < target_chars:
+            paragraph = self.paragraph()
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        return "\n\n".join(paragraphs)
+
+def make_query(fact: Tuple[str, str], rng: random.Random) -> str:
+    """
+    A question about a fact: usually natural language (dense + BM25), sometimes the bare identifier
+    (answered by BM25 alone). Uses its own rng so the query mix does not change the corpus.
+    """
+    code, sentence = fact
+    if rng.random() < 0.25:
+        return code
+    return f"Which batch does reference {code} belong to? {' '.join(sentence.split()[-3:])}"
+
+def _wrap(text: str, width: int) -> Iterator[str]:
+    for paragraph in text.split("\n\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                yield line
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        if line:
+            yield line
+        yield ""
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: str, text: str, lines_per_page: int = PDF_LINES_PER_PAGE):
+    """
+    Write text as a minimal multi-page PDF (Helvetica, one Tj per line) that pypdf can extract.
+    """
+    lines = list(_wrap(text, PDF_CHARS_PER_LINE))
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then a (page, content) pair per page
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    for number, page_lines in enumerate(pages):
+        page_id, content_id = 4 + number * 2, 5 + number * 2
+        page_ids.append(page_id)
+        stream = "BT /F1 10 Tf 12 TL 50 770 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in page_lines) + " ET"
+        data = stream.encode("latin-1", "replace")
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n"
+    xref_offset = len(out)
+    count = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % count
+    for object_id in range(1, count):
+        out += b"%010d 00000 n \n" % offsets[object_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref_offset)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def iter_corpus(directory: str, chars_per_document: int, pdf_ratio: float = 0.5,
+                seed: int = 0) -> Iterator[Tuple[str, List[Tuple[str, str]]]]:
+    """
+    Endlessly write .txt/.pdf documents into directory, yielding each path with the facts it contains.
+    """
+    os.makedirs(directory, exist_ok=True)
+    generator = CorpusGenerator(seed)
+    number = 0
+    while True:
+        first_fact = len(generator.facts)
+        text = generator.document(chars_per_document)
+        is_pdf = generator.rng.random() < pdf_ratio
+        path = os.path.join(directory, f"doc-{number:05d}.{'pdf' if is_pdf else 'txt'}")
+        if is_pdf:
+            write_pdf(path, text)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        yield path, generator.facts[first_fact:]
+        number += 1
@@ -0,0 +1,241 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import zlib
+import logging
+from app.metrics.metrics import StageTimings
+from benchmarks.corpus import iter_corpus, make_query
+
+# Benchmarks for the ingest (process_document) and query (query_rag / filter_context) paths.
+# Run from backend/:
+#
+#     python -m benchmarks.rag_bench --index-sizes 1000,5000,20000 --output bench.json
+#
+# Everything runs offline: documents are synthetic and, by default, embeddings come from a
+# deterministic hashing stub instead of the sentence-transformer model.
+
+TOKEN_RE = re.compile(r"\w+")
+
+class HashingEmbeddings:
+    """
+    Deterministic offline stand-in for the embedding model: signed feature hashing of word unigrams
+    into a fixed-size, L2-normalised vector. Texts sharing words get similar vectors, so retrieval
+    quality numbers stay meaningful.
+    """
+
+    model_name = "hashing-stub"
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for token in TOKEN_RE.findall(text.lower()):
+            digest = zlib.crc32(token.encode())
+            vector[digest % self.dimension] += 1.0 if digest & 0x80000000 else -1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def latency_summary(seconds: List[float], wall_seconds: float) -> dict:
+    values = sorted(value * 1000 for value in seconds)
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) if values else 0.0,
+        "p50_ms": percentile(values, 0.50),
+        "p95_ms": percentile(values, 0.95),
+        "p99_ms": percentile(values, 0.99),
+        "max_ms": values[-1] if values else 0.0,
+        "qps": len(values) / wall_seconds if wall_seconds else 0.0,
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def ingest_report(seconds: Dict[str, float], documents: int, chunks: int, chars: int, wall_seconds: float) -> dict:
+    """
+    Throughput per ingest stage, from the stage times process_document returned, summed over documents.
+    """
+    stages = {}
+    for stage in ("extract", "clean", "split", "embed", "index", "publish"):
+        spent = seconds.get(stage, 0.0)
+        stages[stage] = {
+            "seconds": spent,
+            "share": spent / wall_seconds if wall_seconds else 0.0,
+            "chunks_per_second": chunks / spent if spent else None,
+        }
+    return {
+        "documents": documents,
+        "chunks": chunks,
+        "bytes": chars,
+        "seconds": wall_seconds,
+        "documents_per_second": documents / wall_seconds if wall_seconds else 0.0,
+        "chunks_per_second": chunks / wall_seconds if wall_seconds else 0.0,
+        "mb_per_second": chars / wall_seconds / 1e6 if wall_seconds else 0.0,
+        "stages": stages,
+    }
+
+def run_queries(rag, queries: List[tuple], concurrency: int, warm_cache: bool) -> dict:
+    """
+    Time query_rag end to end and its filter stage on its own, from the stage times query_rag
+    records. Caches are cleared before every query unless warm_cache is set, so the numbers reflect
+    a cold retrieval path.
+    """
+    def one(item) -> StageTimings:
+        query, file_id, _ = item
+        if not warm_cache:
+            rag.retrieval_cache.clear()
+            rag.query_embedding_cache.clear()
+        timings = StageTimings()
+        rag.query_rag(query, file_id, timings=timings)
+        return timings
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            query_timings = list(pool.map(one, queries))
+    else:
+        query_timings = [one(item) for item in queries]
+    wall = time.perf_counter() - started
+    seconds = [timings.seconds["total"] for timings in query_timings]
+    filter_seconds = [timings.seconds["filter"] for timings in query_timings if "filter" in timings.seconds]
+
+    # Retrieval quality: share of queries whose target fact made it into the context
+    hits = 0
+    for query, file_id, code in queries[:200]:
+        context, _ = rag.retrieve_context(query, file_id)
+        hits += code in context
+    return {
+        "query_rag": latency_summary(seconds, wall),
+        "filter_context": latency_summary(filter_seconds, sum(filter_seconds)),
+        "concurrency": concurrency,
+        "context_hit_rate": hits / min(len(queries), 200) if queries else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest throughput and query latency benchmarks for the RAG pipeline")
+    parser.add_argument("--index-sizes", default="1000,5000", help="comma-separated chunk counts at which queries are measured")
+    parser.add_argument("--chars", type=int, default=20000, help="characters per synthetic document")
+    parser.add_argument("--pdf-ratio", type=float, default=0.5, help="share of documents written as PDF")
+    parser.add_argument("--max-documents", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500, help="queries per index size")
+    parser.add_argument("--concurrency", type=int, default=1, help="threads issuing queries")
+    parser.add_argument("--warm-cache", action="store_true", help="keep retrieval/query caches between queries")
+    parser.add_argument("--embeddings", choices=("stub", "model"), default="stub",
+                        help="stub: deterministic hashing embeddings; model: the configured sentence-transformer (must be available locally)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="directory for the corpus and index (default: a temp dir, removed afterwards)")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout only)")
+    args = parser.parse_args()
+    index_sizes = sorted(int(size) for size in args.index_sizes.split(","))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    # The app reads its configuration at import time, so point it at the scratch directory first
+    os.environ.setdefault("RAG_INDEX_DIR", os.path.join(workdir, "index"))
+    os.environ.setdefault("RAG_EMBED_CACHE", "false")
+    from app.rag import rag
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.embeddings == "stub":
+        stub = HashingEmbeddings()
+        rag.embeddings = stub
+        rag.document_embeddings = stub
+    ingest_seconds_by_stage: Dict[str, float] = defaultdict(float)
+
+    rng = random.Random(args.seed)
+    corpus = iter_corpus(os.path.join(workdir, "corpus"), args.chars, args.pdf_ratio, args.seed)
+    facts_by_file: Dict[int, list] = {}
+    documents = chunks = chars = 0
+    ingest_seconds = 0.0
+    results = []
+    try:
+        for size in index_sizes:
+            started = time.perf_counter()
+            while chunks < size and documents < args.max_documents:
+                path, facts = next(corpus)
+                file_id = documents + 1
+                timings = rag.process_document(path, os.path.basename(path), None, file_id)
+                for stage, seconds in timings.seconds.items():
+                    ingest_seconds_by_stage[stage] += seconds
+                facts_by_file[file_id] = facts
+                documents += 1
+                chars += os.path.getsize(path)
+                chunks = sum(len(vector_ids) for vector_ids in rag.file_vector_ids.values())
+            # Let background promotion/compaction finish so it does not overlap the query phase
+            rag._maintenance_executor.submit(lambda: None).result()
+            ingest_seconds += time.perf_counter() - started
+
+            file_ids = [file_id for file_id, facts in facts_by_file.items() if facts]
+            queries = []
+            for _ in range(args.queries):
+                file_id = rng.choice(file_ids)
+                fact = rng.choice(facts_by_file[file_id])
+                queries.append((make_query(fact, rng), file_id, fact[0]))
+            report = run_queries(rag, queries, args.concurrency, args.warm_cache)
+            report.update({
+                "index_size": chunks,
+                "documents": documents,
+                "index": rag.get_index_stats(),
+                "peak_rss_mb": peak_rss_mb(),
+            })
+            results.append(report)
+            print(f"{chunks} chunks: p50 {report['query_rag']['p50_ms']:.2f}ms p99 {report['query_rag']['p99_ms']:.2f}ms "
+                  f"{report['query_rag']['qps']:.1f} qps, hit rate {report['context_hit_rate']:.2f}")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "embeddings": rag.embeddings.model_name,
+            "args": vars(args),
+            "env": {name: value for name, value in os.environ.items() if name.startswith("RAG_")},
+        },
+        "ingest": ingest_report(ingest_seconds_by_stage, documents, chunks, chars, ingest_seconds),
+        "query": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
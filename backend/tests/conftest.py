@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# app.rag.rag_cluster creates its spool under RAG_INDEX_DIR on import; keep it out of the source tree
+os.environ.setdefault("RAG_INDEX_DIR", tempfile.mkdtemp(prefix="rag-tests-"))
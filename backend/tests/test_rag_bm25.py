@@ -0,0 +1,90 @@
+import random
+import numpy as np
+from app.rag.rag_bm25 import BM25Index, _intersect, _merge, tokenize
+
+WORDS = ["alpha", "beta", "gamma", "delta", "err-1042", "v2.3.1", "kappa", "lambda", "sigma", "omega"]
+
+def make_texts(count, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) for _ in range(count)]
+
+def postings_of(postings):
+    """
+    term -> (ids, tfs) of CSR postings.
+    """
+    return {
+        postings.term(i).decode("utf-8"): (postings.ids[postings.offsets[i]:postings.offsets[i + 1]].tolist(),
+                                           postings.tfs[postings.offsets[i]:postings.offsets[i + 1]].tolist())
+        for i in range(len(postings.term_ends))
+    }
+
+def expected_postings(texts, live=None):
+    expected = {}
+    for vector_id, text in enumerate(texts):
+        if live is not None and not live[vector_id]:
+            continue
+        tokens = tokenize(text)
+        for token in sorted(set(tokens)):
+            ids, tfs = expected.setdefault(token, ([], []))
+            ids.append(vector_id)
+            tfs.append(float(tokens.count(token)))
+    return expected
+
+def index_with_base(tmp_path, base_texts, tail_texts):
+    """
+    An index whose first texts were folded into memory-mapped base postings by a snapshot, and whose
+    remaining texts are in the in-memory tail.
+    """
+    bm25 = BM25Index()
+    bm25.add_many(range(len(base_texts)), base_texts)
+    bm25.write(str(tmp_path), len(base_texts))
+    bm25.rebase(str(tmp_path))
+    bm25.add_many(range(len(base_texts), len(base_texts) + len(tail_texts)), tail_texts)
+    return bm25
+
+def test_merge_folds_tail_into_base(tmp_path):
+    texts = make_texts(60, seed=1) + ["zeta only-in-tail"]
+    bm25 = index_with_base(tmp_path, texts[:40], texts[40:])
+    merged = _merge(bm25.base, bm25.postings)
+    terms = [merged.term(i) for i in range(len(merged.term_ends))]
+    assert terms == sorted(terms)
+    assert postings_of(merged) == expected_postings(texts)
+    assert bm25.term_count == len(terms)
+
+def test_merge_drops_removed_ids_and_empty_terms(tmp_path):
+    texts = make_texts(60, seed=2) + ["zeta"]
+    bm25 = index_with_base(tmp_path, texts[:40], texts[40:])
+    removed = [0, 3, 41, 59, 60]
+    bm25.remove_many(removed)
+    merged = _merge(bm25.base, bm25.postings, bm25.live)
+    live = np.ones(len(texts), dtype=bool)
+    live[removed] = False
+    assert postings_of(merged) == expected_postings(texts, live)
+    assert "zeta" not in postings_of(merged)
+
+def test_search_matches_single_index_after_compaction(tmp_path):
+    texts = make_texts(80, seed=3)
+    bm25 = index_with_base(tmp_path, texts[:50], texts[50:])
+    bm25.remove_many([1, 2, 55])
+    reference = BM25Index()
+    reference.add_many(range(len(texts)), texts)
+    reference.remove_many([1, 2, 55])
+    allowed = np.arange(20, 70, dtype=np.int64)
+    for query in ["alpha beta", "err-1042", "v2.3.1 sigma"]:
+        tokens = tokenize(query)
+        assert bm25.search(tokens, 10) == reference.search(tokens, 10)
+        assert bm25.search(tokens, 10, allowed) == reference.search(tokens, 10, allowed)
+    bm25.compact()
+    reference.compact()
+    assert bm25.postings == {}
+    for query in ["alpha beta", "gamma omega"]:
+        assert bm25.search(tokenize(query), 10) == reference.search(tokenize(query), 10)
+
+def test_intersect_returns_positions_of_common_ids():
+    rng = np.random.default_rng(4)
+    sorted_ids = np.unique(rng.integers(0, 1000, 300))
+    for allowed_size in (5, 300, 900):
+        allowed = np.unique(rng.integers(0, 1000, allowed_size))
+        positions = _intersect(sorted_ids, allowed)
+        assert positions.tolist() == np.flatnonzero(np.isin(sorted_ids, allowed)).tolist()
+    assert _intersect(sorted_ids, np.empty(0, dtype=np.int64)).tolist() == []
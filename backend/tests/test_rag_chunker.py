@@ -0,0 +1,78 @@
+import re
+from app.rag.rag_chunker import TokenChunker
+
+WORDS = "alpha beta gamma delta epsilon zeta theta iota kappa lambda omicron sigma upsilon omega".split()
+
+class FakeEncoding(dict):
+    def __init__(self, ids, offsets, words):
+        super().__init__(input_ids=ids, offset_mapping=offsets)
+        self._words = words
+
+    def word_ids(self):
+        return self._words
+
+class FakeTokenizer:
+    """
+    Stand-in for a fast tokenizer: words and punctuation marks are split into word pieces of up to
+    four characters, with offsets and word ids like a Hugging Face BatchEncoding.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 2
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, verbose=True):
+        ids, offsets, words = [], [], []
+        for word, match in enumerate(re.finditer(r"\w+|[^\w\s]", text)):
+            for start in range(match.start(), match.end(), 4):
+                end = min(start + 4, match.end())
+                piece = text[start:end] if start == match.start() else "##" + text[start:end]
+                ids.append(self.vocab.setdefault(piece, len(self.vocab)))
+                offsets.append((start, end))
+                words.append(word)
+        return FakeEncoding(ids, offsets, words)
+
+def make_text(sentence_words, sentences=12):
+    return " ".join(
+        " ".join(WORDS[(i + j) % len(WORDS)] for j in range(sentence_words)).capitalize() + "."
+        for i in range(sentences)
+    )
+
+def split(text, max_tokens=32, overlap_tokens=8):
+    tokenizer = FakeTokenizer()
+    chunker = TokenChunker(tokenizer, max_tokens, overlap_tokens=overlap_tokens, sentence_packing=True)
+    return tokenizer, chunker, chunker.split(text)
+
+def test_chunks_fit_and_match_fresh_tokenization():
+    text = make_text(5)
+    tokenizer, chunker, chunks = split(text)
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert len(chunk.token_ids) <= chunker.budget
+        assert text[chunk.start:chunk.start + len(chunk.text)] == chunk.text
+        assert tokenizer(chunk.text, add_special_tokens=False)["input_ids"] == chunk.token_ids
+    assert chunks[-1].text.endswith(text[-10:])
+
+def test_overlap_repeats_whole_sentences():
+    text = make_text(2)
+    _, chunker, chunks = split(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        previous_end = previous.start + len(previous.text)
+        assert previous.start < chunk.start < previous_end
+        # The repeated part starts a sentence
+        assert text[chunk.start - 2:chunk.start] == ". "
+        assert len(FakeTokenizer()(text[chunk.start:previous_end])["input_ids"]) <= chunker.overlap_tokens
+
+def test_overlap_falls_back_to_words_when_sentences_are_longer():
+    # Every sentence is longer than the overlap, so no sentence start lies within it
+    text = make_text(12)
+    tokenizer, chunker, chunks = split(text)
+    assert len(chunks) > 2
+    for previous, chunk in zip(chunks, chunks[1:]):
+        previous_end = previous.start + len(previous.text)
+        assert previous.start < chunk.start < previous_end
+        assert text[chunk.start - 1] == " "
+        assert len(tokenizer(text[chunk.start:previous_end])["input_ids"]) <= chunker.overlap_tokens
+        assert tokenizer(chunk.text, add_special_tokens=False)["input_ids"] == chunk.token_ids
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+from app.rag.rag_chunks import ColumnFile
+
+def saved_column(tmp_path, name, values, dtype=np.int64, width=1):
+    column = ColumnFile(dtype, width)
+    column.append(0, values)
+    path = str(tmp_path / name)
+    column.write(path)
+    column.rebase(path)
+    return column, path
+
+def test_write_links_previous_file_and_appends(tmp_path):
+    column, first_path = saved_column(tmp_path, "v1", np.arange(5))
+    # A reader still serving the first snapshot maps only its own rows
+    reader = ColumnFile(np.int64, path=first_path, rows=5)
+    column.append(5, np.arange(5, 8))
+    assert column.read(3, 7).tolist() == [3, 4, 5, 6]
+
+    second_path = str(tmp_path / "v2")
+    column.write(second_path)
+    assert os.stat(second_path).st_ino == os.stat(first_path).st_ino
+    assert np.fromfile(second_path, dtype=np.int64).tolist() == list(range(8))
+    assert reader.read(0, reader.total_rows).tolist() == list(range(5))
+
+    column.rebase(second_path)
+    assert column.rows == 8 and column.total_rows == 8
+    assert column.get(np.asarray([7, 0])).tolist() == [7, 0]
+    assert column.get(np.asarray([8])) is None
+
+def test_write_drops_rows_past_the_previous_snapshot(tmp_path):
+    column, first_path = saved_column(tmp_path, "v1", np.arange(4, dtype=np.int32), dtype=np.int32)
+    # Rows a writer appended before crashing, without publishing a snapshot
+    with open(first_path, "ab") as f:
+        f.write(np.arange(100, 103, dtype=np.int32).tobytes())
+    column.append(4, np.asarray([4], dtype=np.int32))
+    second_path = str(tmp_path / "v2")
+    column.write(second_path)
+    assert np.fromfile(second_path, dtype=np.int32).tolist() == [0, 1, 2, 3, 4]
+
+def test_replace_writes_a_new_file(tmp_path):
+    column, first_path = saved_column(tmp_path, "v1", np.arange(6, dtype=np.float32).reshape(3, 2), dtype=np.float32, width=2)
+    column.replace(np.asarray([[9, 9]], dtype=np.float32))
+    second_path = str(tmp_path / "v2")
+    column.write(second_path)
+    assert os.stat(second_path).st_ino != os.stat(first_path).st_ino
+    assert np.fromfile(first_path, dtype=np.float32).tolist() == list(range(6))
+    column.rebase(second_path)
+    assert column.read(0, column.total_rows).tolist() == [[9, 9]]
@@ -0,0 +1,37 @@
+import os
+from app.rag.rag_cluster import JobSpool
+
+def make_job(number, status="queued"):
+    return {"job_id": f"{number:032x}", "created_at": f"2026-01-01T00:00:{number:02d}+00:00", "status": status}
+
+def test_claim_takes_pending_operations_in_order(tmp_path):
+    spool = JobSpool(str(tmp_path))
+    for number, operation in [(3, "remove"), (1, "ingest"), (2, "reset")]:
+        spool.submit(operation, make_job(number), file_path=f"uploads/{number}.txt")
+    claimed = spool.claim()
+    assert [entry["operation"] for _, entry in claimed] == ["ingest", "reset", "remove"]
+    assert claimed[0][1]["file_path"] == "uploads/1.txt"
+    assert all(os.path.dirname(path) == spool.claimed_dir for path, _ in claimed)
+    assert os.listdir(spool.pending_dir) == []
+    assert spool.claim() == []
+
+def test_recover_requeues_unfinished_operations(tmp_path):
+    spool = JobSpool(str(tmp_path))
+    for number in range(3):
+        spool.submit("ingest", make_job(number))
+    claimed = spool.claim()
+    spool.done(claimed[1][0])
+    # A new writer requeues what the previous one claimed but never finished
+    spool.recover()
+    assert os.listdir(spool.claimed_dir) == []
+    requeued = spool.claim()
+    assert [entry["job"]["job_id"] for _, entry in requeued] == [make_job(0)["job_id"], make_job(2)["job_id"]]
+
+def test_statuses_and_prune(tmp_path):
+    spool = JobSpool(str(tmp_path))
+    for number, status in enumerate(["done", "failed", "cancelled", "running", "done"]):
+        spool.write_status(make_job(number, status))
+    assert spool.read_status(make_job(3)["job_id"])["status"] == "running"
+    assert spool.read_status("../status") is None
+    spool.prune(keep=2)
+    assert [job["status"] for job in spool.list_statuses()] == ["cancelled", "running", "done"]
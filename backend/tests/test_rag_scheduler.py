@@ -0,0 +1,105 @@
+import threading
+import time
+import pytest
+from app.rag.rag_scheduler import QueryRejected, QueryScheduler
+
+TIMEOUT = 5
+
+def blocking(release, started=None):
+    def fn(cancelled):
+        if started is not None:
+            started.set()
+        assert release.wait(TIMEOUT)
+        return "released"
+    return fn
+
+def wait_idle(scheduler):
+    """
+    Wait until workers have finished their bookkeeping; futures resolve just before it.
+    """
+    deadline = time.monotonic() + TIMEOUT
+    while scheduler.get_stats()["running"] or scheduler.get_stats()["queued"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def recording(order, name):
+    def fn(cancelled):
+        order.append(name)
+        return name
+    return fn
+
+def test_connections_are_served_round_robin():
+    scheduler = QueryScheduler(max_workers=1, max_inflight=3)
+    release, started = threading.Event(), threading.Event()
+    gate = scheduler.submit("a", blocking(release, started))
+    assert started.wait(TIMEOUT)
+    order = []
+    tickets = [scheduler.submit(connection, recording(order, name))
+               for connection, name in [("a", "a1"), ("a", "a2"), ("b", "b1"), ("b", "b2"), ("c", "c1")]]
+    assert scheduler.get_stats()["queued"] == 5
+    release.set()
+    assert gate.future.result(TIMEOUT) == "released"
+    for ticket in tickets:
+        ticket.future.result(TIMEOUT)
+    wait_idle(scheduler)
+    assert order == ["a1", "b1", "c1", "a2", "b2"]
+    assert scheduler.get_stats()["completed"] == 6
+
+def test_inflight_cap_is_per_connection():
+    scheduler = QueryScheduler(max_workers=2, max_inflight=2)
+    release = threading.Event()
+    running = [scheduler.submit("a", blocking(release)) for _ in range(2)]
+    with pytest.raises(QueryRejected):
+        scheduler.submit("a", blocking(release))
+    other = scheduler.submit("b", lambda cancelled: "other")
+    assert scheduler.get_stats()["rejected"] == 1
+    release.set()
+    for ticket in running:
+        ticket.future.result(TIMEOUT)
+    assert other.future.result(TIMEOUT) == "other"
+    wait_idle(scheduler)
+    # Finished queries free their slots
+    assert scheduler.submit("a", lambda cancelled: "again").future.result(TIMEOUT) == "again"
+
+def test_cancel_drops_queued_and_signals_running_queries():
+    scheduler = QueryScheduler(max_workers=1, max_inflight=3)
+    started = threading.Event()
+
+    def until_cancelled(cancelled):
+        started.set()
+        assert cancelled.wait(TIMEOUT)
+        return "stopped"
+
+    running = scheduler.submit("a", until_cancelled)
+    assert started.wait(TIMEOUT)
+    ran = []
+    queued = scheduler.submit("a", recording(ran, "queued"))
+    scheduler.cancel(queued)
+    assert queued.future.cancelled()
+    assert scheduler.get_stats()["queued"] == 0
+
+    later = scheduler.submit("a", recording(ran, "later"))
+    scheduler.cancel_connection("a")
+    assert running.future.result(TIMEOUT) == "stopped"
+    assert later.future.cancelled()
+    assert ran == []
+    wait_idle(scheduler)
+    stats = scheduler.get_stats()
+    assert stats["cancelled"] == 3 and stats["running"] == 0
+    # Every slot of the connection was released
+    assert scheduler.submit("a", lambda cancelled: "fresh").future.result(TIMEOUT) == "fresh"
+
+def test_reserved_slots_count_against_the_cap():
+    scheduler = QueryScheduler(max_workers=1, max_inflight=2)
+    waiting = scheduler.reserve("a")
+    cancelled = scheduler.reserve("a")
+    with pytest.raises(QueryRejected):
+        scheduler.submit("a", lambda cancelled: "too many")
+    assert scheduler.get_stats()["reserved"] == 2
+    scheduler.cancel(cancelled)
+    assert not scheduler.start(cancelled, lambda cancelled: "never")
+    assert scheduler.start(waiting, lambda cancelled: "embedded")
+    assert waiting.future.result(TIMEOUT) == "embedded"
+    wait_idle(scheduler)
+    stats = scheduler.get_stats()
+    assert stats["reserved"] == 0 and stats["completed"] == 1 and stats["cancelled"] == 1
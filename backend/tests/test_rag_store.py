@@ -0,0 +1,103 @@
+import json
+import os
+import pickle
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from app.rag.rag_bm25 import tokenize
+from app.rag.rag_store import (
+    FORMAT_VERSION, LEGACY_DOCSTORE_FILE, MANIFEST_FILE, SNAPSHOT_DIR, INDEX_FILE,
+    add_vectors, create_store, get_documents, load_snapshot, read_manifest, remove_vectors, save_snapshot,
+    search_file, search_file_sparse,
+)
+
+DIMENSION = 8
+
+def vectors_for(count, seed):
+    return np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+
+def add_file(store, file_id, texts, seed):
+    metadata = {"filename": f"doc{file_id}.pdf", "file_path": f"uploads/doc{file_id}.pdf", "file_id": file_id}
+    metadatas = [dict(metadata, page=page) for page in range(len(texts))]
+    vectors = vectors_for(len(texts), seed)
+    return np.asarray(add_vectors(store, texts, vectors, metadatas), dtype=np.int64), vectors
+
+def assert_same_documents(store, expected, vector_ids):
+    for vector_id, document in zip(vector_ids, get_documents(store, vector_ids)):
+        if expected.get(vector_id) is None:
+            assert document is None
+        else:
+            assert (document.page_content, document.metadata) == expected[vector_id]
+
+def test_snapshot_round_trip(tmp_path):
+    index_dir = str(tmp_path)
+    store = create_store(DIMENSION)
+    first, first_vectors = add_file(store, 1, ["alpha beta", "gamma err-1042", "delta"], seed=1)
+    second, _ = add_file(store, 2, ["kappa lambda", "sigma"], seed=2)
+    remove_vectors(store, second[:1].tolist())
+    files = {1: first, 2: second[1:]}
+    save_snapshot(store, files, index_dir=index_dir)
+    # The second snapshot links the first one's columns and appends to them; the chunk of an
+    # ingest that has not published yet is left out on load
+    third, _ = add_file(store, 3, ["omega v2.3.1"], seed=3)
+    unpublished, _ = add_file(store, 4, ["still ingesting"], seed=4)
+    files[3] = third
+    manifest = save_snapshot(store, files, index_dir=index_dir)
+    assert manifest["version"] == 2 and manifest["format"] == FORMAT_VERSION
+    assert manifest["unpublished"] == 1
+
+    expected = {vector_id: store.chunks.get(vector_id) for vector_id in range(store.next_id)}
+    expected[int(unpublished[0])] = None
+    for mmap in (False, True):
+        loaded, loaded_files = load_snapshot(index_dir, mmap=mmap)
+        assert loaded.snapshot_version == 2
+        assert loaded.next_id == store.next_id
+        assert {file_id: ids.tolist() for file_id, ids in loaded_files.items()} == {file_id: ids.tolist() for file_id, ids in files.items()}
+        assert_same_documents(loaded, expected, list(range(loaded.next_id)))
+        assert loaded.live_count == 5
+        hits = search_file(loaded, first_vectors[2].tolist(), loaded_files[1], k=1)
+        assert hits[0][0] == first[2]
+        assert search_file_sparse(loaded, tokenize("err-1042"), loaded_files[1], k=3)[0][0] == first[1]
+        assert search_file_sparse(loaded, tokenize("kappa"), loaded_files[2], k=3) == []
+
+def write_legacy_snapshot(index_dir, texts, removed):
+    """
+    A format 1 snapshot: a bare flat index whose positions are the ids, and the pickled langchain
+    docstore with its id map.
+    """
+    snapshot_dir = os.path.join(index_dir, SNAPSHOT_DIR, "v00000001")
+    os.makedirs(snapshot_dir)
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors_for(len(texts), seed=5))
+    faiss.write_index(index, os.path.join(snapshot_dir, INDEX_FILE))
+    documents = {
+        f"doc-{vector_id}": Document(page_content=text, metadata={"filename": "old.txt", "file_path": "uploads/old.txt", "file_id": 7})
+        for vector_id, text in enumerate(texts) if vector_id not in removed
+    }
+    index_to_docstore_id = {vector_id: f"doc-{vector_id}" for vector_id in range(len(texts))}
+    with open(os.path.join(snapshot_dir, LEGACY_DOCSTORE_FILE), "wb") as f:
+        pickle.dump((InMemoryDocstore(documents), index_to_docstore_id), f)
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"format": 1, "version": 1, "snapshot": "v00000001"}, f)
+
+def test_legacy_snapshot_is_converted(tmp_path):
+    index_dir = str(tmp_path)
+    texts = ["first chunk alpha", "removed chunk", "third chunk err-1042"]
+    write_legacy_snapshot(index_dir, texts, removed={1})
+
+    store, files = load_snapshot(index_dir, mmap=False)
+    assert isinstance(store.index, faiss.IndexIDMap2)
+    assert store.next_id == 3
+    assert {file_id: ids.tolist() for file_id, ids in files.items()} == {7: [0, 2]}
+    expected = {0: (texts[0], {"filename": "old.txt", "file_path": "uploads/old.txt", "file_id": 7}), 1: None,
+                2: (texts[2], {"filename": "old.txt", "file_path": "uploads/old.txt", "file_id": 7})}
+    assert_same_documents(store, expected, [0, 1, 2])
+    assert search_file_sparse(store, tokenize("err-1042"), files[7], k=3)[0][0] == 2
+
+    # The next snapshot is written in the current format and loads the same chunks
+    save_snapshot(store, files, index_dir=index_dir)
+    assert read_manifest(index_dir)["format"] == FORMAT_VERSION
+    reloaded, reloaded_files = load_snapshot(index_dir, mmap=True)
+    assert {file_id: ids.tolist() for file_id, ids in reloaded_files.items()} == {7: [0, 2]}
+    assert_same_documents(reloaded, expected, [0, 1, 2])
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { addMessage } from '../features/chat/chatSlice';
+import { addMessage, appendToMessage, setMessageText } from '../features/chat/chatSlice';
 import {
   addToUploadHistory,
   setSelectedFiles,
@@ -148,7 +148,13 @@ const ChatInterface = () => {
       websocket.onmessage = (event) => {
         try {
           const message = JSON.parse(event.data);
-          if (message.text && message.sender) {
+          if (message.type === 'token') {
+            dispatch(appendToMessage({ id: message.id, delta: message.delta, sender: 'bot' }));
+          } else if (message.type === 'final') {
+            dispatch(setMessageText({ id: message.id, text: message.text, sender: message.sender }));
+          } else if (message.type === 'session') {
+            console.log('Chat session:', message.session_id);
+          } else if (message.text && message.sender) {
             console.log("messagee",message);
             
             dispatch(addMessage({ text: message.text, sender: message.sender }));
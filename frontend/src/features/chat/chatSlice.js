@@ -23,6 +23,25 @@ const chatSlice = createSlice({
 
       state.messages.push(action.payload);
     },
+    // Streamed answers: token frames grow the message with the same id, the final frame replaces its text
+    appendToMessage(state, action) {
+      const { id, delta, sender } = action.payload;
+      const message = state.messages.find((item) => item.id === id);
+      if (message) {
+        message.text += delta;
+      } else {
+        state.messages.push({ id, text: delta, sender });
+      }
+    },
+    setMessageText(state, action) {
+      const { id, text, sender } = action.payload;
+      const message = state.messages.find((item) => item.id === id);
+      if (message) {
+        message.text = text;
+      } else {
+        state.messages.push({ id, text, sender });
+      }
+    },
     setThread(state, action) {
       state.currentThread = action.payload;
     },
@@ -35,5 +54,5 @@ const chatSlice = createSlice({
   },
 });
 
-export const { addMessage, setThread, setThreads, setSuggestions } = chatSlice.actions;
+export const { addMessage, appendToMessage, setMessageText, setThread, setThreads, setSuggestions } = chatSlice.actions;
 export default chatSlice.reducer;
\ No newline at end of file